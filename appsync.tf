@@ -64,6 +64,26 @@ resource "aws_appsync_datasource" "state_table_datasource" {
   }
 }
 
+resource "aws_appsync_datasource" "snapshot_table_datasource" {
+  api_id           = aws_appsync_graphql_api.appsync.id
+  name             = "${var.prefix}_snapshot_table_datasource"
+  service_role_arn = aws_iam_role.appsync_role.arn
+  type             = "AMAZON_DYNAMODB"
+
+  dynamodb_config {
+    table_name = aws_dynamodb_table.snapshot_table.name
+  }
+}
+
+# Local Datasources
+
+# publishDelta, publishHandDelta and publishMatch only fan out to subscribers, nothing is stored
+resource "aws_appsync_datasource" "delta_datasource" {
+  api_id = aws_appsync_graphql_api.appsync.id
+  name   = "${var.prefix}_delta_datasource"
+  type   = "NONE"
+}
+
 # Lambda Datasources
 
 resource "aws_appsync_datasource" "join_game_datasource" {
@@ -106,6 +126,26 @@ resource "aws_appsync_datasource" "create_game_datasource" {
   }
 }
 
+resource "aws_appsync_datasource" "suggest_move_datasource" {
+  name             = "${var.prefix}_suggest_move_datasource"
+  api_id           = aws_appsync_graphql_api.appsync.id
+  service_role_arn = aws_iam_role.appsync_role.arn
+  type             = "AWS_LAMBDA"
+  lambda_config {
+    function_arn = aws_lambda_function.suggest_move_lambda.arn
+  }
+}
+
+resource "aws_appsync_datasource" "enqueue_datasource" {
+  name             = "${var.prefix}_enqueue_datasource"
+  api_id           = aws_appsync_graphql_api.appsync.id
+  service_role_arn = aws_iam_role.appsync_role.arn
+  type             = "AWS_LAMBDA"
+  lambda_config {
+    function_arn = aws_lambda_function.enqueue_lambda.arn
+  }
+}
+
 
 # =================
 # --- Resolvers ---
@@ -193,6 +233,67 @@ resource "aws_appsync_resolver" "update_state_resolver" {
   response_template = file("./resolvers/response.vtl")
 }
 
+resource "aws_appsync_resolver" "game_state_resolver" {
+  api_id      = aws_appsync_graphql_api.appsync.id
+  type        = "Query"
+  field       = "gameState"
+  data_source = aws_appsync_datasource.snapshot_table_datasource.name
+
+  request_template  = file("./resolvers/get_snapshot_state.vtl")
+  response_template = file("./resolvers/response.vtl")
+}
+
+resource "aws_appsync_resolver" "game_hand_resolver" {
+  api_id      = aws_appsync_graphql_api.appsync.id
+  type        = "Query"
+  field       = "gameHand"
+  data_source = aws_appsync_datasource.snapshot_table_datasource.name
+
+  request_template  = file("./resolvers/get_snapshot_hand.vtl")
+  response_template = file("./resolvers/response.vtl")
+}
+
+# the ticket is a map in its item, the game_id attribute is the partition key
+resource "aws_appsync_resolver" "ticket_resolver" {
+  api_id      = aws_appsync_graphql_api.appsync.id
+  type        = "Query"
+  field       = "ticket"
+  data_source = aws_appsync_datasource.snapshot_table_datasource.name
+
+  request_template  = file("./resolvers/get_ticket.vtl")
+  response_template = file("./resolvers/ticket_response.vtl")
+}
+
+resource "aws_appsync_resolver" "publish_delta_resolver" {
+  api_id      = aws_appsync_graphql_api.appsync.id
+  type        = "Mutation"
+  field       = "publishDelta"
+  data_source = aws_appsync_datasource.delta_datasource.name
+
+  request_template  = file("./resolvers/publish_delta.vtl")
+  response_template = file("./resolvers/response.vtl")
+}
+
+resource "aws_appsync_resolver" "publish_hand_delta_resolver" {
+  api_id      = aws_appsync_graphql_api.appsync.id
+  type        = "Mutation"
+  field       = "publishHandDelta"
+  data_source = aws_appsync_datasource.delta_datasource.name
+
+  request_template  = file("./resolvers/publish_hand_delta.vtl")
+  response_template = file("./resolvers/response.vtl")
+}
+
+resource "aws_appsync_resolver" "publish_match_resolver" {
+  api_id      = aws_appsync_graphql_api.appsync.id
+  type        = "Mutation"
+  field       = "publishMatch"
+  data_source = aws_appsync_datasource.delta_datasource.name
+
+  request_template  = file("./resolvers/publish_match.vtl")
+  response_template = file("./resolvers/response.vtl")
+}
+
 # Lambda Resolvers
 
 resource "aws_appsync_resolver" "join_game_resolver" {
@@ -234,3 +335,17 @@ resource "aws_appsync_resolver" "create_game_resolver" {
   # request_template  = file("./resolvers/lambda/request.vtl")
   # response_template = file("./resolvers/lambda/response.vtl")
 }
+
+resource "aws_appsync_resolver" "suggest_move_resolver" {
+  api_id      = aws_appsync_graphql_api.appsync.id
+  type        = "Query"
+  field       = "suggestMove"
+  data_source = aws_appsync_datasource.suggest_move_datasource.name
+}
+
+resource "aws_appsync_resolver" "enqueue_resolver" {
+  api_id      = aws_appsync_graphql_api.appsync.id
+  type        = "Mutation"
+  field       = "enqueue"
+  data_source = aws_appsync_datasource.enqueue_datasource.name
+}
@@ -52,4 +52,30 @@ resource "aws_dynamodb_table" "state_table" {
     name = "id"
     type = "S"
   }
-}
\ No newline at end of file
+}
+# single table layout, every item of a game lives under its game_id partition
+resource "aws_dynamodb_table" "snapshot_table" {
+  name           = "${var.prefix}_snapshot_table"
+  billing_mode   = "PROVISIONED"
+  read_capacity  = "1"
+  write_capacity = "1"
+
+  hash_key  = "game_id"
+  range_key = "sk"
+
+  attribute {
+    name = "game_id"
+    type = "S"
+  }
+
+  attribute {
+    name = "sk"
+    type = "S"
+  }
+
+  # idempotency records, see lambda/daifugo/idempotency.py
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+}
@@ -66,6 +66,7 @@ data "aws_iam_policy_document" "dyanmodb_rw_policy_document" {
       aws_dynamodb_table.game_table.arn,
       aws_dynamodb_table.state_table.arn,
       aws_dynamodb_table.hand_table.arn,
+      aws_dynamodb_table.snapshot_table.arn,
     ]
   }
 }
@@ -76,6 +77,25 @@ resource "aws_iam_policy" "dynamodb_lambda_policy" {
   policy      = data.aws_iam_policy_document.dyanmodb_rw_policy_document.json
 }
 
+# Write and read swept game archives
+
+data "aws_iam_policy_document" "archive_rw_policy_document" {
+  statement {
+    actions   = ["s3:PutObject", "s3:GetObject"]
+    resources = ["${aws_s3_bucket.archive_bucket.arn}/*"]
+  }
+  statement {
+    actions   = ["s3:ListBucket"]
+    resources = [aws_s3_bucket.archive_bucket.arn]
+  }
+}
+
+resource "aws_iam_policy" "archive_lambda_policy" {
+  name        = "${var.prefix}_archive_lambda_rw_policy"
+  description = "This policy will be used by the sweep lambda to archive games before deleting them"
+  policy      = data.aws_iam_policy_document.archive_rw_policy_document.json
+}
+
 # Create log group policy
 
 data "aws_iam_policy_document" "lambda_log_publishing_policy_document" {
@@ -113,6 +133,11 @@ resource "aws_iam_role_policy_attachment" "lambda_rw_dynamodb" {
   policy_arn = aws_iam_policy.dynamodb_lambda_policy.arn
 }
 
+resource "aws_iam_role_policy_attachment" "lambda_rw_archive" {
+  role       = aws_iam_role.lambda_role.name
+  policy_arn = aws_iam_policy.archive_lambda_policy.arn
+}
+
 resource "aws_iam_role_policy_attachment" "lambda_log_publishing" {
   role       = aws_iam_role.lambda_role.name
   policy_arn = aws_iam_policy.lambda_log_publishing_policy.arn
@@ -2,19 +2,27 @@
 data "aws_caller_identity" "current" {}
 
 locals {
-  account_id              = data.aws_caller_identity.current.account_id
-  ecr_repository_name     = "${var.prefix}-ecr"
-  ecr_image_tag           = "latest"
-  join_game_lambda_name   = "${var.prefix}_join_game"
-  start_game_lambda_name  = "${var.prefix}_start_game"
-  play_cards_lambda_name  = "${var.prefix}_play_cards"
-  create_game_lambda_name = "${var.prefix}_create_game"
+  account_id               = data.aws_caller_identity.current.account_id
+  ecr_repository_name      = "${var.prefix}-ecr"
+  ecr_image_tag            = "latest"
+  join_game_lambda_name    = "${var.prefix}_join_game"
+  start_game_lambda_name   = "${var.prefix}_start_game"
+  play_cards_lambda_name   = "${var.prefix}_play_cards"
+  create_game_lambda_name  = "${var.prefix}_create_game"
+  suggest_move_lambda_name = "${var.prefix}_suggest_move"
+  enqueue_lambda_name      = "${var.prefix}_enqueue"
+  sweep_lambda_name        = "${var.prefix}_sweep"
 }
 
 variable "build_platform" {
   type = string
 }
 
+# keys the permutation of game codes, without it codes follow from the counter
+resource "random_id" "id_scramble_key" {
+  byte_length = 8
+}
+
 data "aws_ecr_repository" "repo" {
   name = local.ecr_repository_name
 }
@@ -75,6 +83,30 @@ resource "aws_cloudwatch_log_group" "create_game_lambda_log_group" {
   }
 }
 
+resource "aws_cloudwatch_log_group" "suggest_move_lambda_log_group" {
+  name              = "/aws/lambda/${local.suggest_move_lambda_name}"
+  retention_in_days = 7
+  lifecycle {
+    prevent_destroy = false
+  }
+}
+
+resource "aws_cloudwatch_log_group" "enqueue_lambda_log_group" {
+  name              = "/aws/lambda/${local.enqueue_lambda_name}"
+  retention_in_days = 7
+  lifecycle {
+    prevent_destroy = false
+  }
+}
+
+resource "aws_cloudwatch_log_group" "sweep_lambda_log_group" {
+  name              = "/aws/lambda/${local.sweep_lambda_name}"
+  retention_in_days = 7
+  lifecycle {
+    prevent_destroy = false
+  }
+}
+
 resource "aws_lambda_function" "join_game_lambda" {
   depends_on    = [null_resource.lambda_image_builder, aws_cloudwatch_log_group.join_game_lambda_log_group]
   function_name = local.join_game_lambda_name
@@ -159,4 +191,97 @@ resource "aws_lambda_function" "create_game_lambda" {
     command = ["handlers.create_game_handler"]
   }
 
+  environment {
+    variables = {
+      ID_SCRAMBLE_KEY = random_id.id_scramble_key.dec
+    }
+  }
+}
+
+resource "aws_lambda_function" "suggest_move_lambda" {
+  depends_on    = [null_resource.lambda_image_builder, aws_cloudwatch_log_group.suggest_move_lambda_log_group]
+  function_name = local.suggest_move_lambda_name
+  role          = aws_iam_role.lambda_role.arn
+  timeout       = 30
+  # the search is CPU bound, Lambda scales CPU with memory
+  memory_size  = 1769
+  image_uri    = "${data.aws_ecr_repository.repo.repository_url}@${data.aws_ecr_image.lambda_image.id}"
+  package_type = "Image"
+
+  architectures = ["${var.build_platform}"]
+
+  image_config {
+    command = ["handlers.suggest_move_handler"]
+  }
+
+  environment {
+    variables = {
+      API_KEY = aws_appsync_api_key.appsync_api_key.key
+      API_URL = aws_appsync_graphql_api.appsync.uris.GRAPHQL
+    }
+  }
+}
+
+resource "aws_lambda_function" "enqueue_lambda" {
+  depends_on    = [null_resource.lambda_image_builder, aws_cloudwatch_log_group.enqueue_lambda_log_group]
+  function_name = local.enqueue_lambda_name
+  role          = aws_iam_role.lambda_role.arn
+  timeout       = 300
+  image_uri     = "${data.aws_ecr_repository.repo.repository_url}@${data.aws_ecr_image.lambda_image.id}"
+  package_type  = "Image"
+
+  architectures = ["${var.build_platform}"]
+
+  image_config {
+    command = ["handlers.enqueue_handler"]
+  }
+
+  environment {
+    variables = {
+      API_KEY         = aws_appsync_api_key.appsync_api_key.key
+      API_URL         = aws_appsync_graphql_api.appsync.uris.GRAPHQL
+      ID_SCRAMBLE_KEY = random_id.id_scramble_key.dec
+    }
+  }
+}
+
+resource "aws_lambda_function" "sweep_lambda" {
+  depends_on    = [null_resource.lambda_image_builder, aws_cloudwatch_log_group.sweep_lambda_log_group]
+  function_name = local.sweep_lambda_name
+  role          = aws_iam_role.lambda_role.arn
+  # a run stops short of the timeout and carries on at the next schedule
+  timeout      = 900
+  image_uri    = "${data.aws_ecr_repository.repo.repository_url}@${data.aws_ecr_image.lambda_image.id}"
+  package_type = "Image"
+
+  architectures = ["${var.build_platform}"]
+
+  image_config {
+    command = ["handlers.sweep_handler"]
+  }
+
+  environment {
+    variables = {
+      # games are only deleted once their archive is stored in the bucket
+      ARCHIVE_BUCKET = aws_s3_bucket.archive_bucket.bucket
+    }
+  }
+}
+
+resource "aws_cloudwatch_event_rule" "sweep_schedule" {
+  name                = "${local.sweep_lambda_name}_schedule"
+  schedule_expression = "rate(1 hour)"
+}
+
+resource "aws_cloudwatch_event_target" "sweep_target" {
+  rule = aws_cloudwatch_event_rule.sweep_schedule.name
+  arn  = aws_lambda_function.sweep_lambda.arn
+}
+
+resource "aws_lambda_permission" "sweep_schedule_permission" {
+  statement_id  = "AllowSweepSchedule"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.sweep_lambda.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.sweep_schedule.arn
 }
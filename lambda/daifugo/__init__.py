@@ -1,11 +1,30 @@
-from daifugo.create_game_lambda import create_game_handler
-from daifugo.join_game_lambda import join_game_handler
-from daifugo.play_cards_lambda import play_cards_handler
-from daifugo.start_game_lambda import start_game_handler
+import importlib
+
+# handlers are resolved on first access so a Lambda only imports the module
+# behind the handler it serves
+_HANDLERS = {
+    "create_game_handler": "daifugo.create_game_lambda",
+    "enqueue_handler": "daifugo.enqueue_lambda",
+    "join_game_handler": "daifugo.join_game_lambda",
+    "play_cards_handler": "daifugo.play_cards_lambda",
+    "start_game_handler": "daifugo.start_game_lambda",
+    "suggest_move_handler": "daifugo.suggest_move_lambda",
+    "sweep_handler": "daifugo.sweep_lambda",
+}
 
 __all__ = [
     "join_game_handler",
     "play_cards_handler",
     "start_game_handler",
     "create_game_handler",
+    "suggest_move_handler",
+    "enqueue_handler",
+    "sweep_handler",
 ]
+
+
+def __getattr__(name):
+    if name in _HANDLERS:
+        return getattr(importlib.import_module(_HANDLERS[name]), name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,383 @@
+"""
+Batched variant of the engine in ``daifugo.daifugo`` that steps many games in
+lockstep on NumPy arrays.
+
+Each game is a row: hands are card-id bitmasks (see ``daifugo.cards``) in a
+``(n_games, n_players)`` uint64 matrix and the rest of the GameState is kept
+as one array per field. ``BatchEngine.step`` validates and applies one move
+per game with the same rules as ``play_cards``.
+"""
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .cards import (EIGHT, FIVE, JACK, N_RANKS, N_SUITS, NINE, SEVEN, SIX, TEN,
+                    THREE, TWO)
+from .model import Card, Pattern
+
+N_GROUPS = N_RANKS + 1  # jokers are their own rank group
+
+PATTERN_CODES = {
+    None: 0,
+    Pattern.NONE: 0,
+    Pattern.SUITED: 1,
+    Pattern.RUN: 2,
+    Pattern.SUITED_RUN: 3,
+}
+PATTERNS = (Pattern.NONE, Pattern.SUITED, Pattern.RUN, Pattern.SUITED_RUN)
+SUITED_BIT = 1
+RUN_BIT = 2
+
+_POPCOUNT16 = np.array([bin(i).count("1") for i in range(1 << 16)], dtype=np.int8)
+_GROUP_SHIFTS = np.arange(N_GROUPS, dtype=np.uint64) * np.uint64(N_SUITS)
+_NIBBLE = np.uint64((1 << N_SUITS) - 1)
+_ONE = np.uint64(1)
+_ZERO = np.uint64(0)
+_STARTING_CARD = np.uint64(1 << Card("3", "Diamond").to_int())
+
+
+def popcount(masks: np.ndarray) -> np.ndarray:
+    masks = masks.astype(np.uint64)
+    ret = np.zeros(masks.shape, dtype=np.int8)
+    for shift in (0, 16, 32, 48):
+        ret += _POPCOUNT16[(masks >> np.uint64(shift)) & np.uint64(0xFFFF)]
+
+    return ret
+
+
+def rank_groups(masks: np.ndarray) -> np.ndarray:
+    """``(..., N_GROUPS)`` array of the 4 bit suit group held for every rank"""
+    return ((masks[..., None] >> _GROUP_SHIFTS) & _NIBBLE).astype(np.uint8)
+
+
+class BatchEngine:
+    def __init__(
+        self,
+        hands: np.ndarray,
+        active: np.ndarray,
+        last_played: Optional[np.ndarray] = None,
+        top: Optional[np.ndarray] = None,
+        pot_size: Optional[np.ndarray] = None,
+        pattern: Optional[np.ndarray] = None,
+        revolution: Optional[np.ndarray] = None,
+        direction: Optional[np.ndarray] = None,
+        passed: Optional[np.ndarray] = None,
+        ranks: Optional[np.ndarray] = None,
+    ):
+        self.hands = np.asarray(hands, dtype=np.uint64).copy()
+        self.n_games, self.n_players = self.hands.shape
+        shape = (self.n_games,)
+
+        def init(value, default, dtype, shape=shape):
+            if value is None:
+                return np.full(shape, default, dtype=dtype)
+            return np.asarray(value, dtype=dtype).copy()
+
+        self.active = init(active, 0, np.int64)
+        self.last_played = init(last_played, -1, np.int64)
+        # top of pile as a card bitmask, rank/size/suits are derived from it
+        self.top = init(top, 0, np.uint64)
+        self.pot_size = init(pot_size, 0, np.int64)
+        self.pattern = init(pattern, 0, np.int8)
+        self.revolution = init(revolution, False, bool)
+        self.direction = init(direction, True, bool)
+        self.passed = init(passed, False, bool, self.hands.shape)
+        self.ranks = init(ranks, -1, np.int64, self.hands.shape)
+
+        self.n_moves = np.zeros(shape, dtype=np.int64)
+        self.n_revolutions = np.zeros(shape, dtype=np.int64)
+        self._rows = np.arange(self.n_games)
+
+    @classmethod
+    def deal(
+        cls, n_games: int, n_players: int, rng: Optional[np.random.Generator] = None
+    ) -> "BatchEngine":
+        rng = rng or np.random.default_rng()
+        n_cards = N_RANKS * N_SUITS
+
+        order = rng.permuted(np.tile(np.arange(n_cards), (n_games, 1)), axis=1)
+        bits = _ONE << order.astype(np.uint64)
+
+        hands = np.zeros((n_games, n_players), dtype=np.uint64)
+        for seat in range(n_players):
+            hands[:, seat] = np.bitwise_or.reduce(bits[:, seat::n_players], axis=1)
+
+        active = np.argmax((hands & _STARTING_CARD) != _ZERO, axis=1)
+        return cls(hands, active)
+
+    @property
+    def out(self) -> np.ndarray:
+        return self.ranks != -1
+
+    @property
+    def done(self) -> np.ndarray:
+        return (~self.out).sum(axis=1) <= 1
+
+    @property
+    def active_hands(self) -> np.ndarray:
+        return self.hands[self._rows, self.active]
+
+    @staticmethod
+    def describe(
+        masks: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Rank, size, suit mask and single-rank flag of each card bitmask"""
+        groups = rank_groups(masks)
+        held = groups != 0
+        rank = np.where(held.any(axis=-1), np.argmax(held, axis=-1), -1)
+        size = popcount(masks)
+        suits = np.take_along_axis(groups, np.maximum(rank, 0)[..., None], axis=-1)[
+            ..., 0
+        ]
+        suits = np.where(rank == N_RANKS, 0, suits)
+        single = held.sum(axis=-1) == 1
+
+        return rank, size, suits, single
+
+    def next_active(self, idx: np.ndarray) -> np.ndarray:
+        """Vectorized ``StateResolver.get_next_active_player_idx``"""
+        blocked = self.passed | self.out
+        ret = idx.copy()
+        found = np.zeros(self.n_games, dtype=bool)
+
+        for step in range(1, self.n_players + 1):
+            candidate = (idx + step) % self.n_players
+            ok = ~found & (
+                ~blocked[self._rows, candidate] | (candidate == idx % self.n_players)
+            )
+            ret = np.where(ok, candidate, ret)
+            found |= ok
+
+        return ret
+
+    def validate(
+        self, cards: np.ndarray, discards: np.ndarray
+    ) -> Tuple[np.ndarray, Tuple[np.ndarray, ...]]:
+        hand = self.active_hands
+        rank, size, suits, single = self.describe(cards)
+        top_rank, top_size, top_suits, _ = self.describe(self.top)
+        new_trick = top_size == 0
+
+        owned = ((cards | discards) & ~hand) == _ZERO
+        owned &= (cards & discards) == _ZERO
+
+        rank_ok = np.where(self.direction, rank > top_rank, rank < top_rank)
+        size_ok = size == top_size
+
+        suited = ~new_trick & (suits == top_suits)
+        run = ~new_trick & (np.abs(rank - top_rank) == 1)
+        infered = np.where(suited, SUITED_BIT, 0) | np.where(run, RUN_BIT, 0)
+        pattern_ok = (infered & self.pattern) == self.pattern
+
+        n_discards = popcount(discards)
+        discards_ok = (n_discards == 0) | (
+            ((rank == SEVEN) | (rank == TEN)) & (n_discards <= size)
+        )
+
+        valid = (
+            owned
+            & single
+            & (new_trick | (rank_ok & size_ok & pattern_ok & discards_ok))
+        )
+        return valid, (rank, size, infered)
+
+    def step(
+        self, cards: np.ndarray, discards: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Applies one move per game, an empty card mask is a pass. Games that are
+        finished or whose move is invalid are left untouched. Returns the mask
+        of games the move was applied to.
+        """
+        cards = np.asarray(cards, dtype=np.uint64)
+        if discards is None:
+            discards = np.zeros(self.n_games, dtype=np.uint64)
+        discards = np.asarray(discards, dtype=np.uint64)
+
+        is_pass = cards == _ZERO
+        valid, (rank, size, infered) = self.validate(cards, discards)
+        live = ~self.done
+        skip = live & is_pass
+        play = live & ~is_pass & valid
+
+        self._apply_skip(skip)
+        self._apply_play(play, cards, discards, rank, size, infered)
+
+        applied = skip | play
+        self.n_moves += applied
+        return applied
+
+    def _new_trick(self, mask: np.ndarray, revolution: np.ndarray):
+        self.top = np.where(mask, _ZERO, self.top)
+        self.pattern = np.where(mask, 0, self.pattern).astype(np.int8)
+        self.direction = np.where(mask, ~revolution, self.direction)
+        self.passed &= ~mask[:, None]
+
+    def _apply_skip(self, skip: np.ndarray):
+        if not skip.any():
+            return
+
+        rows = self._rows[skip]
+        self.passed[rows, self.active[rows]] = True
+
+        next_idx = self.next_active(self.active)
+        back_to_last = next_idx == self.last_played
+        all_passed = ~back_to_last & self.passed[self._rows, next_idx]
+        new_trick = skip & (back_to_last | all_passed)
+
+        self._new_trick(new_trick, self.revolution)
+        after_last = self.next_active(self.last_played)
+        next_idx = np.where(skip & all_passed, after_last, next_idx)
+
+        self.active = np.where(skip, next_idx, self.active)
+
+    def _apply_play(
+        self,
+        play: np.ndarray,
+        cards: np.ndarray,
+        discards: np.ndarray,
+        rank: np.ndarray,
+        size: np.ndarray,
+        infered: np.ndarray,
+    ):
+        if not play.any():
+            return
+
+        active = self.active
+        direction = self.direction
+
+        # resolve_discards
+        to_forward = np.where(play & (rank == SEVEN), discards, _ZERO)
+        to_pot = cards | np.where(rank == TEN, discards, _ZERO)
+
+        # resolve_next_player
+        stop = (
+            (rank == EIGHT)
+            | ((rank == NINE) & (size == 2))
+            | ((rank == SIX) & (size == 3))
+            | (rank == TWO)
+            | (~direction & (rank == THREE))
+        )
+        five = rank == FIVE
+
+        next_idx = self.next_active(active)
+        skipped = active.copy()
+        for n_steps in range(1, N_SUITS + 2):
+            stepped = self.next_active(skipped)
+            skipped = np.where(n_steps <= size + 1, stepped, skipped)
+
+        next_idx = np.where(five, skipped, next_idx)
+        next_idx = np.where(stop, active, next_idx)
+        new_trick = stop | (five & (skipped == active))
+
+        # resolve_direction
+        jack = (rank == JACK) & (size % 2 == 1)
+        four = ~jack & (size == 4)
+        new_direction = np.where(jack | four, ~direction, direction)
+        new_revolution = np.where(four, ~self.revolution, self.revolution)
+
+        # resolve_hands
+        rows = self._rows[play]
+        self.hands[rows, active[rows]] &= ~(to_pot | to_forward)[rows]
+        self.hands[rows, next_idx[rows]] |= to_forward[rows]
+
+        # resolve_rank
+        emptied = play & (self.hands[self._rows, active] == _ZERO)
+        if emptied.any():
+            rows = self._rows[emptied]
+            self.ranks[rows, active[rows]] = self.ranks[rows].max(axis=1) + 1
+
+        self.n_revolutions += play & (new_revolution != self.revolution)
+        self.last_played = np.where(play, active, self.last_played)
+        self.active = np.where(play, next_idx, active)
+        self.top = np.where(play, cards, self.top)
+        self.pot_size = self.pot_size + np.where(play, size, 0)
+        self.pattern = np.where(play, infered, self.pattern).astype(np.int8)
+        self.revolution = np.where(play, new_revolution, self.revolution)
+        self.direction = np.where(play, new_direction, self.direction)
+
+        self._new_trick(play & new_trick, self.revolution)
+
+    def candidate_ranks(self) -> np.ndarray:
+        """``(n_games, N_GROUPS)`` mask of ranks the active player can play"""
+        groups = rank_groups(self.active_hands)
+        counts = _POPCOUNT16[groups]
+        top_rank, top_size, top_suits, _ = self.describe(self.top)
+        new_trick = (top_size == 0)[:, None]
+
+        ranks = np.arange(N_GROUPS)[None, :]
+        rank_ok = np.where(
+            self.direction[:, None],
+            ranks > top_rank[:, None],
+            ranks < top_rank[:, None],
+        )
+        size_ok = counts >= top_size[:, None]
+
+        pattern = self.pattern[:, None]
+        run_ok = ((pattern & RUN_BIT) == 0) | (np.abs(ranks - top_rank[:, None]) == 1)
+        suited_ok = ((pattern & SUITED_BIT) == 0) | (
+            (groups & top_suits[:, None]) == top_suits[:, None]
+        )
+
+        return (counts > 0) & (new_trick | (rank_ok & size_ok & run_ok & suited_ok))
+
+    def sample_moves(
+        self, rng: Optional[np.random.Generator] = None, greedy: bool = False
+    ) -> np.ndarray:
+        """
+        One move per game for the active player without discards, random or
+        the weakest rank when ``greedy``. Games with nothing to play pass.
+        """
+        rng = rng or np.random.default_rng()
+        candidates = self.candidate_ranks()
+        has_move = candidates.any(axis=1) & ~self.out[self._rows, self.active]
+
+        if greedy:
+            strength = np.where(self.direction[:, None], 1, -1) * np.arange(N_GROUPS)
+            keys = np.where(candidates, strength, np.iinfo(np.int64).max)
+            rank = np.argmin(keys, axis=1)
+        else:
+            keys = np.where(candidates, rng.random(candidates.shape), -1.0)
+            rank = np.argmax(keys, axis=1)
+
+        groups = rank_groups(self.active_hands)[self._rows, rank]
+        counts = _POPCOUNT16[groups]
+        _, top_size, top_suits, _ = self.describe(self.top)
+        new_trick = top_size == 0
+
+        if greedy:
+            size = counts
+        else:
+            size = rng.integers(1, np.maximum(counts, 1) + 1)
+        size = np.where(new_trick, size, top_size)
+
+        # keep ``size`` random suits out of the held group
+        suit_bits = (groups[:, None] >> np.arange(N_SUITS)) & 1
+        keys = np.where(suit_bits == 1, rng.random(suit_bits.shape), 2.0)
+        order = np.argsort(keys, axis=1)
+        keep = np.arange(N_SUITS)[None, :] < size[:, None]
+        chosen = np.zeros(self.n_games, dtype=np.uint8)
+        for col in range(N_SUITS):
+            chosen |= np.where(keep[:, col], 1 << order[:, col], 0).astype(np.uint8)
+
+        suited = ~new_trick & ((self.pattern & SUITED_BIT) != 0)
+        chosen = np.where(suited, top_suits, chosen).astype(np.uint64)
+
+        moves = chosen << (rank.astype(np.uint64) * np.uint64(N_SUITS))
+        return np.where(has_move, moves, _ZERO)
+
+    def run(
+        self,
+        rng: Optional[np.random.Generator] = None,
+        greedy: bool = False,
+        max_steps: int = 2000,
+    ) -> np.ndarray:
+        """Plays every game to the end and returns the finishing rank of every seat"""
+        rng = rng or np.random.default_rng()
+        for _ in range(max_steps):
+            if self.done.all():
+                break
+            self.step(self.sample_moves(rng, greedy))
+
+        last = self.ranks.max(axis=1, keepdims=True) + 1
+        return np.where(self.out, self.ranks, last)
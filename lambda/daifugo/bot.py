@@ -0,0 +1,350 @@
+"""
+Move suggestions from single observer information set Monte Carlo tree search
+(ISMCTS) over the ``play_cards`` engine. The bot sees its own hand and the
+public state only. Every iteration deals the cards it cannot see to the other
+seats at random, consistent with their hand sizes, walks the shared tree with
+UCB1 over the moves that are legal in that deal, then plays the game out with
+random moves and backs up every seat's finishing rank.
+"""
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .cards import FULL_MASK, JOKER_IDS, ids_of, mask_of
+from .constants import (BOT_EXPLORATION, BOT_ITERATIONS, BOT_MAX_PLAYOUT_MOVES,
+                        BOT_TIME_LIMIT)
+from .daifugo import (PASS, MoveMasks, StateResolver, candidate_moves,
+                      legal_move_masks, play_cards)
+from .endgame import get_solver, is_endgame
+from .model import (CardSet, GameState, Hand, MoveEvent, Player, cards_mask,
+                    decode_cards)
+
+# jokers are not dealt yet, see start_game_handler
+DECK_MASK = FULL_MASK & ~mask_of(JOKER_IDS)
+
+
+class Node:
+    __slots__ = ("seat", "children", "visits", "reward", "available")
+
+    def __init__(self, seat: int):
+        # the seat that made the move leading here, rewards are from its view
+        self.seat = seat
+        self.children: Dict[MoveMasks, "Node"] = {}
+        self.visits = 0
+        self.reward = 0.0
+        # iterations in which this node's move was legal, ISMCTS uses it in
+        # place of the parent's visits
+        self.available = 0
+
+
+@dataclass
+class MoveSuggestion:
+    cards: int
+    discards: int
+    visits: int
+    # mean finishing score of the move, 1 is first out and 0 last
+    score: float
+    iterations: int
+    elapsed: float
+
+    @property
+    def is_pass(self) -> bool:
+        return not self.cards
+
+    def to_json(self) -> Dict:
+        return dict(
+            cards=[card.to_json() for card in CardSet(mask=self.cards).cards],
+            discards=[card.to_json() for card in decode_cards(ids_of(self.discards))],
+            visits=self.visits,
+            score=round(self.score, 4),
+            iterations=self.iterations,
+        )
+
+
+class ISMCTS:
+    """
+    One search from the view of the active seat of ``game_state``. Players and
+    hands of the playouts are allocated once and reset in place for every
+    deal, so an iteration only allocates what ``play_cards`` itself does.
+    """
+
+    def __init__(
+        self,
+        game_state: GameState,
+        players: Sequence[Player],
+        hand_mask: int,
+        hand_sizes: Sequence[int],
+        seen_mask: int = 0,
+        exploration: float = BOT_EXPLORATION,
+        max_playout_moves: int = BOT_MAX_PLAYOUT_MOVES,
+        seed: Optional[int] = None,
+        endgame: bool = False,
+    ):
+        self.game_state = game_state
+        self.seat = game_state.active_player_idx
+        self.hand_mask = hand_mask
+        self.hand_sizes = list(hand_sizes)
+        self.exploration = exploration
+        self.max_playout_moves = max_playout_moves
+        self.rng = random.Random(seed)
+
+        self.public_players = [(p.has_passed, p.rank) for p in players]
+        self.players = [
+            Player(p.id, p.name, p.game_id, p.hand_id, p.has_passed, p.rank)
+            for p in players
+        ]
+        self.hands = [Hand(p.hand_id) for p in players]
+        self.n_players = len(players)
+
+        # every card the bot has not seen is equally likely to be anywhere
+        unseen = DECK_MASK & ~hand_mask & ~game_state.top_of_pile.mask & ~seen_mask
+        self.unseen = list(ids_of(unseen))
+        self.opponents = [
+            seat
+            for seat in range(self.n_players)
+            if seat != self.seat and self.hand_sizes[seat]
+        ]
+        n_hidden = sum(self.hand_sizes[seat] for seat in self.opponents)
+        if n_hidden > len(self.unseen):
+            raise ValueError(
+                f"Opponents hold {n_hidden} cards but only {len(self.unseen)} "
+                "are unseen"
+            )
+
+        # every deal of a small enough position is solved exactly instead of
+        # played out at random, the solver's table is shared across deals
+        self.solver = (
+            get_solver() if endgame and is_endgame(players, hand_sizes) else None
+        )
+
+        self.root = Node(-1)
+        self.iterations = 0
+
+    def determinize(self):
+        """Resets the playout players and deals the unseen cards at random"""
+        for player, (has_passed, rank) in zip(self.players, self.public_players):
+            player.has_passed = has_passed
+            player.rank = rank
+
+        self.rng.shuffle(self.unseen)
+        start = 0
+        for seat in range(self.n_players):
+            if seat == self.seat:
+                self.hands[seat].mask = self.hand_mask
+            elif seat in self.opponents:
+                end = start + self.hand_sizes[seat]
+                self.hands[seat].mask = mask_of(self.unseen[start:end])
+                start = end
+            else:
+                self.hands[seat].mask = 0
+
+    def is_over(self) -> bool:
+        return sum(not player.is_out for player in self.players) <= 1
+
+    def apply(self, game_state: GameState, move: MoveMasks) -> GameState:
+        cards, discards = move
+        game_state, _, _ = play_cards(
+            game_state,
+            CardSet(mask=cards),
+            decode_cards(ids_of(discards)) if discards else [],
+            self.players,
+            self.hands,
+        )
+        return game_state
+
+    def playout(self, game_state: GameState) -> List[float]:
+        for _ in range(self.max_playout_moves):
+            if self.is_over():
+                break
+
+            seat = game_state.active_player_idx
+            moves = legal_move_masks(self.hands[seat].mask, game_state)
+            game_state = self.apply(
+                game_state, self.rng.choice(moves) if moves else PASS
+            )
+
+        return self.rewards()
+
+    def order_rewards(self, finish_order: Sequence[int]) -> List[float]:
+        worst = max(self.n_players - 1, 1)
+        rewards = [0.0] * self.n_players
+        for place, seat in enumerate(finish_order):
+            rewards[seat] = 1 - place / worst
+
+        return rewards
+
+    def rewards(self) -> List[float]:
+        """Finishing score per seat, seats still in are ranked by cards left"""
+        next_rank = max(player.rank for player in self.players) + 1
+        ranks = [player.rank for player in self.players]
+        for seat in sorted(
+            (seat for seat in range(self.n_players) if ranks[seat] == -1),
+            key=lambda seat: len(self.hands[seat]),
+        ):
+            ranks[seat] = next_rank
+            next_rank += 1
+
+        worst = max(self.n_players - 1, 1)
+        return [1 - rank / worst for rank in ranks]
+
+    def select(self, node: Node, moves: List[MoveMasks]) -> Tuple[MoveMasks, bool]:
+        """The move to follow from ``node``, True if it was just expanded"""
+        for move in moves:
+            child = node.children.get(move)
+            if child is not None:
+                child.available += 1
+
+        untried = [move for move in moves if move not in node.children]
+        if untried:
+            return self.rng.choice(untried), True
+
+        def ucb(move: MoveMasks) -> float:
+            child = node.children[move]
+            return child.reward / child.visits + self.exploration * math.sqrt(
+                math.log(child.available) / child.visits
+            )
+
+        return max(moves, key=ucb), False
+
+    def iterate(self):
+        self.determinize()
+        game_state = self.game_state
+        node = self.root
+        path = [node]
+
+        # selection and expansion, one new node per iteration
+        expanded = False
+        while not expanded and not self.is_over():
+            seat = game_state.active_player_idx
+            moves = candidate_moves(self.hands[seat].mask, game_state)
+            move, expanded = self.select(node, moves)
+            if expanded:
+                node.children[move] = Node(seat)
+
+            node = node.children[move]
+            path.append(node)
+            game_state = self.apply(game_state, move)
+
+        if self.solver is not None and not self.is_over():
+            result = self.solver.solve(game_state, self.players, self.hands)
+            rewards = self.order_rewards(result.finish_order)
+        else:
+            rewards = self.playout(game_state)
+
+        for node in path:
+            node.visits += 1
+            if node.seat >= 0:
+                node.reward += rewards[node.seat]
+
+        self.iterations += 1
+
+    def search(
+        self, iterations: int = BOT_ITERATIONS, time_limit: float = BOT_TIME_LIMIT
+    ) -> Dict[MoveMasks, Tuple[int, float]]:
+        """Runs until either budget is spent, returns (visits, reward) per move"""
+        deadline = time.perf_counter() + time_limit
+        for _ in range(iterations):
+            self.iterate()
+            if time.perf_counter() >= deadline:
+                break
+
+        return {
+            move: (child.visits, child.reward)
+            for move, child in self.root.children.items()
+        }
+
+
+def _search(args) -> Tuple[Dict[MoveMasks, Tuple[int, float]], int]:
+    search_args, iterations, time_limit = args
+    search = ISMCTS(*search_args)
+    return search.search(iterations, time_limit), search.iterations
+
+
+def seen_mask(events: Iterable[MoveEvent]) -> int:
+    """
+    Cards out of play after ``events``, every card played and every discard
+    that went to the pot. Discards forwarded with a 7 are still in a hand.
+    """
+    mask = 0
+    for event in events:
+        if not event.cards:
+            continue
+        cards = CardSet(event.cards)
+        mask |= StateResolver.resolve_discards(cards, cards_mask(event.discards)).to_pot
+
+    return mask
+
+
+def suggest_move(
+    game_state: GameState,
+    players: Sequence[Player],
+    hand_mask: int,
+    hand_sizes: Sequence[int],
+    seen_mask: int = 0,
+    iterations: int = BOT_ITERATIONS,
+    time_limit: float = BOT_TIME_LIMIT,
+    workers: int = 1,
+    seed: Optional[int] = None,
+    exploration: float = BOT_EXPLORATION,
+    endgame: bool = False,
+) -> MoveSuggestion:
+    """
+    The most visited move for the active seat of ``game_state``. ``hand_sizes``
+    are the public card counts of every seat, ``seen_mask`` cards known to be
+    out of play, e.g. from the move log. With ``workers`` > 1 independent
+    trees are searched in processes and their root statistics are summed.
+    ``endgame`` solves the deals of small positions exactly, see
+    ``daifugo.endgame``.
+    """
+    started = time.perf_counter()
+    moves = candidate_moves(hand_mask, game_state)
+    if len(moves) == 1:
+        return MoveSuggestion(*moves[0], 0, 0.0, 0, time.perf_counter() - started)
+
+    seed = random.randrange(2**32) if seed is None else seed
+    search_args = [
+        (
+            (
+                game_state,
+                list(players),
+                hand_mask,
+                list(hand_sizes),
+                seen_mask,
+                exploration,
+                BOT_MAX_PLAYOUT_MOVES,
+                seed + worker,
+                endgame,
+            ),
+            math.ceil(iterations / workers),
+            time_limit,
+        )
+        for worker in range(max(workers, 1))
+    ]
+
+    if workers <= 1:
+        results = [_search(search_args[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_search, search_args))
+
+    stats: Dict[MoveMasks, List] = {}
+    for root_stats, _ in results:
+        for move, (visits, reward) in root_stats.items():
+            total = stats.setdefault(move, [0, 0.0])
+            total[0] += visits
+            total[1] += reward
+
+    move, (visits, reward) = max(
+        stats.items(), key=lambda item: (item[1][0], item[1][1])
+    )
+    return MoveSuggestion(
+        move[0],
+        move[1],
+        visits,
+        reward / visits,
+        sum(n for _, n in results),
+        time.perf_counter() - started,
+    )
@@ -0,0 +1,135 @@
+"""
+Integer card encoding used by the engine hot path.
+
+Every card is a small int ``rank * 4 + suit`` where ``rank`` is the value from
+``RANKS`` (3 lowest, 2 highest) and ``suit`` is the index into ``SUITS``.
+Jokers sit above the 2s at 52 and 53. Only the ``Card``/JSON edge in
+``daifugo.model`` converts to and from these ints.
+"""
+import string
+from typing import Iterable, List, Optional, Tuple
+
+from .constants import RANKS, SUITS
+
+N_SUITS = len(SUITS)
+N_RANKS = len(RANKS)
+JOKER_RANK = N_RANKS
+JOKER_IDS = (N_RANKS * N_SUITS, N_RANKS * N_SUITS + 1)
+N_CARDS = N_RANKS * N_SUITS + len(JOKER_IDS)
+
+RANK_NAMES: Tuple[str, ...] = tuple(sorted(RANKS, key=RANKS.__getitem__))
+SUIT_INDEX = {suit: i for i, suit in enumerate(SUITS)}
+
+# precomputed lookup tables indexed by card id
+CARD_RANKS: Tuple[int, ...] = tuple(
+    JOKER_RANK if i in JOKER_IDS else i // N_SUITS for i in range(N_CARDS)
+)
+CARD_SUITS: Tuple[int, ...] = tuple(
+    -1 if i in JOKER_IDS else i % N_SUITS for i in range(N_CARDS)
+)
+CARD_SUIT_BITS: Tuple[int, ...] = tuple(
+    0 if suit == -1 else 1 << suit for suit in CARD_SUITS
+)
+
+# rank values of the cards with special rules
+THREE = RANKS["3"]
+FIVE = RANKS["5"]
+SIX = RANKS["6"]
+SEVEN = RANKS["7"]
+EIGHT = RANKS["8"]
+NINE = RANKS["9"]
+TEN = RANKS["10"]
+JACK = RANKS["Jack"]
+TWO = RANKS["2"]
+
+
+def card_id(rank: Optional[str], suit: Optional[str], is_joker: bool = False) -> int:
+    if is_joker:
+        return JOKER_IDS[0]
+
+    return RANKS[rank] * N_SUITS + SUIT_INDEX[suit]
+
+
+def rank_of(card: int) -> int:
+    return CARD_RANKS[card]
+
+
+# bitmask helpers, a set of cards is an int with bit ``card`` set per card
+RANK_MASKS: Tuple[int, ...] = tuple(
+    sum(1 << card for card in range(N_CARDS) if CARD_RANKS[card] == rank)
+    for rank in range(N_RANKS + 1)
+)
+FULL_MASK = (1 << N_CARDS) - 1
+
+
+def mask_of(cards: Iterable[int]) -> int:
+    mask = 0
+    for card in cards:
+        mask |= 1 << card
+
+    return mask
+
+
+def ids_of(mask: int) -> Tuple[int, ...]:
+    ret = []
+    while mask:
+        low = mask & -mask
+        ret.append(low.bit_length() - 1)
+        mask ^= low
+
+    return tuple(ret)
+
+
+def rank_group(mask: int, rank: int) -> int:
+    """Cards of a single rank in ``mask`` shifted down to the low 4 bits"""
+    return (mask >> (rank * N_SUITS)) & ((1 << N_SUITS) - 1)
+
+
+def lowest_rank(mask: int) -> int:
+    if not mask:
+        return -1
+
+    return CARD_RANKS[(mask & -mask).bit_length() - 1]
+
+
+def rank_count(mask: int, rank: int) -> int:
+    return (mask & RANK_MASKS[rank]).bit_count()
+
+
+def rank_counts(mask: int) -> Tuple[int, ...]:
+    return tuple((mask & rank_mask).bit_count() for rank_mask in RANK_MASKS)
+
+
+def rank_suit_mask(mask: int, rank: int) -> int:
+    """Suits held in ``mask`` for a single rank as a 4 bit mask"""
+    if rank < 0 or rank == JOKER_RANK:
+        return 0
+
+    return rank_group(mask, rank)
+
+
+# SUIT_SUBSETS[suits][size] lists every subset of a 4 bit suit mask by size
+SUIT_SUBSETS: Tuple[Tuple[Tuple[int, ...], ...], ...] = tuple(
+    tuple(
+        tuple(
+            sub
+            for sub in range(1 << N_SUITS)
+            if sub & suits == sub and sub.bit_count() == size
+        )
+        for size in range(N_SUITS + 1)
+    )
+    for suits in range(1 << N_SUITS)
+)
+
+
+# packed wire format, one character per card id in ``PACKED_CARD_CHARS``
+PACKED_CARD_CHARS = string.digits + string.ascii_letters
+PACKED_CARD_IDS = {char: card for card, char in enumerate(PACKED_CARD_CHARS)}
+
+
+def pack_ids(cards: Iterable[int]) -> str:
+    return "".join(PACKED_CARD_CHARS[card] for card in cards)
+
+
+def unpack_ids(packed: str) -> List[int]:
+    return [PACKED_CARD_IDS[char] for char in packed]
@@ -1,20 +1,34 @@
+import asyncio
 import json
 import logging
-from typing import List
+from typing import List, Optional, Tuple
 from urllib.parse import urlparse
 
-import boto3
 import click
-import urllib3
-from daifugo.common import (get_game, get_game_state, get_hands, get_players,
-                            post_mutation)
-from daifugo.constants import (API_KEY, API_URL, GAME_TABLE, HAND_TABLE,
-                               PLAYER_TABLE, STATE_TABLE)
-from daifugo.model import Game, GameState, Player
-from daifugo.mutations import (CREATE_GAME_MUTATION, HAND_SUBSCRIPTION,
-                               JOIN_GAME_MUTATION, PLAY_CARDS_MUTATION,
-                               START_GAME_MUTATION, STATE_SUBSCRIPTION)
+from daifugo.cards import ids_of
+from daifugo.common import (get_dynamodb, get_game, get_game_state, get_hands,
+                            get_http_client, get_players, post_mutation)
+from daifugo.constants import (API_KEY, API_URL, ARCHIVE_BUCKET, ARCHIVE_DIR,
+                               SERVER_FLUSH_INTERVAL, SERVER_IDLE_TIMEOUT,
+                               SWEEP_FINISHED_AFTER, SWEEP_IDLE_AFTER,
+                               SWEEP_READ_UNITS, SWEEP_WRITE_UNITS)
+from daifugo.delta import DeltaFollower, GameDelta, HandDelta, ResyncRequired
+from daifugo.endgame import solve_endgame
+from daifugo.loadtest import run_loadtest
+from daifugo.model import Game, GameState, Hand, Player, decode_cards
+from daifugo.mutations import (CREATE_GAME_MUTATION, ENQUEUE_MUTATION,
+                               GAME_HAND_QUERY, GAME_STATE_QUERY,
+                               GAME_SUBSCRIPTION, HAND_DELTA_SUBSCRIPTION,
+                               HAND_SUBSCRIPTION, JOIN_GAME_MUTATION,
+                               PLAY_CARDS_MUTATION, START_GAME_MUTATION,
+                               STATE_SUBSCRIPTION, TICKET_QUERY)
 from daifugo.play_cards_lambda import play_cards_handler
+from daifugo.replay import load_game_at
+from daifugo.server import DynamoDBStore, MemoryStore
+from daifugo.server import serve as run_server
+from daifugo.simulate import POLICIES
+from daifugo.simulate import simulate as run_simulation
+from daifugo.sweeper import ArchiveStore, RateLimiter, S3ArchiveStore, Sweeper
 from gql import Client, gql
 from gql.transport.appsync_auth import AppSyncApiKeyAuthentication
 from gql.transport.appsync_websockets import AppSyncWebsocketsTransport
@@ -30,7 +44,7 @@ def cli():
 
 @cli.command()
 def create_game():
-    http_client = urllib3.PoolManager()
+    http_client = get_http_client()
     game_json = post_mutation(CREATE_GAME_MUTATION, http_client)
     game = Game.from_json(game_json)
 
@@ -41,7 +55,7 @@ def create_game():
 @click.argument("game_id", type=str)
 @click.argument("name", type=str)
 def join_game(game_id: str, name: str):
-    http_client = urllib3.PoolManager()
+    http_client = get_http_client()
     player_json = post_mutation(
         JOIN_GAME_MUTATION,
         http_client,
@@ -54,7 +68,7 @@ def join_game(game_id: str, name: str):
 @cli.command()
 @click.argument("game_id", type=str)
 def start_game(game_id: str):
-    http_client = urllib3.PoolManager()
+    http_client = get_http_client()
     state_json = post_mutation(
         START_GAME_MUTATION, http_client, variables=dict(game_id=game_id)
     )
@@ -62,10 +76,42 @@ def start_game(game_id: str):
     logger.info(state)
 
 
+@cli.command()
+@click.argument("name", type=str)
+@click.option("--players", "table_size", type=int, default=4)
+@click.option("--variant", type=str, default="standard")
+@click.option("--skill-band", type=int, default=0)
+@click.option(
+    "--ticket-id", type=str, default=None, help="Subscribe to matched with it first"
+)
+def enqueue(name: str, table_size: int, variant: str, skill_band: int, ticket_id: str):
+    http_client = get_http_client()
+    ticket = post_mutation(
+        ENQUEUE_MUTATION,
+        http_client,
+        variables=dict(
+            id=ticket_id,
+            player_name=name,
+            table_size=table_size,
+            variant=variant,
+            skill_band=skill_band,
+        ),
+    )
+    logger.info(ticket)
+
+
+@cli.command()
+@click.argument("ticket_id", type=str)
+def ticket(ticket_id: str):
+    logger.info(
+        post_mutation(TICKET_QUERY, get_http_client(), variables=dict(id=ticket_id))
+    )
+
+
 @cli.command("get-players")
 @click.argument("game_id", type=str)
 def get_players_cli(game_id: str):
-    dynamodb = boto3.resource("dynamodb")
+    dynamodb = get_dynamodb()
 
     game = get_game(game_id, dynamodb)
 
@@ -81,7 +127,7 @@ def get_players_cli(game_id: str):
 @cli.command("get-hand")
 @click.argument("player_id", type=str)
 def get_hand_cli(player_id: str):
-    dynamodb = boto3.resource("dynamodb")
+    dynamodb = get_dynamodb()
     player = next(iter(get_players([player_id], dynamodb)))
     hand = next(iter(get_hands([player.hand_id], dynamodb)))
 
@@ -95,7 +141,7 @@ def get_hand_cli(player_id: str):
 @click.argument("cards", type=str)
 @click.argument("discards", type=str)
 def play_cards(game_id: str, player_id: str, cards: str, discards: str):
-    dynamodb = boto3.resource("dynamodb")
+    dynamodb = get_dynamodb()
     player = next(iter(get_players([player_id], dynamodb)))
     hand = next(iter(get_hands([player.hand_id], dynamodb)))
 
@@ -111,7 +157,7 @@ def play_cards(game_id: str, player_id: str, cards: str, discards: str):
         _discards = list(map(hand.cards.__getitem__, discard_ids))
         _discards = list(map(lambda card: card.to_json(), _discards))
 
-    http_client = urllib3.PoolManager()
+    http_client = get_http_client()
 
     state_json = play_cards_handler(
         event=dict(
@@ -136,7 +182,7 @@ def play_cards(game_id: str, player_id: str, cards: str, discards: str):
 @cli.command()
 @click.argument("game_id", type=str)
 def get_state(game_id: str):
-    dynamodb = boto3.resource("dynamodb")
+    dynamodb = get_dynamodb()
     game = get_game(game_id, dynamodb)
     state = get_game_state(game.state_id, dynamodb)
     logger.info(state)
@@ -145,7 +191,7 @@ def get_state(game_id: str):
 @cli.command("get-game")
 @click.argument("game_id", type=str)
 def get_game_cli(game_id: str):
-    dynamodb = boto3.resource("dynamodb")
+    dynamodb = get_dynamodb()
     game = get_game(game_id, dynamodb)
     logger.info(game)
 
@@ -193,28 +239,278 @@ def sub_to_state(game_id: str):
             logger.info(f"{key}: {value}")
 
 
+@cli.command()
+@click.argument("game_id", type=str)
+@click.option("--hand", "hand_ids", multiple=True, help="Hands to follow")
+def sub_to_game(game_id: str, hand_ids: List[str]):
+    http_client = get_http_client()
+
+    def resync() -> Tuple[GameState, List[Hand]]:
+        state_json = post_mutation(
+            GAME_STATE_QUERY, http_client, variables=dict(game_id=game_id)
+        )
+        hands = [
+            Hand.from_json(
+                post_mutation(
+                    GAME_HAND_QUERY,
+                    http_client,
+                    variables=dict(game_id=game_id, id=hand_id),
+                )
+            )
+            for hand_id in hand_ids
+        ]
+        return GameState.from_json(state_json), hands
+
+    follower = DeltaFollower(*resync())
+
+    host = str(urlparse(API_URL).netloc)
+    auth = AppSyncApiKeyAuthentication(host=host, api_key=API_KEY)
+    transport = AppSyncWebsocketsTransport(url=API_URL, auth=auth)
+
+    client = Client(
+        transport=transport,
+    )
+
+    # the cards of each hand come on their own subscription, by hand id
+    async def follow():
+        deltas = asyncio.Queue()
+
+        async def forward(query, variables, field, from_json):
+            async for result in session.subscribe(
+                gql(query), variable_values=variables
+            ):
+                await deltas.put(from_json(result[field]))
+
+        async with client as session:
+            tasks = [
+                asyncio.create_task(
+                    forward(
+                        GAME_SUBSCRIPTION,
+                        dict(game_id=game_id),
+                        "updatedGame",
+                        GameDelta.from_json,
+                    )
+                ),
+                *[
+                    asyncio.create_task(
+                        forward(
+                            HAND_DELTA_SUBSCRIPTION,
+                            dict(id=hand_id),
+                            "updatedHandDelta",
+                            HandDelta.from_json,
+                        )
+                    )
+                    for hand_id in hand_ids
+                ],
+            ]
+            try:
+                while True:
+                    delta = await deltas.get()
+                    if isinstance(delta, HandDelta):
+                        follower.apply_hand(delta)
+                    else:
+                        try:
+                            follower.apply(delta)
+                        except ResyncRequired as e:
+                            logger.info(f"{e}, resyncing")
+                            follower.reset(*resync())
+
+                    logger.info(f"{follower.seq}: {follower.state}")
+                    for hand_id in hand_ids:
+                        cards = follower.hand(hand_id).cards
+                        logger.info(
+                            f"{hand_id}: "
+                            f"{', '.join(f'{c.rank} of {c.suit}s' for c in cards)}"
+                        )
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+    asyncio.run(follow())
+
+
 @cli.command()
 @click.argument("game_id", type=str)
 def delete_game(game_id: str):
-    dynamodb = boto3.resource("dynamodb")
+    sweeper = Sweeper(get_dynamodb())
+    game = sweeper.load(game_id.upper())
+    deleted = sweeper.delete(game, fence=False)
+    logger.info(f"Deleted {deleted} items of {game_id}")
 
-    game = get_game(game_id, dynamodb)
 
-    players = []
-    if game.players:
-        players = get_players(game.players, dynamodb)
+@cli.command()
+@click.option("--archive-dir", type=str, default=ARCHIVE_DIR)
+@click.option(
+    "--archive-bucket", type=str, default=ARCHIVE_BUCKET, help="Over --archive-dir"
+)
+@click.option(
+    "--finished-after", type=int, default=SWEEP_FINISHED_AFTER, help="Seconds"
+)
+@click.option("--idle-after", type=int, default=SWEEP_IDLE_AFTER, help="Seconds")
+@click.option("--read-units", type=float, default=SWEEP_READ_UNITS)
+@click.option("--write-units", type=float, default=SWEEP_WRITE_UNITS)
+@click.option("--max-games", type=int, default=None)
+@click.option("--resume/--restart", default=True, help="Carry on from the last run")
+@click.option("--dry-run", is_flag=True)
+def sweep(
+    archive_dir: str,
+    archive_bucket: Optional[str],
+    finished_after: int,
+    idle_after: int,
+    read_units: float,
+    write_units: float,
+    max_games: Optional[int],
+    resume: bool,
+    dry_run: bool,
+):
+    sweeper = Sweeper(
+        get_dynamodb(),
+        S3ArchiveStore(archive_bucket) if archive_bucket else ArchiveStore(archive_dir),
+        finished_after=finished_after,
+        idle_after=idle_after,
+        read_limiter=RateLimiter(read_units),
+        write_limiter=RateLimiter(write_units),
+        dry_run=dry_run,
+    )
+    result = sweeper.run(sweeper.load_cursor() if resume else None, max_games=max_games)
+    if not dry_run:
+        sweeper.save_cursor(result.cursor)
+
+    logger.info(result)
+
+
+@cli.command()
+@click.argument("game_id", type=str)
+@click.option("--version", type=int, default=None, help="Defaults to the last move")
+def replay(game_id: str, version: Optional[int]):
+    dynamodb = get_dynamodb()
+    snapshot = load_game_at(game_id.upper(), dynamodb, version)
+
+    logger.info(snapshot.state)
+    for player, hand in zip(snapshot.players, snapshot.hands):
+        cards = ", ".join(f"{card.rank} of {card.suit}s" for card in hand.cards)
+        logger.info(f"{player.name} ({player.rank=}): {cards}")
+
+
+@cli.command()
+@click.argument("game_id", type=str)
+@click.option("--version", type=int, default=None, help="Defaults to the last move")
+def endgame(game_id: str, version: Optional[int]):
+    """Solves a small enough endgame exactly"""
+    snapshot = load_game_at(game_id.upper(), get_dynamodb(), version)
+
+    result = solve_endgame(snapshot.state, snapshot.players, snapshot.hands)
+    if result is None:
+        logger.info("Too many players or cards left to solve exactly")
+        return
+
+    names = [player.name for player in snapshot.players]
+    logger.info(f"forced: {result.forced}")
+    for order in sorted(result.finish_orders):
+        logger.info(" > ".join(names[seat] for seat in order))
+    logger.info(
+        f"finish order: {' > '.join(names[seat] for seat in result.finish_order)}"
+    )
+
+    if result.best_move is not None:
+        cards, discards = (
+            ", ".join(f"{card.rank} of {card.suit}s" for card in decode_cards(ids))
+            for ids in map(ids_of, result.best_move)
+        )
+        logger.info(f"best move: {cards or 'pass'}, discards: {discards or 'none'}")
 
-    hand_ids = [player.hand_id for player in players]
-    for hand_id in hand_ids:
-        dynamodb.Table(HAND_TABLE).delete_item(Key={"id": hand_id})
 
-    for player_id in game.players:
-        dynamodb.Table(PLAYER_TABLE).delete_item(Key={"id": player_id})
+@cli.command()
+@click.option("--games", "n_games", type=int, default=1000)
+@click.option("--players", "n_players", type=int, default=4)
+@click.option(
+    "--policy",
+    "policies",
+    type=click.Choice(list(POLICIES)),
+    multiple=True,
+    default=["random"],
+    help="Policy per seat, cycled if fewer than players",
+)
+@click.option("--seed", type=int, default=0)
+@click.option("--workers", type=int, default=1)
+@click.option("--chunk-size", type=int, default=100)
+@click.option("--max-moves", type=int, default=2000)
+def simulate(
+    n_games: int,
+    n_players: int,
+    policies: List[str],
+    seed: int,
+    workers: int,
+    chunk_size: int,
+    max_moves: int,
+):
+    for stats in run_simulation(
+        n_games,
+        n_players,
+        policies,
+        seed=seed,
+        workers=workers,
+        chunk_size=chunk_size,
+        max_moves=max_moves,
+    ):
+        logger.info(stats.summary())
+
+    for seat, ranks in enumerate(stats.seat_ranks):
+        logger.info(f"seat {seat}: {ranks}")
 
-    if game.state_id:
-        dynamodb.Table(STATE_TABLE).delete_item(Key={"id": game.state_id})
 
-    dynamodb.Table(GAME_TABLE).delete_item(Key={"id": game.id})
+@cli.command()
+@click.option("--host", type=str, default="127.0.0.1")
+@click.option("--port", type=int, default=8080)
+@click.option("--store", type=click.Choice(["memory", "dynamodb"]), default="memory")
+@click.option("--flush-interval", type=float, default=SERVER_FLUSH_INTERVAL)
+@click.option("--idle-timeout", type=float, default=SERVER_IDLE_TIMEOUT)
+def serve(host: str, port: int, store: str, flush_interval: float, idle_timeout: float):
+    game_store = DynamoDBStore() if store == "dynamodb" else MemoryStore()
+    asyncio.run(run_server(host, port, game_store, flush_interval, idle_timeout))
+
+
+@cli.command()
+@click.option("--games", "n_games", type=int, default=10)
+@click.option("--players", "n_players", type=int, default=4)
+@click.option("--policy", type=click.Choice(list(POLICIES)), default="random")
+@click.option(
+    "--rate", type=float, default=0, help="Target moves per second, 0 for no limit"
+)
+@click.option("--concurrency", type=int, default=16, help="Requests in flight")
+@click.option(
+    "--target",
+    type=click.Choice(["api", "local", "server"]),
+    default="local",
+    help="The deployed API, the in-memory stand-in or an in-process game server",
+)
+@click.option("--seed", type=int, default=0)
+@click.option("--max-moves", type=int, default=2000)
+def loadtest(
+    n_games: int,
+    n_players: int,
+    policy: str,
+    rate: float,
+    concurrency: int,
+    target: str,
+    seed: int,
+    max_moves: int,
+):
+    stats = run_loadtest(
+        n_games,
+        target,
+        concurrency,
+        n_players=n_players,
+        policy=policy,
+        rate=rate,
+        seed=seed,
+        max_moves=max_moves,
+    )
+
+    summary = stats.summary()
+    for name, field_stats in summary.pop("fields").items():
+        logger.info(f"{name}: {field_stats}")
+    logger.info(summary)
 
 
 if __name__ == "__main__":
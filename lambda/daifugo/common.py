@@ -1,85 +1,312 @@
+import contextvars
 import json
 import logging
 import random
-from datetime import datetime
-from typing import Any, Dict, List, Optional
-
-import boto3
-import urllib3
-
-from .constants import (API_URL, GAME_TABLE, HAND_TABLE, HTTP_HEADERS,
-                        ID_CHARS, ID_LENGTH, PLAYER_TABLE, STATE_TABLE)
-from .model import Card, Deck, Game, GameState, Hand, Player
-from .mutations import (CREATE_STATE_MUTATION, UPDATE_HAND_MUTATION,
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import (TYPE_CHECKING, Any, Callable, Dict, List, Optional,
+                    Sequence, Tuple)
+
+from .constants import (API_URL, BATCH_BACKOFF_BASE, BATCH_BACKOFF_MAX,
+                        BATCH_GET_SIZE, BATCH_MAX_ATTEMPTS, BATCH_WRITE_SIZE,
+                        CHECKPOINT_SK_PREFIX, CLIENT_MAX_AGE,
+                        DYNAMODB_POOL_SIZE, GAME_SK, GAME_TABLE, HAND_TABLE,
+                        HTTP_HEADERS, HTTP_POOL_SIZE, HTTP_TIMEOUT,
+                        LAST_ACTIVE, MOVE_SK_PREFIX, MUTATION_WORKERS,
+                        PLAYER_TABLE, SNAPSHOT_TABLE, STATE_SK, STATE_TABLE)
+from .model import (Card, Deck, Game, GameSnapshot, GameState, Hand,
+                    IncompleteSnapshot, InvalidPlayError, MoveEvent, MoveLog,
+                    Player)
+from .mutations import (CREATE_STATE_MUTATION, PUBLISH_DELTA_MUTATION,
+                        PUBLISH_HAND_DELTA_MUTATION, UPDATE_HAND_MUTATION,
                         UPDATE_PLAYER_MUTATION, UPDATE_STATE_MUTATION,
                         Mutation)
+from .tracing import add_capacity, count, traced
+
+if TYPE_CHECKING:
+    import urllib3
+
+    from .delta import GameDelta, HandDelta
 
 logger = logging.getLogger(__name__)
 
+MutationRequest = namedtuple("MutationRequest", ["mutation", "variables"])
+MutationResult = namedtuple("MutationResult", ["name", "data", "error"])
 
-class InvalidPlayError(ValueError):
-    pass
+_mutation_executor: Optional[ThreadPoolExecutor] = None
 
 
 class BadGraphQLRequest(ValueError):
     pass
 
 
-def get_items(ids: List[str], dynamodb, table_name) -> Any:
-    data = dynamodb.batch_get_item(
-        RequestItems={
-            table_name: {"Keys": [{"id": _id} for _id in ids], "ConsistentRead": True}
-        },
-        ReturnConsumedCapacity="TOTAL",
-    )
-    return data["Responses"][table_name]
+class ConflictError(ValueError):
+    """
+    Another write moved the game past the version this request read, the
+    caller should reload the game and retry
+    """
 
 
-def generate_id() -> str:
-    random.seed(datetime.now().timestamp())
-    return "".join(random.choices(ID_CHARS, k=ID_LENGTH))
+# boto3 and urllib3 are imported on first use so a handler only pays for the
+# clients it actually touches at cold start
 
 
-def generate_unique_game_id(dynamodb) -> str:
-    # TODO: Make sure this is only alphanumeric
+def build_dynamodb():
+    import boto3
+    from botocore.config import Config
 
-    while 1:
-        game_id = generate_id()
+    config = Config(
+        max_pool_connections=DYNAMODB_POOL_SIZE,
+        tcp_keepalive=True,
+        retries={"mode": "adaptive"},
+    )
+    return boto3.session.Session().resource("dynamodb", config=config)
 
-        data = dynamodb.batch_get_item(
-            RequestItems={
-                GAME_TABLE: {"Keys": [{"id": game_id}], "ConsistentRead": True}
-            },
-        )
 
-        if not data["Responses"][GAME_TABLE]:
-            break
+def build_http_client() -> "urllib3.PoolManager":
+    import urllib3
 
-    return game_id
+    return urllib3.PoolManager(
+        maxsize=HTTP_POOL_SIZE,
+        timeout=urllib3.Timeout(total=HTTP_TIMEOUT),
+        retries=urllib3.Retry(total=2, backoff_factor=0.1),
+    )
 
 
+class ClientRegistry:
+    """
+    Lazily built DynamoDB and AppSync clients kept at module level so warm
+    invocations reuse their TLS sessions and keep-alive connections. A client
+    is rebuilt once it is older than ``max_age`` or after it was invalidated
+    by a connection error.
+    """
+
+    def __init__(
+        self,
+        dynamodb_factory: Callable[[], Any] = build_dynamodb,
+        http_client_factory: Callable[[], Any] = build_http_client,
+        max_age: float = CLIENT_MAX_AGE,
+    ):
+        self._factories = dict(
+            dynamodb=dynamodb_factory, http_client=http_client_factory
+        )
+        self._clients: Dict[str, Any] = {}
+        self._created: Dict[str, float] = {}
+        self._overrides: Dict[str, Any] = {}
+        self._max_age = max_age
+        self._lock = threading.Lock()
+
+    def _get(self, name: str):
+        if name in self._overrides:
+            return self._overrides[name]
+
+        with self._lock:
+            if not self.healthy(name):
+                self._clients[name] = self._factories[name]()
+                self._created[name] = time.monotonic()
+
+            return self._clients[name]
+
+    @property
+    def dynamodb(self):
+        return self._get("dynamodb")
+
+    @property
+    def http_client(self) -> "urllib3.PoolManager":
+        return self._get("http_client")
+
+    def healthy(self, name: str) -> bool:
+        if name not in self._clients:
+            return False
+
+        return time.monotonic() - self._created[name] < self._max_age
+
+    def invalidate(self, name: Optional[str] = None):
+        with self._lock:
+            for key in [name] if name else list(self._clients):
+                client = self._clients.pop(key, None)
+                self._created.pop(key, None)
+
+                if hasattr(client, "clear"):
+                    client.clear()
+
+    def discard(self, client):
+        """Invalidates ``client`` if it is one of the shared clients"""
+        for name, shared in list(self._clients.items()):
+            if shared is client:
+                self.invalidate(name)
+
+    @contextmanager
+    def override(self, dynamodb=None, http_client=None):
+        """Injects stand-in clients, e.g. for tests or a local backend"""
+        previous = dict(self._overrides)
+        if dynamodb is not None:
+            self._overrides["dynamodb"] = dynamodb
+        if http_client is not None:
+            self._overrides["http_client"] = http_client
+
+        try:
+            yield self
+        finally:
+            self._overrides = previous
+
+
+clients = ClientRegistry()
+
+
+def get_dynamodb():
+    return clients.dynamodb
+
+
+def get_http_client() -> "urllib3.PoolManager":
+    return clients.http_client
+
+
+@traced("get_items")
+def get_items(
+    ids: List[str], dynamodb, table_name, max_attempts: int = BATCH_MAX_ATTEMPTS
+) -> List[Dict]:
+    """
+    The items of ``ids`` in the order of ``ids``, ids without an item are
+    left out. Keys are read in pages of ``BATCH_GET_SIZE`` and keys a page
+    leaves unprocessed, e.g. when a table is throttled, are retried with
+    backoff until ``max_attempts`` is spent rather than dropped.
+    """
+    unique = list(dict.fromkeys(ids))
+    found: Dict[str, Dict] = {}
+    for start in range(0, len(unique), BATCH_GET_SIZE):
+        pending = {
+            table_name: {
+                "Keys": [{"id": _id} for _id in unique[start : start + BATCH_GET_SIZE]],
+                "ConsistentRead": True,
+            }
+        }
+
+        for attempt in range(max_attempts):
+            if attempt:
+                count("batch_get_retries")
+                time.sleep(backoff(attempt - 1))
+
+            data = dynamodb.batch_get_item(
+                RequestItems=pending, ReturnConsumedCapacity="TOTAL"
+            )
+            add_capacity("read", data.get("ConsumedCapacity"))
+            for item in data["Responses"].get(table_name, []):
+                found[item["id"]] = item
+
+            pending = data.get("UnprocessedKeys") or {}
+            if not pending:
+                break
+        else:
+            n_keys = len(pending[table_name]["Keys"])
+            raise UnprocessedItemsError(
+                f"{n_keys} keys were still unprocessed after {max_attempts} attempts"
+            )
+
+    return [found[_id] for _id in ids if _id in found]
+
+
+@traced("post_mutation")
 def post_mutation(
     mutation: Mutation,
-    http_client: urllib3.PoolManager,
+    http_client: "urllib3.PoolManager",
     variables: Optional[str] = None,
 ):
+    import urllib3
+
     request_body = {"query": mutation.value}
     if variables:
         request_body["variables"] = variables
 
-    response = http_client.request(
-        "POST",
-        API_URL,
-        body=json.dumps(request_body),
-        headers=HTTP_HEADERS,
-    )
+    try:
+        response = http_client.request(
+            "POST",
+            API_URL,
+            body=json.dumps(request_body),
+            headers=HTTP_HEADERS,
+        )
+    except urllib3.exceptions.HTTPError:
+        # drop the pooled connections so the next call starts clean
+        clients.discard(http_client)
+        raise
+
     data = json.loads(response.data)
     if "errors" in data:
+        if any(
+            "ConditionalCheckFailed" in (error.get("errorType") or "")
+            for error in data["errors"]
+        ):
+            raise ConflictError(data["errors"])
         raise BadGraphQLRequest(data["errors"])
 
     return data["data"][mutation.name]
 
 
+def _executor() -> ThreadPoolExecutor:
+    global _mutation_executor
+    if _mutation_executor is None:
+        _mutation_executor = ThreadPoolExecutor(
+            max_workers=MUTATION_WORKERS, thread_name_prefix="mutation"
+        )
+
+    return _mutation_executor
+
+
+def post_mutations(
+    requests: List[MutationRequest], http_client: "urllib3.PoolManager"
+) -> List[MutationResult]:
+    """
+    Posts independent mutations concurrently over the shared connection pool.
+    Results come back in request order, a failed mutation carries its error
+    instead of raising so the others are still reported.
+    """
+    import urllib3
+
+    if len(requests) == 1:
+        futures = None
+    else:
+        futures = [
+            # each worker runs in a copy of the caller's context to keep its trace
+            _executor().submit(
+                contextvars.copy_context().run,
+                post_mutation,
+                mutation,
+                http_client,
+                variables,
+            )
+            for mutation, variables in requests
+        ]
+
+    results = []
+    for i, (mutation, variables) in enumerate(requests):
+        try:
+            if futures is None:
+                data = post_mutation(mutation, http_client, variables)
+            else:
+                data = futures[i].result()
+        except (
+            BadGraphQLRequest,
+            ConflictError,
+            urllib3.exceptions.HTTPError,
+        ) as e:
+            results.append(MutationResult(mutation.name, None, e))
+        else:
+            results.append(MutationResult(mutation.name, data, None))
+
+    return results
+
+
+def raise_for_errors(results: List[MutationResult]) -> List[Any]:
+    for result in results:
+        if result.error is not None:
+            raise result.error
+
+    return [result.data for result in results]
+
+
 def get_game(game_id: str, dynamodb) -> Game:
     game_json = next(iter(get_items([game_id], dynamodb, GAME_TABLE)))
     return Game.from_json(game_json)
@@ -100,49 +327,330 @@ def get_hands(hand_ids: List[str], dynamodb) -> List[Hand]:
     return [Hand.from_json(hand_json) for hand_json in hands_json]
 
 
-def update_hand(
-    hand_id: str, cards: List[Card], http_client: urllib3.PoolManager
-) -> Hand:
-    json_cards = [card.to_json() for card in cards]
-    variables = {"id": hand_id, "cards": json_cards}
+def get_snapshot_items(game_id: str, dynamodb) -> List[Dict]:
+    """Every item of the game_id partition of the snapshot table"""
+    table = dynamodb.Table(SNAPSHOT_TABLE)
+    from boto3.dynamodb.conditions import Key
 
-    hand_json = post_mutation(UPDATE_HAND_MUTATION, http_client, variables)
-    return Hand.from_json(hand_json)
+    query = dict(
+        KeyConditionExpression=Key("game_id").eq(game_id),
+        ConsistentRead=True,
+        ReturnConsumedCapacity="TOTAL",
+    )
+
+    items = []
+    while 1:
+        data = table.query(**query)
+        add_capacity("read", data.get("ConsumedCapacity"))
+        items += data["Items"]
+
+        if "LastEvaluatedKey" not in data:
+            break
+        query["ExclusiveStartKey"] = data["LastEvaluatedKey"]
+
+    return items
+
+
+@traced("get_snapshot")
+def get_snapshot(game_id: str, dynamodb) -> Optional[GameSnapshot]:
+    """
+    Loads the game, players, hands and state with a single Query on the
+    game_id partition of the snapshot table
+    """
+    items = get_snapshot_items(game_id, dynamodb)
+    if not items:
+        return None
+
+    return GameSnapshot.from_items(items)
+
+
+def get_legacy_snapshot(game_id: str, dynamodb) -> GameSnapshot:
+    """The game as the entity tables have it"""
+    game = get_game(game_id, dynamodb)
+    # get_items keeps the order of the ids, players come back in seat order
+    players = get_players(game.players, dynamodb) if game.players else []
+
+    hand_ids = [player.hand_id for player in players]
+    hands = get_hands(hand_ids, dynamodb) if hand_ids else []
+
+    state = get_game_state(game.state_id, dynamodb) if game.state_id else None
+
+    return GameSnapshot(game, players, hands, state)
+
+
+@traced("backfill_snapshot")
+def backfill_snapshot(game_id: str, dynamodb):
+    """
+    Copies a game from before the snapshot table into its partition. Items the
+    partition already has are newer than the entity tables and are kept, only
+    missing ones and a game item a join left without its other attributes are
+    written.
+    """
+    from botocore.exceptions import ClientError
+
+    legacy = get_legacy_snapshot(game_id, dynamodb)
+    entities = [legacy.game, *legacy.players, *legacy.hands]
+    if legacy.state is not None:
+        entities.append(legacy.state)
+
+    table = dynamodb.Table(SNAPSHOT_TABLE)
+    for item in snapshot_items(game_id, entities):
+        try:
+            table.put_item(
+                Item=item,
+                ConditionExpression="attribute_not_exists(#id)",
+                ExpressionAttributeNames={"#id": "id"},
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+    count("snapshot_backfills")
+
+
+def load_game_snapshot(game_id: str, dynamodb) -> GameSnapshot:
+    try:
+        snapshot = get_snapshot(game_id, dynamodb)
+    except IncompleteSnapshot:
+        snapshot = None
+    if snapshot is not None:
+        return snapshot
+
+    # games created before the snapshot table only exist in the entity tables,
+    # or only partly in the partition once a join or a move wrote to it
+    backfill_snapshot(game_id, dynamodb)
+    return get_snapshot(game_id, dynamodb)
+
+
+def snapshot_items(game_id: str, entities: List) -> List[Dict]:
+    """Snapshot items stamped with the time of the write, see daifugo.sweeper"""
+    now = int(time.time())
+    return [
+        {**item, LAST_ACTIVE: now} for item in GameSnapshot.to_items(game_id, entities)
+    ]
+
+
+@traced("put_snapshot")
+def put_snapshot(game_id: str, entities: List, dynamodb):
+    with dynamodb.Table(SNAPSHOT_TABLE).batch_writer() as batch:
+        for item in snapshot_items(game_id, entities):
+            batch.put_item(Item=item)
+
+
+class UnprocessedItemsError(RuntimeError):
+    pass
+
+
+def backoff(attempt: int) -> float:
+    """Full jitter, a random delay up to the exponential bound of ``attempt``"""
+    return random.uniform(0, min(BATCH_BACKOFF_MAX, BATCH_BACKOFF_BASE * 2**attempt))
+
+
+@traced("batch_write")
+def batch_write(
+    requests: Sequence[Tuple[str, Dict]],
+    dynamodb,
+    max_attempts: int = BATCH_MAX_ATTEMPTS,
+):
+    """
+    Sends ``(table name, {"PutRequest": ...} or {"DeleteRequest": ...})``
+    pairs with batch_write_item in pages of ``BATCH_WRITE_SIZE``. Items a page
+    leaves unprocessed, e.g. when a table is throttled, are retried with
+    backoff until ``max_attempts`` is spent. A batch is not atomic.
+    """
+    client = dynamodb.meta.client
+    for start in range(0, len(requests), BATCH_WRITE_SIZE):
+        pending: Dict[str, List[Dict]] = {}
+        for table_name, request in requests[start : start + BATCH_WRITE_SIZE]:
+            pending.setdefault(table_name, []).append(request)
+
+        for attempt in range(max_attempts):
+            if attempt:
+                count("batch_write_retries")
+                time.sleep(backoff(attempt - 1))
+
+            data = client.batch_write_item(
+                RequestItems=pending, ReturnConsumedCapacity="TOTAL"
+            )
+            add_capacity("write", data.get("ConsumedCapacity"))
+            pending = data.get("UnprocessedItems") or {}
+            if not pending:
+                break
+        else:
+            n_items = sum(len(items) for items in pending.values())
+            raise UnprocessedItemsError(
+                f"{n_items} items were still unprocessed after {max_attempts} attempts"
+            )
+
+
+@traced("commit_move")
+def commit_move(
+    game_id: str,
+    expected_version: int,
+    entities: List,
+    dynamodb,
+    log_items: Sequence[Dict] = (),
+):
+    """
+    Writes the next state with the hands and players it changed in one
+    transaction, conditional on the stored state still being at
+    ``expected_version``. Raises ``ConflictError`` if another move got there
+    first, in which case nothing is written. ``log_items`` are appended to the
+    move log in the same transaction and are never overwritten.
+    """
+    from botocore.exceptions import ClientError
+
+    actions = []
+    for item in snapshot_items(game_id, entities):
+        # the resource's client serializes plain python values like Table does
+        put = dict(TableName=SNAPSHOT_TABLE, Item=item)
+        if item["sk"] == STATE_SK:
+            # games from before versioning have no version attribute yet
+            put.update(
+                ConditionExpression=(
+                    "attribute_not_exists(#version) OR #version = :expected"
+                ),
+                ExpressionAttributeNames={"#version": "version"},
+                ExpressionAttributeValues={":expected": expected_version},
+            )
+        actions.append({"Put": put})
+
+    for item in log_items:
+        actions.append(
+            {
+                "Put": dict(
+                    TableName=SNAPSHOT_TABLE,
+                    Item=item,
+                    ConditionExpression="attribute_not_exists(sk)",
+                )
+            }
+        )
+
+    try:
+        data = dynamodb.meta.client.transact_write_items(
+            TransactItems=actions, ReturnConsumedCapacity="TOTAL"
+        )
+    except ClientError as e:
+        reasons = e.response.get("CancellationReasons") or []
+        if any(
+            reason.get("Code") in ("ConditionalCheckFailed", "TransactionConflict")
+            for reason in reasons
+        ):
+            raise ConflictError(
+                f"Game {game_id} is no longer at version {expected_version}"
+            ) from e
+        raise
+
+    add_capacity("write", data.get("ConsumedCapacity"))
+
+
+def put_checkpoint(game_id: str, snapshot: GameSnapshot, dynamodb):
+    dynamodb.Table(SNAPSHOT_TABLE).put_item(
+        Item=MoveLog.checkpoint_item(game_id, snapshot)
+    )
+
+
+def get_checkpoint(
+    game_id: str, dynamodb, version: Optional[int] = None
+) -> Optional[GameSnapshot]:
+    """Latest checkpoint at or before ``version``, the newest one if not given"""
+    from boto3.dynamodb.conditions import Key
+
+    if version is None:
+        sk = Key("sk").begins_with(CHECKPOINT_SK_PREFIX)
+    else:
+        sk = Key("sk").between(MoveLog.checkpoint_sk(0), MoveLog.checkpoint_sk(version))
+
+    items = (
+        dynamodb.Table(SNAPSHOT_TABLE)
+        .query(
+            KeyConditionExpression=Key("game_id").eq(MoveLog.partition(game_id)) & sk,
+            ScanIndexForward=False,
+            Limit=1,
+            ConsistentRead=True,
+        )
+        .get("Items")
+    )
+    if not items:
+        return None
+
+    return MoveLog.from_checkpoint_item(items[0])
+
+
+def get_move_events(
+    game_id: str, dynamodb, first: int, last: Optional[int] = None
+) -> List[MoveEvent]:
+    """Moves that produced versions ``first`` through ``last`` in order"""
+    from boto3.dynamodb.conditions import Key
+
+    upper = MoveLog.move_sk(last) if last is not None else MOVE_SK_PREFIX + "~"
+    query = dict(
+        KeyConditionExpression=Key("game_id").eq(MoveLog.partition(game_id))
+        & Key("sk").between(MoveLog.move_sk(first), upper),
+        ConsistentRead=True,
+    )
+
+    events = []
+    table = dynamodb.Table(SNAPSHOT_TABLE)
+    while 1:
+        data = table.query(**query)
+        events += [MoveEvent.from_json(item) for item in data["Items"]]
+
+        if "LastEvaluatedKey" not in data:
+            break
+        query["ExclusiveStartKey"] = data["LastEvaluatedKey"]
+
+    return events
+
+
+def append_snapshot_player(game_id: str, player: Player, hand: Hand, dynamodb):
+    put_snapshot(game_id, [player, hand], dynamodb)
+
+    # mirrors the list_append in update_game.vtl so concurrent joins are kept
+    dynamodb.Table(SNAPSHOT_TABLE).update_item(
+        Key={"game_id": game_id, "sk": GAME_SK},
+        UpdateExpression=(
+            "SET #players = list_append(if_not_exists(#players, :empty), :players), "
+            "#last_active = :now"
+        ),
+        ExpressionAttributeNames={"#players": "players", "#last_active": LAST_ACTIVE},
+        ExpressionAttributeValues={
+            ":players": [player.id],
+            ":empty": [],
+            ":now": int(time.time()),
+        },
+    )
+
+
+def hand_update(hand_id: str, cards: List[Card]) -> MutationRequest:
+    json_cards = [card.to_json() for card in cards]
+    return MutationRequest(UPDATE_HAND_MUTATION, {"id": hand_id, "cards": json_cards})
 
 
-def update_player(player: Player, http_client: urllib3.PoolManager) -> Player:
-    player_json = post_mutation(
+def player_update(player: Player) -> MutationRequest:
+    return MutationRequest(
         UPDATE_PLAYER_MUTATION,
-        http_client,
-        variables=dict(id=player.id, has_passed=player.has_passed, rank=player.rank),
+        dict(id=player.id, has_passed=player.has_passed, rank=player.rank),
     )
-    return Player.from_json(player_json)
 
 
-def create_game_state(
-    game_id: str,
-    starting_player_id: str,
-    starting_player_idx: int,
-    http_client: urllib3.PoolManager,
-) -> GameState:
-    state_json = post_mutation(
+def state_create(
+    game_id: str, starting_player_id: str, starting_player_idx: int
+) -> MutationRequest:
+    return MutationRequest(
         CREATE_STATE_MUTATION,
-        http_client,
-        variables=dict(
+        dict(
             game_id=game_id,
             active_player_id=starting_player_id,
             active_player_idx=starting_player_idx,
         ),
     )
-    return GameState.from_json(state_json)
 
 
-def update_state(state: GameState, http_client: urllib3.PoolManager) -> Dict[str, str]:
+def state_update(state: GameState) -> MutationRequest:
     cards_json = [card.to_json() for card in state.top_of_pile.cards]
-    state_json = post_mutation(
+    return MutationRequest(
         UPDATE_STATE_MUTATION,
-        http_client,
-        variables=dict(
+        dict(
             id=state.id,
             active_player_idx=state.active_player_idx,
             last_played_idx=state.last_played_idx,
@@ -152,14 +660,56 @@ def update_state(state: GameState, http_client: urllib3.PoolManager) -> Dict[str
             active_pattern=state.active_pattern,
             revolution=state.revolution,
             direction=state.direction,
+            expected_version=state.version - 1,
         ),
     )
-    return state_json
 
 
-def deal_hands(n_players: int = 5, n_jokers: int = 0) -> List[List[Card]]:
+def delta_publish(delta: "GameDelta") -> MutationRequest:
+    return MutationRequest(PUBLISH_DELTA_MUTATION, delta.to_json())
+
+
+def hand_delta_publish(delta: "HandDelta") -> MutationRequest:
+    return MutationRequest(PUBLISH_HAND_DELTA_MUTATION, delta.to_json())
+
+
+def update_hand(
+    hand_id: str, cards: List[Card], http_client: "urllib3.PoolManager"
+) -> Hand:
+    mutation, variables = hand_update(hand_id, cards)
+    hand_json = post_mutation(mutation, http_client, variables)
+    return Hand.from_json(hand_json)
+
+
+def update_player(player: Player, http_client: "urllib3.PoolManager") -> Player:
+    mutation, variables = player_update(player)
+    player_json = post_mutation(mutation, http_client, variables)
+    return Player.from_json(player_json)
+
+
+def create_game_state(
+    game_id: str,
+    starting_player_id: str,
+    starting_player_idx: int,
+    http_client: "urllib3.PoolManager",
+) -> GameState:
+    mutation, variables = state_create(game_id, starting_player_id, starting_player_idx)
+    state_json = post_mutation(mutation, http_client, variables)
+    return GameState.from_json(state_json)
+
+
+def update_state(
+    state: GameState, http_client: "urllib3.PoolManager"
+) -> Dict[str, str]:
+    mutation, variables = state_update(state)
+    return post_mutation(mutation, http_client, variables)
+
+
+def deal_hands(
+    n_players: int = 5, n_jokers: int = 0, rng: Optional[random.Random] = None
+) -> List[List[Card]]:
     deck = Deck(n_jokers=n_jokers)
-    deck.shuffle()
+    deck.shuffle(rng)
 
     idx = 0
     hands: List[List[Card]] = [[] for _ in range(n_players)]
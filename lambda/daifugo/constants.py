@@ -31,11 +31,128 @@ GAME_TABLE = "daifugo_api_game_table"
 HAND_TABLE = "daifugo_api_hand_table"
 STATE_TABLE = "daifugo_api_state_table"
 
+# single table holding every item of a game under one game_id partition
+SNAPSHOT_TABLE = "daifugo_api_snapshot_table"
+GAME_SK = "GAME"
+STATE_SK = "STATE"
+PLAYER_SK_PREFIX = "PLAYER#"
+HAND_SK_PREFIX = "HAND#"
+
+# append-only move log, kept in its own partition so the snapshot Query does not
+# grow with the game, a checkpoint of the whole game is taken every N moves
+LOG_PK_SUFFIX = "#LOG"
+MOVE_SK_PREFIX = "MOVE#"
+CHECKPOINT_SK_PREFIX = "CHECKPOINT#"
+CHECKPOINT_INTERVAL = int(os.environ.get("CHECKPOINT_INTERVAL", 16))
+
+# client-supplied idempotency keys of joinGame, startGame and playCards, see
+# daifugo.idempotency. A claim outlives the 300s Lambda timeout so a crashed
+# invocation frees its key, a stored response is replayed for IDEMPOTENCY_TTL
+IDEMPOTENCY_PK_SUFFIX = "#IDEMPOTENCY"
+IDEMPOTENCY_TTL = int(os.environ.get("IDEMPOTENCY_TTL", 60 * 60))
+IDEMPOTENCY_CLAIM_TTL = 310
+# responses a warm container or the game server keeps in memory
+IDEMPOTENCY_CACHE_SIZE = 1024
+
+# matchmaking queue, see daifugo.matchmaking. Tickets wait under a
+# QUEUE#<table size>#<variant>#<skill band> partition of the snapshot table
+QUEUE_PK_PREFIX = "QUEUE#"
+TICKET_SK_PREFIX = "TICKET#"
+# every ticket is also kept under TICKET#<ticket id>, with its seat once it is
+# seated, for the ticket query and retried enqueues
+TICKET_PK_PREFIX = "TICKET#"
+TICKET_RECORD_SK = "TICKET"
+MATCH_MIN_PLAYERS = 2
+MATCH_MAX_PLAYERS = 8
+# only the standard rules exist so far, a variant still gets its own queue
+MATCH_VARIANTS = ("standard",)
+# tickets nobody was matched with are dropped by the table's TTL, a seated
+# ticket stays readable for as long after it is seated
+TICKET_TTL = int(os.environ.get("TICKET_TTL", 10 * 60))
+
+# batch_write_item takes at most 25 requests, unprocessed ones are retried with
+# exponential backoff and full jitter, see common.batch_write
+BATCH_WRITE_SIZE = 25
+# batch_get_item takes at most 100 keys, see common.get_items
+BATCH_GET_SIZE = 100
+BATCH_MAX_ATTEMPTS = 8
+BATCH_BACKOFF_BASE = 0.05
+BATCH_BACKOFF_MAX = 5.0
+
+# epoch seconds of the last write to a game, stamped on the snapshot items
+LAST_ACTIVE = "last_active"
+
+# sweeper of finished and abandoned games, see daifugo.sweeper. Finished games
+# are kept for SWEEP_FINISHED_AFTER seconds, any game for SWEEP_IDLE_AFTER
+SWEEP_FINISHED_AFTER = int(os.environ.get("SWEEP_FINISHED_AFTER", 60 * 60))
+SWEEP_IDLE_AFTER = int(os.environ.get("SWEEP_IDLE_AFTER", 7 * 24 * 60 * 60))
+# capacity units per second the sweeper may spend of each provisioned unit
+SWEEP_READ_UNITS = float(os.environ.get("SWEEP_READ_UNITS", 0.5))
+SWEEP_WRITE_UNITS = float(os.environ.get("SWEEP_WRITE_UNITS", 0.5))
+# items a Scan page evaluates, before the filter
+SWEEP_SCAN_PAGE = 100
+# seconds of the Lambda's remaining time kept back to save the scan cursor
+SWEEP_TIME_MARGIN = 10.0
+SWEEP_CURSOR_PK = "#SWEEP"
+# gzipped JSON lines, one per archived game
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "archive")
+# a gzipped JSON object per archived game, the scheduled sweep archives here
+ARCHIVE_BUCKET = os.environ.get("ARCHIVE_BUCKET")
+ARCHIVE_PREFIX = os.environ.get("ARCHIVE_PREFIX", "sweep/")
+
+# "full" publishes updateState/updateHand per move, "delta" only publishDelta,
+# "both" keeps full updates for older clients while they migrate to deltas
+SUBSCRIPTION_MODE = os.environ.get("SUBSCRIPTION_MODE", "both")
+
+# how Lambda-owned items store card lists, "json" keeps the per-card JSON
+# strings, "packed" a single packed_<field> string, "both" writes the two while
+# older readers are still deployed, readers accept either
+CARD_FORMAT = os.environ.get("CARD_FORMAT", "packed")
+
+# search budget of the ISMCTS bot behind suggestMove, see daifugo.bot, whichever
+# of the iterations and seconds runs out first ends the search
+BOT_ITERATIONS = int(os.environ.get("BOT_ITERATIONS", 5000))
+BOT_TIME_LIMIT = float(os.environ.get("BOT_TIME_LIMIT", 1.0))
+# seconds of the Lambda's remaining time kept back for the response
+BOT_TIME_MARGIN = 0.25
+BOT_EXPLORATION = 0.7
+BOT_MAX_PLAYOUT_MOVES = 1000
+
+# positions the exact endgame solver takes on, see daifugo.endgame, at most this
+# many players still in holding at most this many cards between them
+ENDGAME_MAX_PLAYERS = 3
+ENDGAME_MAX_CARDS = int(os.environ.get("ENDGAME_MAX_CARDS", 8))
+# solved positions kept across calls, least recently used go first
+ENDGAME_TABLE_SIZE = int(os.environ.get("ENDGAME_TABLE_SIZE", 200_000))
+
+# seconds between write-behind flushes of the game server, see daifugo.server
+SERVER_FLUSH_INTERVAL = float(os.environ.get("SERVER_FLUSH_INTERVAL", 1.0))
+# seconds without a request before a table is flushed and dropped from memory,
+# finished tables go at the next flush
+SERVER_IDLE_TIMEOUT = float(os.environ.get("SERVER_IDLE_TIMEOUT", 10 * 60))
+
+# CloudWatch namespace of the metrics handlers emit, see daifugo.tracing
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "Daifugo")
+
+# concurrent AppSync mutations per invocation, also the http pool size
+MUTATION_WORKERS = 8
+
+# shared clients kept across warm invocations, see common.ClientRegistry
+HTTP_POOL_SIZE = MUTATION_WORKERS
+HTTP_TIMEOUT = 10.0
+DYNAMODB_POOL_SIZE = 10
+CLIENT_MAX_AGE = 15 * 60
+
 HTTP_HEADERS = {
     "Content-Type": "application/graphql",
     "x-api-key": API_KEY,
     "cache-control": "no-cache",
 }
 
+# game codes are the scrambled value of a counter kept in the game table, see
+# daifugo.ids, every length has its own code space
 ID_CHARS = string.ascii_uppercase
-ID_LENGTH = 4
+ID_LENGTH = int(os.environ.get("ID_LENGTH", 4))
+# counter values reserved per update, a warm Lambda hands out the rest locally
+ID_BLOCK_SIZE = int(os.environ.get("ID_BLOCK_SIZE", 1))
+ID_COUNTER_KEY = "#GAME_ID_COUNTER"
@@ -1,26 +1,30 @@
 import logging
 
-import boto3
-from daifugo.common import generate_unique_game_id
-from daifugo.constants import GAME_TABLE
+from daifugo.common import get_dynamodb, put_snapshot
+from daifugo.ids import allocate_game_id, get_allocator
 from daifugo.model import Game
+from daifugo.tracing import annotate, handler_trace
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# fails the cold start rather than the first createGame without ID_SCRAMBLE_KEY
+get_allocator()
 
+
+@handler_trace("create_game")
 def create_game_handler(event, context):
-    dynamodb = boto3.resource("dynamodb")
-    game_id = generate_unique_game_id(dynamodb)
+    dynamodb = get_dynamodb()
+
+    # the game table item is written by the allocator when it claims the code
+    game_id = allocate_game_id(
+        dynamodb, lambda game_id: {**Game(game_id, "", True, []).__dict__}
+    )
 
     logger.info(game_id)
+    annotate(game_id=game_id)
 
     game = Game(game_id, "", True, [])
-
-    table = dynamodb.Table(GAME_TABLE)
-    response = table.put_item(Item={**game.__dict__})
-
-    status_code = response["ResponseMetadata"]["HTTPStatusCode"]
-    assert status_code == 200, status_code
+    put_snapshot(game_id, [game], dynamodb)
 
     return game.__dict__
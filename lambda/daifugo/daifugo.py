@@ -1,8 +1,17 @@
-from typing import List, Optional, Tuple
+import itertools
+from typing import Iterator, List, Optional, Tuple
 
+from .cards import (EIGHT, FIVE, JACK, N_RANKS, N_SUITS, NINE, SEVEN, SIX,
+                    SUIT_SUBSETS, TEN, THREE, TWO, ids_of, mask_of, rank_group)
 from .common import InvalidPlayError
-from .constants import DOWN, RANKS, UP
-from .model import Card, CardSet, Discards, GameState, Hand, Pattern, Player
+from .constants import DOWN, UP
+from .model import (Card, CardSet, Discards, GameState, Hand, Move, Pattern,
+                    Player, cards_mask, decode_cards)
+from .tracing import span
+
+# (cards, discards) bitmasks of a move, no cards is a pass
+MoveMasks = Tuple[int, int]
+PASS: MoveMasks = (0, 0)
 
 
 class PatternResolver:
@@ -10,13 +19,11 @@ class PatternResolver:
 
     @staticmethod
     def is_suited(cards: CardSet, top_of_pile: CardSet) -> bool:
-        return len(top_of_pile) and cards.suits == top_of_pile.suits
+        return len(top_of_pile) and cards.suit_mask == top_of_pile.suit_mask
 
     @staticmethod
     def is_run(cards: CardSet, top_of_pile: CardSet) -> bool:
-        return (
-            len(top_of_pile) and abs(RANKS[cards.rank] - RANKS[top_of_pile.rank]) == 1
-        )
+        return len(top_of_pile) and abs(cards.rank_value - top_of_pile.rank_value) == 1
 
     @classmethod
     def resolve(cls, cards: CardSet, top_of_pile: CardSet) -> Optional[Pattern]:
@@ -51,9 +58,16 @@ class Validator:
 
     @staticmethod
     def pre_validate(cards: CardSet):
-        if not len({card.rank for card in cards.cards}) == 1:
+        if not cards.is_single_rank:
             raise InvalidPlayError(f"More than one rank")
 
+    @staticmethod
+    def validate_ownership(hand: Hand, cards: CardSet, discards: int):
+        if cards.mask & discards:
+            raise InvalidPlayError("Cannot play and discard the same card")
+        if (cards.mask | discards) & ~hand.mask:
+            raise InvalidPlayError("Cards not in hand")
+
     @classmethod
     def validate(
         cls,
@@ -62,7 +76,7 @@ class Validator:
         direction: bool,
         active_pattern: Optional[Pattern],
         infered_pattern: Optional[Pattern],
-        discards: List[Card],
+        discards: int,
     ):
         if not cls.validate_rank(cards, top_of_pile, direction):
             raise InvalidPlayError("Invalid Rank")
@@ -74,13 +88,13 @@ class Validator:
             raise InvalidPlayError(f"Invalid discard set")
 
     @staticmethod
-    def validate_discards(cards: CardSet, discards: List[Card]) -> bool:
-        rank = cards.rank
-        if discards and rank not in ["7", "10"]:
+    def validate_discards(cards: CardSet, discards: int) -> bool:
+        rank = cards.rank_value
+        if discards and rank != SEVEN and rank != TEN:
             return False
 
         # also need to check if its less but you could potentially end a trick with less discarded
-        if len(discards) > len(cards):
+        if discards.bit_count() > len(cards):
             return False
 
         return True
@@ -95,9 +109,9 @@ class Validator:
         #     return self._cards.rank == 3 and self._cards.suits == {"Spade"}
 
         if direction == UP:
-            return RANKS[cards.rank] > RANKS[top_of_pile.rank]
+            return cards.rank_value > top_of_pile.rank_value
         else:
-            return RANKS[cards.rank] < RANKS[top_of_pile.rank]
+            return cards.rank_value < top_of_pile.rank_value
 
     @staticmethod
     def validate_size(
@@ -131,8 +145,8 @@ class StateResolver:
         cards: CardSet, direction: bool, revolution: bool
     ) -> Tuple[bool, bool]:
         # only supports single deck right now
-        card_rank = cards.rank
-        if card_rank == "Jack" and len(cards) % 2 == 1:
+        card_rank = cards.rank_value
+        if card_rank == JACK and len(cards) % 2 == 1:
             direction = not direction
         elif len(cards) == 4:
             direction = not direction
@@ -148,29 +162,30 @@ class StateResolver:
 
         next_player_idx = -1
         new_trick = False
+        rank = cards.rank_value
 
-        if cards.rank == "8":
+        if rank == EIGHT:
             next_player_idx = active_player_idx
             new_trick = True
 
-        elif cards.rank == "9" and len(cards) == 2:
+        elif rank == NINE and len(cards) == 2:
             next_player_idx = active_player_idx
             new_trick = True
 
-        elif cards.rank == "6" and len(cards) == 3:
+        elif rank == SIX and len(cards) == 3:
             next_player_idx = active_player_idx
             new_trick = True
 
         # this will change when we reintroduce jokers
-        elif cards.rank == "2":
+        elif rank == TWO:
             next_player_idx = active_player_idx
             new_trick = True
 
-        elif direction == DOWN and cards.rank == "3":
+        elif direction == DOWN and rank == THREE:
             next_player_idx = active_player_idx
             new_trick = True
 
-        elif cards.rank == "5":
+        elif rank == FIVE:
             next_player_idx = active_player_idx
             for _ in range(len(cards) + 1):
                 next_player_idx = StateResolver.get_next_active_player_idx(
@@ -206,17 +221,17 @@ class StateResolver:
                 return next_idx
 
     @staticmethod
-    def resolve_discards(cards: CardSet, discards: List[Card]) -> Optional[Discards]:
-        rank = cards.rank
+    def resolve_discards(cards: CardSet, discards: int) -> Optional[Discards]:
+        rank = cards.rank_value
 
-        to_forward = []
-        to_pot = cards.cards[::]
+        to_forward = 0
+        to_pot = cards.mask
 
-        if rank == "7":
+        if rank == SEVEN:
             to_forward = discards
 
-        if rank == "10":
-            to_pot += discards
+        if rank == TEN:
+            to_pot |= discards
 
         return Discards(to_pot, to_forward)
 
@@ -230,16 +245,11 @@ class StateResolver:
         current_hand = hands[active_player_idx]
         next_hand = hands[next_player_idx]
 
-        for card in discards.to_pot:
-            current_hand.cards.remove(card)
-
-        for card in discards.to_forward:
-            current_hand.cards.remove(card)
-
+        current_hand.mask &= ~(discards.to_pot | discards.to_forward)
         ret = [current_hand]
 
         if discards.to_forward:
-            next_hand.cards += discards.to_forward
+            next_hand.mask |= discards.to_forward
             ret.append(next_hand)
 
         return ret
@@ -278,6 +288,13 @@ class StateResolver:
         if next_player_idx == prev_game_state.last_played_idx:
             new_trick = True
             new_players = StateResolver.resolve_new_trick(players)
+        elif players[next_player_idx].has_passed:
+            # the last player to play went out and everyone left has passed
+            new_trick = True
+            new_players = StateResolver.resolve_new_trick(players)
+            next_player_idx = StateResolver.get_next_active_player_idx(
+                prev_game_state.last_played_idx, players
+            )
         else:
             # coule get double reference if we just added it above
             new_players = [current_player]
@@ -287,7 +304,7 @@ class StateResolver:
                 id=prev_game_state.id,
                 game_id=prev_game_state.game_id,
                 active_player_idx=next_player_idx,
-                active_player_id=current_player.id,
+                active_player_id=players[next_player_idx].id,
                 last_played_idx=prev_game_state.last_played_idx,
                 _top_of_pile=prev_game_state._top_of_pile if not new_trick else [],
                 pot_size=prev_game_state.pot_size,
@@ -298,6 +315,7 @@ class StateResolver:
                 direction=prev_game_state.direction
                 if not new_trick
                 else (UP if not prev_game_state.revolution else DOWN),
+                version=prev_game_state.version + 1,
             ),
             list(),
             new_players,
@@ -315,40 +333,50 @@ def play_cards(
     current_player = players[prev_game_state.active_player_idx]
 
     if not len(cards):
-        return StateResolver.resolve_skip(current_player, prev_game_state, players)
+        with span("play_cards.resolve"):
+            return StateResolver.resolve_skip(current_player, prev_game_state, players)
 
-    Validator.pre_validate(cards)
+    with span("play_cards.validate"):
+        Validator.pre_validate(cards)
 
-    infered_pattern = PatternResolver.resolve(cards, prev_game_state.top_of_pile)
-
-    if prev_game_state.top_of_pile is not None and len(prev_game_state.top_of_pile):
-        Validator.validate(
-            cards,
-            prev_game_state.top_of_pile,
-            prev_game_state.direction,
-            prev_game_state.active_pattern,
-            infered_pattern,
-            discards,
+        # encode once at the edge, everything below works on card bitmasks
+        top_of_pile = prev_game_state.top_of_pile
+        discard_mask = cards_mask(discards)
+        Validator.validate_ownership(
+            hands[prev_game_state.active_player_idx], cards, discard_mask
         )
 
-    discards = StateResolver.resolve_discards(cards, discards)
-    next_player_idx, new_trick = StateResolver.resolve_next_player(
-        cards, prev_game_state.active_player_idx, players, prev_game_state.direction
-    )
+        infered_pattern = PatternResolver.resolve(cards, top_of_pile)
 
-    new_direction, new_revolution = StateResolver.resolve_direction(
-        cards, prev_game_state.direction, prev_game_state.revolution
-    )
-    new_active_pattern = infered_pattern
+        if len(top_of_pile):
+            Validator.validate(
+                cards,
+                top_of_pile,
+                prev_game_state.direction,
+                prev_game_state.active_pattern,
+                infered_pattern,
+                discard_mask,
+            )
 
-    new_hands = StateResolver.resolve_hands(
-        hands, discards, prev_game_state.active_player_idx, next_player_idx
-    )
-    new_player = StateResolver.resolve_rank(current_player, players, new_hands[0])
-    new_players = [new_player] if new_player else []
+    with span("play_cards.resolve"):
+        discards = StateResolver.resolve_discards(cards, discard_mask)
+        next_player_idx, new_trick = StateResolver.resolve_next_player(
+            cards, prev_game_state.active_player_idx, players, prev_game_state.direction
+        )
 
-    if new_trick:
-        new_players += StateResolver.resolve_new_trick(players)
+        new_direction, new_revolution = StateResolver.resolve_direction(
+            cards, prev_game_state.direction, prev_game_state.revolution
+        )
+        new_active_pattern = infered_pattern
+
+        new_hands = StateResolver.resolve_hands(
+            hands, discards, prev_game_state.active_player_idx, next_player_idx
+        )
+        new_player = StateResolver.resolve_rank(current_player, players, new_hands[0])
+        new_players = [new_player] if new_player else []
+
+        if new_trick:
+            new_players += StateResolver.resolve_new_trick(players)
 
     return (
         GameState(
@@ -364,7 +392,116 @@ def play_cards(
             direction=new_direction
             if not new_trick
             else (UP if not new_revolution else DOWN),
+            version=prev_game_state.version + 1,
         ),
         new_hands,
         new_players,
     )
+
+
+class MoveGenerator:
+    """
+    Enumerates legal plays as (cards, discards) bitmask pairs by grouping the
+    hand by rank and filtering the groups with the same rules as Validator
+    """
+
+    @staticmethod
+    def candidate_ranks(top_of_pile: CardSet, direction: bool) -> range:
+        if not len(top_of_pile):
+            return range(N_RANKS + 1)
+
+        if direction == UP:
+            return range(top_of_pile.rank_value + 1, N_RANKS + 1)
+        else:
+            return range(0, top_of_pile.rank_value)
+
+    @staticmethod
+    def candidate_suits(
+        rank: int,
+        suits: int,
+        size: int,
+        top_of_pile: CardSet,
+        active_pattern: Optional[Pattern],
+    ) -> Tuple[int, ...]:
+        if active_pattern is None or active_pattern == Pattern.NONE:
+            return SUIT_SUBSETS[suits][size]
+
+        if active_pattern in (Pattern.RUN, Pattern.SUITED_RUN):
+            if abs(rank - top_of_pile.rank_value) != 1:
+                return ()
+
+        if active_pattern in (Pattern.SUITED, Pattern.SUITED_RUN):
+            top_suits = top_of_pile.suit_mask
+            return (top_suits,) if top_suits & suits == top_suits else ()
+
+        return SUIT_SUBSETS[suits][size]
+
+    @staticmethod
+    def discard_masks(rank: int, size: int, rest: int) -> Iterator[int]:
+        yield 0
+
+        if rank != SEVEN and rank != TEN:
+            return
+
+        rest_ids = ids_of(rest)
+        for n_discards in range(1, min(size, len(rest_ids)) + 1):
+            for discards in itertools.combinations(rest_ids, n_discards):
+                yield mask_of(discards)
+
+    @classmethod
+    def generate(
+        cls, hand_mask: int, game_state: GameState
+    ) -> Iterator[Tuple[int, int]]:
+        top_of_pile = game_state.top_of_pile
+        new_trick = not len(top_of_pile)
+
+        for rank in cls.candidate_ranks(top_of_pile, game_state.direction):
+            suits = rank_group(hand_mask, rank)
+            if not suits:
+                continue
+
+            sizes = (
+                range(1, suits.bit_count() + 1) if new_trick else (len(top_of_pile),)
+            )
+            for size in sizes:
+                if size > N_SUITS:
+                    continue
+
+                if new_trick:
+                    suit_sets = SUIT_SUBSETS[suits][size]
+                else:
+                    suit_sets = cls.candidate_suits(
+                        rank, suits, size, top_of_pile, game_state.active_pattern
+                    )
+
+                for suit_set in suit_sets:
+                    cards_mask = suit_set << (rank * N_SUITS)
+                    rest = hand_mask & ~cards_mask
+                    for discards_mask in cls.discard_masks(rank, size, rest):
+                        yield cards_mask, discards_mask
+
+
+def legal_move_masks(hand_mask: int, game_state: GameState) -> List[Tuple[int, int]]:
+    return list(MoveGenerator.generate(hand_mask, game_state))
+
+
+def candidate_moves(hand_mask: int, game_state: GameState) -> List[MoveMasks]:
+    """
+    The moves searches consider, legal plays plus passing unless the seat leads
+    a trick it can play to, so every trick ends and searches cannot loop
+    """
+    moves = legal_move_masks(hand_mask, game_state) if hand_mask else []
+    if game_state.new_trick and moves:
+        return moves
+
+    return [*moves, PASS]
+
+
+def legal_moves(hand: Hand, game_state: GameState) -> List[Move]:
+    """
+    Every legal non-pass play for ``hand``, passing is always allowed
+    """
+    return [
+        Move(CardSet(mask=cards_mask), decode_cards(ids_of(discards_mask)))
+        for cards_mask, discards_mask in MoveGenerator.generate(hand.mask, game_state)
+    ]
@@ -0,0 +1,208 @@
+"""
+Compact per-move updates for subscribers. A delta carries only what a move
+changed, cards are plain ids from ``daifugo.cards`` and ``seq`` is the version
+of the state the move produced so a follower can spot a missed update.
+
+A ``GameDelta`` goes to everyone following the game and only carries what the
+table can see, the cards sent to the pot and how many cards each hand holds.
+The cards that left or joined a hand go out as a ``HandDelta`` per hand, to
+the subscribers of that hand id.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from .cards import ids_of, mask_of
+from .model import GameState, Hand, Pattern, Player, encode_cards
+
+# state fields a delta may carry, everything else about the state is fixed
+STATE_FIELDS = (
+    "active_player_idx",
+    "active_player_id",
+    "last_played_idx",
+    "top_of_pile",
+    "pot_size",
+    "active_pattern",
+    "revolution",
+    "direction",
+)
+
+
+class ResyncRequired(Exception):
+    pass
+
+
+@dataclass
+class HandDelta:
+    id: str
+    seq: int
+    removed: int
+    added: int
+
+    def to_json(self) -> Dict:
+        return dict(
+            id=self.id,
+            seq=self.seq,
+            removed=list(ids_of(self.removed)),
+            added=list(ids_of(self.added)),
+        )
+
+    @classmethod
+    def from_json(cls, json_obj) -> "HandDelta":
+        return cls(
+            json_obj["id"],
+            int(json_obj["seq"]),
+            mask_of(json_obj["removed"]),
+            mask_of(json_obj["added"]),
+        )
+
+
+@dataclass
+class GameDelta:
+    game_id: str
+    seq: int
+    # the cards the move sent to the pot, as a mask
+    played: int = 0
+    # the number of cards in each hand the move changed
+    hand_sizes: Dict[str, int] = field(default_factory=dict)
+    players: List[Dict] = field(default_factory=list)
+    # changed state fields only, top_of_pile as card ids
+    state: Dict[str, Any] = field(default_factory=dict)
+
+    def to_json(self) -> Dict:
+        return dict(
+            game_id=self.game_id,
+            seq=self.seq,
+            played=list(ids_of(self.played)),
+            hand_sizes=[dict(id=id, size=size) for id, size in self.hand_sizes.items()],
+            players=self.players,
+            **self.state,
+        )
+
+    @classmethod
+    def from_json(cls, json_obj) -> "GameDelta":
+        return cls(
+            json_obj["game_id"],
+            int(json_obj["seq"]),
+            mask_of(json_obj.get("played") or []),
+            {hand["id"]: hand["size"] for hand in json_obj.get("hand_sizes") or []},
+            list(json_obj.get("players") or []),
+            {
+                key: json_obj[key]
+                for key in STATE_FIELDS
+                if json_obj.get(key) is not None
+            },
+        )
+
+
+def state_fields(state: GameState) -> Dict[str, Any]:
+    return dict(
+        active_player_idx=state.active_player_idx,
+        active_player_id=state.active_player_id,
+        last_played_idx=state.last_played_idx,
+        top_of_pile=encode_cards(state._top_of_pile),
+        pot_size=state.pot_size,
+        # a missing pattern goes out as "None", a delta field can not be cleared
+        active_pattern=(state.active_pattern or Pattern.NONE).value,
+        revolution=state.revolution,
+        direction=state.direction,
+    )
+
+
+def diff_move(
+    prev_state: GameState,
+    next_state: GameState,
+    prev_masks: Dict[str, int],
+    new_hands: List[Hand],
+    new_players: List[Player],
+) -> Tuple[GameDelta, List[HandDelta]]:
+    """
+    What a ``play_cards`` call changed, ``prev_masks`` are the hand masks from
+    before the call since ``play_cards`` updates the hands in place
+    """
+    seq = next_state.version
+    hands = []
+    for hand in new_hands:
+        prev_mask = prev_masks[hand.id]
+        hands.append(
+            HandDelta(hand.id, seq, prev_mask & ~hand.mask, hand.mask & ~prev_mask)
+        )
+
+    # a card forwarded by a 7 left one hand and joined another
+    removed = added = 0
+    for hand in hands:
+        removed |= hand.removed
+        added |= hand.added
+
+    players = [
+        dict(id=player.id, rank=player.rank, has_passed=player.has_passed)
+        for player in new_players
+    ]
+
+    prev_fields = state_fields(prev_state)
+    state = {
+        key: value
+        for key, value in state_fields(next_state).items()
+        if value != prev_fields[key]
+    }
+
+    game = GameDelta(
+        next_state.game_id,
+        seq,
+        removed & ~added,
+        {hand.id: len(hand) for hand in new_hands},
+        players,
+        state,
+    )
+    return game, hands
+
+
+class DeltaFollower:
+    """
+    Client side view of a game kept up to date from deltas. A gap in ``seq``
+    raises ``ResyncRequired``, the caller reloads the game and calls ``reset``.
+    Hand deltas only arrive for the moves that touch a hand, ``apply_hand``
+    skips the ones older than what the follower has.
+    """
+
+    def __init__(self, state: GameState, hands: List[Hand]):
+        self.reset(state, hands)
+
+    def reset(self, state: GameState, hands: List[Hand]):
+        self.seq = state.version
+        self.state = state_fields(state)
+        self.hands = {hand.id: hand.mask for hand in hands}
+        self.hand_seqs = {hand.id: state.version for hand in hands}
+        self.hand_sizes: Dict[str, int] = {}
+        self.players: Dict[str, Dict] = {}
+
+    def apply(self, delta: GameDelta) -> bool:
+        """Returns False for a delta that was already applied"""
+        if delta.seq <= self.seq:
+            return False
+        if delta.seq != self.seq + 1:
+            raise ResyncRequired(f"Expected seq {self.seq + 1}, got {delta.seq}")
+
+        self.hand_sizes.update(delta.hand_sizes)
+        for player in delta.players:
+            self.players[player["id"]] = player
+
+        self.state.update(delta.state)
+        self.seq = delta.seq
+        return True
+
+    def apply_hand(self, delta: HandDelta) -> bool:
+        """Returns False for a delta that was already applied"""
+        # only the hands this follower was reset with are tracked
+        if delta.seq <= self.hand_seqs.get(delta.id, delta.seq):
+            return False
+
+        mask = self.hands[delta.id]
+        self.hands[delta.id] = (mask & ~delta.removed) | delta.added
+        self.hand_seqs[delta.id] = delta.seq
+        return True
+
+    def hand(self, hand_id: str) -> Optional[Hand]:
+        if hand_id not in self.hands:
+            return None
+
+        return Hand(hand_id, mask=self.hands[hand_id])
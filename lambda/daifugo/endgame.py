@@ -0,0 +1,259 @@
+"""
+Exact solver for small endgames, at most ``ENDGAME_MAX_PLAYERS`` players still
+in with ``ENDGAME_MAX_CARDS`` cards between them, with every hand known. It
+walks the ``play_cards`` transitions and memoizes every position it solves in a
+transposition table with LRU eviction, shared across calls so a later position
+of the same endgame is mostly a lookup.
+
+Positions are keyed canonically: only whether a seat is out matters, not its
+rank, and the seats are rotated so the active seat is seat 0.
+"""
+import math
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import FrozenSet, List, Optional, Sequence, Tuple
+
+from .cards import ids_of
+from .constants import (ENDGAME_MAX_CARDS, ENDGAME_MAX_PLAYERS,
+                        ENDGAME_TABLE_SIZE)
+from .daifugo import MoveMasks, candidate_moves, play_cards
+from .model import CardSet, GameState, Hand, Pattern, Player, decode_cards
+
+# (hand masks, passed flags, out flags, last played seat, top of pile mask,
+# active pattern, direction, revolution), the active seat is always seat 0
+Position = Tuple[
+    Tuple[int, ...],
+    Tuple[bool, ...],
+    Tuple[bool, ...],
+    int,
+    int,
+    Optional[Pattern],
+    bool,
+    bool,
+]
+
+# finishing orders from a position of the seats still in, in canonical seats
+Entry = Tuple[FrozenSet[Tuple[int, ...]], Tuple[int, ...], Optional[MoveMasks]]
+
+
+@dataclass(frozen=True)
+class EndgameResult:
+    # every finish order some line of play reaches, seats already out first
+    finish_orders: FrozenSet[Tuple[int, ...]]
+    # the order when every seat plays for its own best finish
+    finish_order: Tuple[int, ...]
+    best_move: Optional[MoveMasks]
+
+    @property
+    def forced(self) -> bool:
+        """True if the finish order no longer depends on how anyone plays"""
+        return len(self.finish_orders) == 1
+
+
+def is_endgame(players: Sequence[Player], hand_sizes: Sequence[int]) -> bool:
+    remaining = [size for player, size in zip(players, hand_sizes) if not player.is_out]
+    return len(remaining) <= ENDGAME_MAX_PLAYERS and sum(remaining) <= ENDGAME_MAX_CARDS
+
+
+def rotate(values: Sequence, shift: int) -> tuple:
+    return tuple(values[shift:]) + tuple(values[:shift])
+
+
+class EndgameSolver:
+    def __init__(self, max_size: int = ENDGAME_TABLE_SIZE):
+        self.max_size = max_size
+        self.table: "OrderedDict[Position, Entry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def canonical(
+        hands: Sequence[int],
+        passed: Sequence[bool],
+        out: Sequence[bool],
+        active: int,
+        last_played: int,
+        top_mask: int,
+        pattern: Optional[Pattern],
+        direction: bool,
+        revolution: bool,
+    ) -> Position:
+        n_seats = len(hands)
+        return (
+            rotate(hands, active),
+            rotate(passed, active),
+            rotate(out, active),
+            (last_played - active) % n_seats if last_played >= 0 else -1,
+            top_mask,
+            pattern if pattern != Pattern.NONE else None,
+            direction,
+            revolution,
+        )
+
+    @staticmethod
+    def engine_state(position: Position) -> Tuple[GameState, List[Player], List[Hand]]:
+        (
+            hands,
+            passed,
+            out,
+            last_played,
+            top_mask,
+            pattern,
+            direction,
+            revolution,
+        ) = position
+        players = [
+            Player(str(seat), "", "", str(seat), passed[seat], 0 if out[seat] else -1)
+            for seat in range(len(hands))
+        ]
+        game_state = GameState(
+            id="",
+            game_id="",
+            active_player_idx=0,
+            active_player_id="0",
+            last_played_idx=last_played,
+            _top_of_pile=decode_cards(ids_of(top_mask)),
+            pot_size=0,
+            active_pattern=pattern or Pattern.NONE,
+            revolution=revolution,
+            direction=direction,
+        )
+        return (
+            game_state,
+            players,
+            [Hand(str(seat), mask=mask) for seat, mask in enumerate(hands)],
+        )
+
+    def apply(self, position: Position, move: MoveMasks) -> Tuple[Position, int, bool]:
+        """The canonical child position, its seat shift and whether seat 0 went out"""
+        game_state, players, hands = self.engine_state(position)
+        cards, discards = move
+        game_state, _, _ = play_cards(
+            game_state,
+            CardSet(mask=cards),
+            decode_cards(ids_of(discards)) if discards else [],
+            players,
+            hands,
+        )
+
+        shift = game_state.active_player_idx
+        child = self.canonical(
+            [hand.mask for hand in hands],
+            [player.has_passed for player in players],
+            [player.is_out for player in players],
+            shift,
+            game_state.last_played_idx,
+            game_state.top_of_pile.mask,
+            game_state.active_pattern,
+            game_state.direction,
+            game_state.revolution,
+        )
+        return child, shift, players[0].is_out and not position[2][0]
+
+    def solve_position(self, position: Position) -> Entry:
+        entry = self.table.get(position)
+        if entry is not None:
+            self.hits += 1
+            self.table.move_to_end(position)
+            return entry
+
+        self.misses += 1
+        hands, _, out = position[:3]
+        n_seats = len(hands)
+        remaining = tuple(seat for seat in range(n_seats) if not out[seat])
+
+        if len(remaining) <= 1:
+            entry = (frozenset([remaining]), remaining, None)
+        else:
+            game_state = self.engine_state(position)[0]
+            orders = set()
+            n_orders = math.factorial(len(remaining))
+            best_order, best_move, best_place = None, None, 0
+            # shedding the most cards first tends to find a first place early
+            moves = sorted(
+                candidate_moves(hands[0], game_state),
+                key=lambda move: -(move[0] | move[1]).bit_count(),
+            )
+            for move in moves:
+                child, shift, went_out = self.apply(position, move)
+                child_orders, child_order, _ = self.solve_position(child)
+
+                prefix = (0,) if went_out else ()
+                for order in child_orders:
+                    orders.add(prefix + tuple((s + shift) % n_seats for s in order))
+
+                order = prefix + tuple((s + shift) % n_seats for s in child_order)
+                # seat 0 plays for its own earliest finish, ties keep move order,
+                # a seat that is already out only passes
+                place = order.index(0) if 0 in order else 0
+                if best_order is None or place < best_place:
+                    best_order, best_move, best_place = order, move, place
+
+                # no later move can add an order or beat first place
+                if len(orders) == n_orders and best_place == 0:
+                    break
+
+            entry = (frozenset(orders), best_order, best_move)
+
+        self.table[position] = entry
+        if len(self.table) > self.max_size:
+            self.table.popitem(last=False)
+
+        return entry
+
+    def solve(
+        self, game_state: GameState, players: Sequence[Player], hands: Sequence[Hand]
+    ) -> EndgameResult:
+        if not is_endgame(players, [len(hand) for hand in hands]):
+            raise ValueError("Position is too large to solve exactly")
+
+        active = game_state.active_player_idx
+        position = self.canonical(
+            [hand.mask for hand in hands],
+            [player.has_passed for player in players],
+            [player.is_out for player in players],
+            active,
+            game_state.last_played_idx,
+            game_state.top_of_pile.mask,
+            game_state.active_pattern,
+            game_state.direction,
+            game_state.revolution,
+        )
+        orders, order, move = self.solve_position(position)
+
+        n_seats = len(players)
+        finished = tuple(
+            sorted(
+                (seat for seat, player in enumerate(players) if player.is_out),
+                key=lambda seat: players[seat].rank,
+            )
+        )
+
+        def absolute(order: Tuple[int, ...]) -> Tuple[int, ...]:
+            return finished + tuple((seat + active) % n_seats for seat in order)
+
+        return EndgameResult(
+            frozenset(absolute(order) for order in orders), absolute(order), move
+        )
+
+
+_solver: Optional[EndgameSolver] = None
+
+
+def get_solver() -> EndgameSolver:
+    """The solver of this process, its table is kept across calls"""
+    global _solver
+    if _solver is None:
+        _solver = EndgameSolver()
+
+    return _solver
+
+
+def solve_endgame(
+    game_state: GameState, players: Sequence[Player], hands: Sequence[Hand]
+) -> Optional[EndgameResult]:
+    """The exact result of a small enough position, None for larger ones"""
+    if not is_endgame(players, [len(hand) for hand in hands]):
+        return None
+
+    return get_solver().solve(game_state, players, hands)
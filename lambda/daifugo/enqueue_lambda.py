@@ -0,0 +1,48 @@
+import logging
+
+from .common import get_dynamodb, get_http_client
+from .constants import MATCH_VARIANTS
+from .ids import get_allocator
+from .matchmaking import MatchQueue, notify_members
+from .tracing import annotate, handler_trace
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# seating a table allocates a game code, see create_game_lambda
+get_allocator()
+
+
+@handler_trace("enqueue")
+def enqueue_handler(event, context):
+    """
+    Queues a player for a table and seats every table its queue can fill. The
+    ticket comes back seated if it made it into one, otherwise the player
+    learns its seat from the matched subscription, made before the enqueue
+    under the id the client passed, or from the ticket query.
+    """
+    logger.info(event)
+
+    arguments = event["arguments"]
+    dynamodb = get_dynamodb()
+    queue = MatchQueue(dynamodb)
+
+    ticket = queue.enqueue(
+        arguments["player_name"],
+        int(arguments["table_size"]),
+        arguments.get("variant") or MATCH_VARIANTS[0],
+        int(arguments.get("skill_band") or 0),
+        arguments.get("id"),
+    )
+    annotate(players=ticket.table_size)
+
+    tables = queue.match(ticket.queue, ticket.table_size)
+    annotate(tables=len(tables))
+    notify_members(tables, get_http_client())
+
+    for tickets in tables:
+        for seated in tickets:
+            if seated.id == ticket.id:
+                return seated.to_json()
+
+    return ticket.to_json()
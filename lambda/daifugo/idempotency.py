@@ -0,0 +1,378 @@
+"""
+Client-supplied idempotency keys for joinGame, startGame and playCards. The
+first request with a key claims it with a conditional put under the game's
+``<game_id>#IDEMPOTENCY`` partition of the snapshot table, the response is
+stored on the claim once the handler returns and a retry with the same key gets
+it back without loading the game or posting any mutation. Records carry an
+``expires_at`` the table's TTL deletes them by, and warm containers keep the
+responses they have seen in a ``TTLCache``.
+
+A failed request frees its key for a retry, unless the handler had already
+made durable writes. Those are recorded with ``checkpoint`` as they land, a
+retry with the same key then resumes from ``progress`` instead of writing them
+again.
+"""
+import contextvars
+import functools
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from .common import ConflictError, get_dynamodb
+from .constants import (IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_CLAIM_TTL,
+                        IDEMPOTENCY_PK_SUFFIX, IDEMPOTENCY_TTL, SNAPSHOT_TABLE)
+from .tracing import count
+
+IN_PROGRESS = "IN_PROGRESS"
+COMPLETED = "COMPLETED"
+# failed after a checkpoint, a retry with the same key resumes it
+PARTIAL = "PARTIAL"
+
+
+class RequestInProgress(ConflictError):
+    """A request with the same idempotency key has not finished yet, retry later"""
+
+
+class IdempotencyKeyReused(ValueError):
+    pass
+
+
+class TTLCache:
+    """
+    A bounded mapping whose entries expire ``ttl`` seconds after they were put,
+    the least recently used entry is evicted once ``max_size`` is reached
+    """
+
+    def __init__(
+        self,
+        ttl: float = IDEMPOTENCY_TTL,
+        max_size: int = IDEMPOTENCY_CACHE_SIZE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        # key -> (expires at, value)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= self.clock():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires_at = self.clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+
+        return default if entry is None else entry[1]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def request_hash(arguments: Dict) -> str:
+    """The arguments a key was first used with, without the key itself"""
+    arguments = {k: v for k, v in arguments.items() if k != "idempotency_key"}
+    return hashlib.sha256(
+        json.dumps(arguments, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class IdempotencyStore:
+    @staticmethod
+    def partition(game_id: str) -> str:
+        return game_id + IDEMPOTENCY_PK_SUFFIX
+
+    @staticmethod
+    def sort_key(field: str, key: str) -> str:
+        return f"{field}#{key}"
+
+    def __init__(
+        self,
+        dynamodb,
+        ttl: int = IDEMPOTENCY_TTL,
+        claim_ttl: int = IDEMPOTENCY_CLAIM_TTL,
+        cache: Optional[TTLCache] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.table = dynamodb.Table(SNAPSHOT_TABLE)
+        self.ttl = ttl
+        self.claim_ttl = claim_ttl
+        self.cache = cache if cache is not None else TTLCache(ttl)
+        self.clock = clock
+
+    def _key(self, game_id: str, field: str, key: str) -> Dict[str, str]:
+        return dict(game_id=self.partition(game_id), sk=self.sort_key(field, key))
+
+    def _replay(self, record: Dict, hashed: str) -> Dict:
+        if record["request_hash"] != hashed:
+            raise IdempotencyKeyReused(
+                "Idempotency key was already used with different arguments"
+            )
+        return record
+
+    def claim(self, game_id: str, field: str, key: str, hashed: str) -> Optional[Dict]:
+        """
+        Claims ``key`` for a new request and returns None, or returns the
+        completed record of an earlier request with the same key, with its
+        ``response``. An earlier request that failed after a checkpoint is
+        taken over and its record comes back with the ``progress`` to resume
+        from. Raises ``RequestInProgress`` while that request is still running.
+        """
+        from botocore.exceptions import ClientError
+
+        cache_key = (game_id, field, key)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return self._replay(cached, hashed)
+
+        now = int(self.clock())
+        item = dict(
+            **self._key(game_id, field, key),
+            status=IN_PROGRESS,
+            request_hash=hashed,
+            expires_at=now + self.claim_ttl,
+        )
+        try:
+            # the TTL deletes expired records lazily, until then they are free
+            # unless a request wrote something under them
+            self.table.put_item(
+                Item=item,
+                ConditionExpression=(
+                    "attribute_not_exists(sk) "
+                    # AND binds tighter than OR
+                    "OR expires_at < :now AND attribute_not_exists(#progress)"
+                ),
+                ExpressionAttributeNames={"#progress": "progress"},
+                ExpressionAttributeValues={":now": now},
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+        else:
+            return None
+
+        record = self.table.get_item(
+            Key=self._key(game_id, field, key), ConsistentRead=True
+        ).get("Item")
+        if record is None or (record["expires_at"] < now and "progress" not in record):
+            # released or expired between the put and the read
+            return self.claim(game_id, field, key, hashed)
+        if record["status"] == PARTIAL or (
+            record["status"] == IN_PROGRESS and record["expires_at"] < now
+        ):
+            # failed or timed out after a checkpoint
+            self._replay(record, hashed)
+            return self._resume(game_id, field, key, record)
+        if record["status"] != COMPLETED:
+            raise RequestInProgress(
+                f"A {field} request with idempotency key {key} is still running"
+            )
+
+        record = dict(
+            request_hash=record["request_hash"],
+            response=json.loads(record["response"]),
+        )
+        self.cache.put(cache_key, record)
+        return self._replay(record, hashed)
+
+    def _resume(self, game_id: str, field: str, key: str, record: Dict) -> Dict:
+        from botocore.exceptions import ClientError
+
+        try:
+            # only one retry takes the request over
+            self.table.put_item(
+                Item=dict(
+                    **self._key(game_id, field, key),
+                    status=IN_PROGRESS,
+                    request_hash=record["request_hash"],
+                    progress=record["progress"],
+                    expires_at=int(self.clock()) + self.claim_ttl,
+                ),
+                ConditionExpression="#status = :status AND expires_at = :expires",
+                ExpressionAttributeNames={"#status": "status"},
+                ExpressionAttributeValues={
+                    ":status": record["status"],
+                    ":expires": record["expires_at"],
+                },
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            raise RequestInProgress(
+                f"A {field} request with idempotency key {key} is still running"
+            ) from e
+
+        count("idempotent_resumes")
+        return dict(
+            request_hash=record["request_hash"],
+            progress=json.loads(record["progress"]),
+        )
+
+    def checkpoint(self, game_id: str, field: str, key: str, progress: Dict):
+        """Records what a claimed request has written so far"""
+        self.table.update_item(
+            Key=self._key(game_id, field, key),
+            UpdateExpression="SET #progress = :progress",
+            ExpressionAttributeNames={"#progress": "progress"},
+            ExpressionAttributeValues={":progress": json.dumps(progress, default=str)},
+        )
+
+    def fail(self, game_id: str, field: str, key: str):
+        """Keeps the claim of a request that failed after a checkpoint"""
+        self.table.update_item(
+            Key=self._key(game_id, field, key),
+            UpdateExpression="SET #status = :status, expires_at = :expires",
+            ExpressionAttributeNames={"#status": "status"},
+            ExpressionAttributeValues={
+                ":status": PARTIAL,
+                ":expires": int(self.clock()) + self.ttl,
+            },
+        )
+
+    def complete(self, game_id: str, field: str, key: str, hashed: str, response):
+        self.table.put_item(
+            Item=dict(
+                **self._key(game_id, field, key),
+                status=COMPLETED,
+                request_hash=hashed,
+                # a JSON string keeps floats and nulls out of the item
+                response=json.dumps(response, default=str),
+                expires_at=int(self.clock()) + self.ttl,
+            )
+        )
+        self.cache.put(
+            (game_id, field, key), dict(request_hash=hashed, response=response)
+        )
+
+    def release(self, game_id: str, field: str, key: str):
+        """Frees the claim of a failed request so a retry can run it again"""
+        self.table.delete_item(Key=self._key(game_id, field, key))
+
+
+_cache = TTLCache()
+
+
+class IdempotentCall:
+    """The claim of the handler call that is running, see ``checkpoint``"""
+
+    def __init__(
+        self,
+        store: IdempotencyStore,
+        game_id: str,
+        field: str,
+        key: str,
+        hashed: str,
+        progress: Dict,
+    ):
+        self.store = store
+        self.game_id = game_id
+        self.field = field
+        self.key = key
+        self.hashed = hashed
+        self.progress = progress
+        self.written = bool(progress)
+        self.completed = False
+
+
+_call: contextvars.ContextVar[Optional[IdempotentCall]] = contextvars.ContextVar(
+    "idempotent_call", default=None
+)
+
+
+def progress() -> Dict:
+    """What an earlier attempt of the running request recorded before it failed"""
+    call = _call.get()
+    return dict(call.progress) if call is not None else {}
+
+
+def checkpoint(**progress):
+    """
+    Records that the running request made durable writes, and what a retry
+    needs to carry on after them. A request without a key does not record
+    anything.
+    """
+    call = _call.get()
+    if call is None:
+        return
+
+    call.progress.update(progress)
+    call.store.checkpoint(call.game_id, call.field, call.key, call.progress)
+    call.written = True
+
+
+def complete(response):
+    """Stores the response of the running request before the handler returns"""
+    call = _call.get()
+    if call is None or call.completed:
+        return
+
+    call.store.complete(call.game_id, call.field, call.key, call.hashed, response)
+    call.completed = True
+
+
+def idempotent(field: str) -> Callable:
+    """
+    Replays the stored response of a handler call whose arguments carry an
+    ``idempotency_key`` that was already used for ``field`` in the same game,
+    requests without a key run as before
+    """
+
+    def decorator(handler: Callable) -> Callable:
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            arguments = event["arguments"]
+            key = arguments.get("idempotency_key")
+            if not key:
+                return handler(event, context)
+
+            game_id = arguments["game_id"].upper()
+            hashed = request_hash(arguments)
+            store = IdempotencyStore(get_dynamodb(), cache=_cache)
+
+            record = store.claim(game_id, field, key, hashed)
+            if record is not None and "response" in record:
+                count("idempotent_replays")
+                return record["response"]
+
+            call = IdempotentCall(
+                store, game_id, field, key, hashed, record["progress"] if record else {}
+            )
+            token = _call.set(call)
+            try:
+                response = handler(event, context)
+                complete(response)
+            except BaseException:
+                # a retry runs a request again only if nothing was written
+                if call.written and not call.completed:
+                    store.fail(game_id, field, key)
+                elif not call.completed:
+                    store.release(game_id, field, key)
+                raise
+            finally:
+                _call.reset(token)
+
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,186 @@
+"""
+Game codes without collisions or retry loops. Every code is the next value of
+a counter, scrambled by a keyed permutation of the code space so consecutive
+games do not get neighbouring codes. The key is a secret, ``ID_SCRAMBLE_KEY``,
+with no default: codes are all that gates joinGame, and a public key would let
+anyone list the codes of live games from the counter. Claiming a code is a
+put-if-absent, which only retries over codes still taken by games from the old
+random scheme or, once the counter wraps around, by games the sweeper has not
+deleted yet.
+"""
+import logging
+import os
+import threading
+from typing import Callable, Dict, Optional
+
+from .constants import (GAME_TABLE, ID_BLOCK_SIZE, ID_CHARS, ID_COUNTER_KEY,
+                        ID_LENGTH)
+from .tracing import count
+
+logger = logging.getLogger(__name__)
+
+FEISTEL_ROUNDS = 4
+
+
+class IdSpaceExhausted(RuntimeError):
+    pass
+
+
+class MissingScrambleKey(RuntimeError):
+    pass
+
+
+def scramble_key() -> int:
+    """``ID_SCRAMBLE_KEY`` from the environment, there is no default"""
+    key = os.environ.get("ID_SCRAMBLE_KEY")
+    if not key:
+        raise MissingScrambleKey(
+            "ID_SCRAMBLE_KEY is not set, game codes would be predictable"
+        )
+
+    return int(key, 0)
+
+
+def id_space(length: int = ID_LENGTH, chars: str = ID_CHARS) -> int:
+    return len(chars) ** length
+
+
+def _feistel(value: int, half_bits: int, key: int) -> int:
+    mask = (1 << half_bits) - 1
+    left, right = value >> half_bits, value & mask
+    for i in range(FEISTEL_ROUNDS):
+        round_key = (key * (2 * i + 1) * 0x9E3779B1) & 0xFFFFFFFF
+        mixed = ((right * 0x45D9F3B) ^ round_key ^ (right >> 3)) & mask
+        left, right = right, left ^ mixed
+
+    return (left << half_bits) | right
+
+
+def scramble(index: int, space: int, key: Optional[int] = None) -> int:
+    """
+    A bijection on ``range(space)``, a Feistel network on the smallest even
+    number of bits that covers the space, cycle walked back into range
+    """
+    if not 0 <= index < space:
+        raise IdSpaceExhausted(f"Index {index} is outside a space of {space}")
+    if key is None:
+        key = scramble_key()
+
+    half_bits = max((space - 1).bit_length() + 1, 2) // 2
+    value = _feistel(index, half_bits, key)
+    while value >= space:
+        value = _feistel(value, half_bits, key)
+
+    return value
+
+
+def encode_id(value: int, length: int = ID_LENGTH, chars: str = ID_CHARS) -> str:
+    ret = []
+    for _ in range(length):
+        value, digit = divmod(value, len(chars))
+        ret.append(chars[digit])
+
+    return "".join(reversed(ret))
+
+
+def game_code(
+    index: int,
+    length: int = ID_LENGTH,
+    chars: str = ID_CHARS,
+    key: Optional[int] = None,
+) -> str:
+    """The code of the ``index``-th game, distinct for every index in the space"""
+    return encode_id(scramble(index, id_space(length, chars), key), length, chars)
+
+
+class GameIdAllocator:
+    """
+    Hands out counter values from blocks reserved with an atomic ADD on the
+    counter item, then claims the scrambled code with a conditional put
+    """
+
+    def __init__(
+        self,
+        table_name: str = GAME_TABLE,
+        length: int = ID_LENGTH,
+        block_size: int = ID_BLOCK_SIZE,
+        max_attempts: int = 100,
+        key: Optional[int] = None,
+    ):
+        # read up front so a process without the key fails when it starts
+        self.key = scramble_key() if key is None else key
+        self.table_name = table_name
+        self.length = length
+        self.block_size = block_size
+        self.max_attempts = max_attempts
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def reserve_block(self, dynamodb) -> int:
+        data = dynamodb.Table(self.table_name).update_item(
+            Key={"id": ID_COUNTER_KEY},
+            UpdateExpression="ADD #value :block",
+            ExpressionAttributeNames={"#value": "value"},
+            ExpressionAttributeValues={":block": self.block_size},
+            ReturnValues="UPDATED_NEW",
+        )
+        end = int(data["Attributes"]["value"])
+        return end - self.block_size
+
+    def next_index(self, dynamodb) -> int:
+        with self._lock:
+            if self._next >= self._end:
+                self._next = self.reserve_block(dynamodb)
+                self._end = self._next + self.block_size
+
+            index = self._next
+            self._next += 1
+
+        # the counter wraps around the code space, codes of games the sweeper
+        # deleted are free again and the put skips those still taken
+        return index % id_space(self.length)
+
+    def allocate(self, dynamodb, build_item: Callable[[str], Dict]) -> str:
+        """Writes ``build_item(code)`` under a fresh code and returns the code"""
+        from botocore.exceptions import ClientError
+
+        table = dynamodb.Table(self.table_name)
+        for attempt in range(self.max_attempts):
+            code = game_code(self.next_index(dynamodb), self.length, key=self.key)
+            try:
+                table.put_item(
+                    Item=build_item(code),
+                    ConditionExpression="attribute_not_exists(id)",
+                )
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    raise
+
+                # a code from before the counter or from the last lap of it
+                logger.info(f"Game code {code} is taken, skipping it")
+                count("game_id_retries")
+                continue
+
+            return code
+
+        raise IdSpaceExhausted(
+            f"No free game code after {self.max_attempts} attempts, sweep old "
+            "games or raise ID_LENGTH"
+        )
+
+
+_allocator: Optional[GameIdAllocator] = None
+
+
+def get_allocator() -> GameIdAllocator:
+    """The allocator of this process, handlers build it when they are loaded"""
+    global _allocator
+    if _allocator is None:
+        _allocator = GameIdAllocator()
+
+    return _allocator
+
+
+def allocate_game_id(dynamodb, build_item: Callable[[str], Dict]) -> str:
+    return get_allocator().allocate(dynamodb, build_item)
@@ -1,16 +1,19 @@
 import logging
 
-import boto3
-import urllib3
-
-from .common import get_game, post_mutation
+from .common import (append_snapshot_player, get_dynamodb, get_http_client,
+                     load_game_snapshot, post_mutation)
+from .idempotency import checkpoint, idempotent, progress
+from .model import Hand, Player
 from .mutations import (CREATE_HAND_MUTATION, CREATE_PLAYER_MUTATION,
                         UPDATE_GAME_MUTATION)
+from .tracing import annotate, handler_trace
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+@handler_trace("join_game")
+@idempotent("joinGame")
 def join_game_handler(event, context):
     """
     Creates a player and then adds them to an existing game
@@ -20,32 +23,48 @@ def join_game_handler(event, context):
     """
     logger.info(event)
 
-    dynamodb = boto3.resource("dynamodb")
+    dynamodb = get_dynamodb()
     game_id = event["arguments"]["game_id"].upper()
 
-    game = get_game(game_id, dynamodb)
-    if not game.joinable:
+    # a retried join carries on after the writes of the attempt that failed
+    done = progress()
+
+    game = load_game_snapshot(game_id, dynamodb).game
+    annotate(game_id=game_id, players=len(game.players) + 1)
+    if not game.joinable and not done.get("joined"):
         raise ValueError("Game has already begun, cannot join")
 
     player_name = event["arguments"]["player_name"]
 
-    http_client = urllib3.PoolManager()
+    http_client = get_http_client()
 
-    create_hand_response = post_mutation(CREATE_HAND_MUTATION, http_client)
-    hand_id = create_hand_response["id"]
+    hand_id = done.get("hand_id")
+    if hand_id is None:
+        create_hand_response = post_mutation(CREATE_HAND_MUTATION, http_client)
+        hand_id = create_hand_response["id"]
+        checkpoint(hand_id=hand_id)
 
-    create_player_response = post_mutation(
-        CREATE_PLAYER_MUTATION,
-        http_client,
-        variables=dict(game_id=game_id, name=player_name, hand_id=hand_id),
-    )
+    create_player_response = done.get("player")
+    if create_player_response is None:
+        create_player_response = post_mutation(
+            CREATE_PLAYER_MUTATION,
+            http_client,
+            variables=dict(game_id=game_id, name=player_name, hand_id=hand_id),
+        )
+        checkpoint(player=create_player_response)
 
     player_id = create_player_response["id"]
 
-    post_mutation(
-        UPDATE_GAME_MUTATION,
-        http_client,
-        variables=dict(id=game_id, players=[player_id]),
+    if not done.get("joined"):
+        post_mutation(
+            UPDATE_GAME_MUTATION,
+            http_client,
+            variables=dict(id=game_id, players=[player_id]),
+        )
+        checkpoint(joined=True)
+
+    append_snapshot_player(
+        game_id, Player.from_json(create_player_response), Hand(hand_id), dynamodb
     )
 
     return create_player_response
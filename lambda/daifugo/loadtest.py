@@ -0,0 +1,327 @@
+"""
+End-to-end load generator, plays many games concurrently through the GraphQL
+API the way clients do and records the latency of every request by field
+"""
+import asyncio
+import math
+import random
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from .cards import ids_of
+from .common import BadGraphQLRequest, ConflictError, post_mutation
+from .daifugo import legal_move_masks
+from .model import CardSet, GameState, Hand, decode_cards
+from .mutations import (CREATE_GAME_MUTATION, GAME_HAND_QUERY,
+                        GAME_STATE_QUERY, JOIN_GAME_MUTATION,
+                        PLAY_CARDS_MUTATION, START_GAME_MUTATION, Mutation)
+from .simulate import POLICIES
+
+# error messages that mean a request was throttled rather than rejected
+THROTTLE_MARKERS = (
+    "Throttl",
+    "TooManyRequests",
+    "ProvisionedThroughputExceeded",
+    "Rate exceeded",
+)
+
+
+def is_throttle(error: Exception) -> bool:
+    message = str(error)
+    return any(marker in message for marker in THROTTLE_MARKERS)
+
+
+class HttpTarget:
+    """
+    Posts with ``post_mutation`` from worker threads, ``http_client`` is the
+    shared urllib3 pool for the real API or a ``LocalAppSync``
+    """
+
+    def __init__(self, http_client, workers: int):
+        self.http_client = http_client
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="loadtest"
+        )
+
+    async def request(self, mutation: Mutation, variables: Optional[Dict]) -> Any:
+        import urllib3
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, post_mutation, mutation, self.http_client, variables
+            )
+        except urllib3.exceptions.HTTPError as e:
+            raise ConnectionError(str(e)) from e
+
+    def close(self):
+        self.executor.shutdown()
+
+
+class ServerTarget:
+    """An in-process ``GameServer``, errors are raised like ``post_mutation``"""
+
+    def __init__(self, server):
+        self.server = server
+
+    async def request(self, mutation: Mutation, variables: Optional[Dict]) -> Any:
+        response = await self.server.execute(
+            dict(query=mutation.value, variables=variables or {})
+        )
+        if "errors" in response:
+            if any(
+                error.get("errorType") == "ConflictError"
+                for error in response["errors"]
+            ):
+                raise ConflictError(response["errors"])
+            raise BadGraphQLRequest(response["errors"])
+
+        return response["data"][mutation.name]
+
+    def close(self):
+        pass
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+
+    rank = math.ceil(q / 100 * len(ordered))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+@dataclass
+class LoadTestStats:
+    # field name -> request latencies in seconds, successful requests only
+    latencies: Dict[str, List[float]] = field(default_factory=lambda: defaultdict(list))
+    requests: Counter = field(default_factory=Counter)
+    errors: Counter = field(default_factory=Counter)
+    throttles: Counter = field(default_factory=Counter)
+    n_games: int = 0
+    n_finished: int = 0
+    n_moves: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    elapsed: float = 0.0
+
+    def record(self, name: str, seconds: float, error: Optional[Exception] = None):
+        self.requests[name] += 1
+        if error is None:
+            self.latencies[name].append(seconds)
+        elif is_throttle(error):
+            self.throttles[name] += 1
+        else:
+            self.errors[name] += 1
+
+    def stop(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    def summary(self) -> Dict[str, Any]:
+        fields = {}
+        for name in sorted(self.requests):
+            ordered = sorted(self.latencies[name])
+            n_requests = self.requests[name]
+            fields[name] = dict(
+                requests=n_requests,
+                p50_ms=round(percentile(ordered, 50) * 1000, 2),
+                p95_ms=round(percentile(ordered, 95) * 1000, 2),
+                p99_ms=round(percentile(ordered, 99) * 1000, 2),
+                max_ms=round((ordered[-1] if ordered else 0.0) * 1000, 2),
+                error_rate=round(self.errors[name] / n_requests, 4),
+                throttle_rate=round(self.throttles[name] / n_requests, 4),
+            )
+
+        elapsed = self.elapsed or time.perf_counter() - self.started
+        return dict(
+            games=self.n_games,
+            finished=self.n_finished,
+            moves=self.n_moves,
+            moves_per_sec=round(self.n_moves / elapsed, 1) if elapsed else 0.0,
+            requests_per_sec=(
+                round(sum(self.requests.values()) / elapsed, 1) if elapsed else 0.0
+            ),
+            fields=fields,
+        )
+
+
+class RateLimiter:
+    """Spaces calls evenly at ``rate`` per second, no limit if rate is 0"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self.next_time = time.monotonic()
+
+    async def wait(self):
+        if not self.interval:
+            return
+
+        now = time.monotonic()
+        wait, self.next_time = (
+            self.next_time - now,
+            max(self.next_time, now) + self.interval,
+        )
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class LoadTest:
+    def __init__(
+        self,
+        target,
+        n_players: int = 4,
+        policy: str = "random",
+        rate: float = 0,
+        concurrency: int = 16,
+        max_moves: int = 2000,
+        max_retries: int = 5,
+        seed: int = 0,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy}")
+
+        self.target = target
+        self.n_players = n_players
+        self.policy = POLICIES[policy]
+        self.rate_limiter = RateLimiter(rate)
+        self.max_moves = max_moves
+        self.max_retries = max_retries
+        self.seed = seed
+        self.stats = LoadTestStats()
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._concurrency = concurrency
+
+    async def request(
+        self, mutation: Mutation, variables: Optional[Dict] = None
+    ) -> Any:
+        """One timed request, throttled requests are retried with backoff"""
+        for attempt in range(self.max_retries + 1):
+            async with self._in_flight:
+                started = time.perf_counter()
+                try:
+                    data = await self.target.request(mutation, variables)
+                except (BadGraphQLRequest, ConflictError, OSError) as e:
+                    self.stats.record(mutation.name, time.perf_counter() - started, e)
+                    if not is_throttle(e) or attempt == self.max_retries:
+                        raise
+                else:
+                    self.stats.record(mutation.name, time.perf_counter() - started)
+                    return data
+
+            await asyncio.sleep(0.05 * 2**attempt * random.random())
+
+    async def play_game(self, game_idx: int):
+        rng = random.Random(self.seed + game_idx)
+        self.stats.n_games += 1
+
+        game = await self.request(CREATE_GAME_MUTATION)
+        game_id = game["id"]
+
+        # joins race each other like real players do
+        players = await asyncio.gather(
+            *[
+                self.request(
+                    JOIN_GAME_MUTATION,
+                    dict(game_id=game_id, player_name=f"bot{game_idx}-{i}"),
+                )
+                for i in range(self.n_players)
+            ]
+        )
+        await self.request(START_GAME_MUTATION, dict(game_id=game_id))
+
+        hand_ids = {player["id"]: player["hand_id"] for player in players}
+        n_out = 0
+        for _ in range(self.max_moves):
+            if n_out >= len(players) - 1:
+                self.stats.n_finished += 1
+                return
+
+            # a client would follow subscriptions, the bot reads the snapshot
+            state_json = await self.request(GAME_STATE_QUERY, dict(game_id=game_id))
+            state = GameState.from_json(state_json)
+            hand_json = await self.request(
+                GAME_HAND_QUERY,
+                dict(game_id=game_id, id=hand_ids[state.active_player_id]),
+            )
+            hand = Hand.from_json(hand_json)
+
+            moves = legal_move_masks(hand.mask, state) if len(hand) else []
+            move = self.policy(moves, hand.mask, state, rng) or (0, 0)
+            cards, discards = move
+
+            await self.rate_limiter.wait()
+            await self.request(
+                PLAY_CARDS_MUTATION,
+                dict(
+                    game_id=game_id,
+                    player_id=state.active_player_id,
+                    cards=[card.to_json() for card in CardSet(mask=cards).cards],
+                    discards=[
+                        card.to_json() for card in decode_cards(ids_of(discards))
+                    ],
+                    expected_version=state.version,
+                ),
+            )
+            self.stats.n_moves += 1
+
+            if len(hand) and hand.mask == cards | discards:
+                n_out += 1
+
+    async def _play_game(self, game_idx: int):
+        try:
+            await self.play_game(game_idx)
+        except (BadGraphQLRequest, ConflictError, OSError):
+            # already counted by request, the game is abandoned
+            pass
+
+    async def run(self, n_games: int) -> LoadTestStats:
+        self._in_flight = asyncio.Semaphore(self._concurrency)
+        self.stats = LoadTestStats()
+
+        await asyncio.gather(*[self._play_game(i) for i in range(n_games)])
+
+        self.stats.stop()
+        return self.stats
+
+
+def build_target(name: str, concurrency: int):
+    """``api`` is the deployed AppSync API, ``local`` and ``server`` run in process"""
+    if name == "api":
+        from .common import get_http_client
+
+        return HttpTarget(get_http_client(), concurrency)
+    if name == "local":
+        from .local import LocalAppSync
+
+        return HttpTarget(LocalAppSync(), concurrency)
+    if name == "server":
+        from .server import GameServer, MemoryStore
+
+        return ServerTarget(GameServer(MemoryStore()))
+
+    raise ValueError(f"Unknown target {name}")
+
+
+def run_loadtest(
+    n_games: int,
+    target: str = "local",
+    concurrency: int = 16,
+    **kwargs,
+) -> LoadTestStats:
+    load_target = build_target(target, concurrency)
+    loadtest = LoadTest(load_target, concurrency=concurrency, **kwargs)
+
+    backend = nullcontext()
+    if target == "local":
+        from .local import local_backend
+
+        # the handlers behind the local AppSync need the local tables too
+        backend = local_backend(load_target.http_client)
+
+    try:
+        with backend:
+            return asyncio.run(loadtest.run(n_games))
+    finally:
+        load_target.close()
@@ -0,0 +1,383 @@
+"""
+Matchmaking queue in place of sharing a game code. A ticket waits under the
+``QUEUE#<table size>#<variant>#<skill band>`` partition of the snapshot table,
+sorted by when it was enqueued, and every enqueue tries to fill tables from the
+oldest tickets of its queue. The tickets of a table are claimed with one
+conditional transaction so two matchers never seat the same ticket. The game,
+players, hands, deal and checkpoint 0 then go out in a single batch write
+instead of the createGame, joinGame and startGame mutations, and every member
+is told its seat with a publishMatch mutation.
+
+A client picks its ticket id and subscribes to ``matched`` before it enqueues,
+the notification of a table seated by its own enqueue would beat a subscription
+made afterwards. The ticket is also kept under ``TICKET#<ticket id>`` with its
+seat, for the ``ticket`` query of a client that missed the notification anyway.
+"""
+import logging
+import random
+import time
+import uuid
+from dataclasses import asdict, dataclass, replace
+from typing import Callable, Dict, List, Optional, Sequence
+
+from .common import (MutationRequest, batch_write, deal_hands,
+                     get_starting_hand, post_mutations, snapshot_items)
+from .constants import (HAND_TABLE, MATCH_MAX_PLAYERS, MATCH_MIN_PLAYERS,
+                        MATCH_VARIANTS, PLAYER_TABLE, QUEUE_PK_PREFIX,
+                        SNAPSHOT_TABLE, STATE_TABLE, TICKET_PK_PREFIX,
+                        TICKET_RECORD_SK, TICKET_SK_PREFIX, TICKET_TTL, UP)
+from .ids import allocate_game_id
+from .model import (Game, GameSnapshot, GameState, Hand, MoveLog, Pattern,
+                    Player)
+from .mutations import PUBLISH_MATCH_MUTATION
+from .tracing import add_capacity, count
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Ticket:
+    id: str
+    player_name: str
+    table_size: int
+    variant: str
+    skill_band: int
+    # milliseconds since the epoch, the queue is served oldest first
+    created_at: int
+    # set once the ticket is seated
+    game_id: Optional[str] = None
+    player_id: Optional[str] = None
+    hand_id: Optional[str] = None
+    seat: Optional[int] = None
+
+    @property
+    def queue(self) -> str:
+        return MatchQueue.partition(self.table_size, self.variant, self.skill_band)
+
+    def to_json(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_json(cls, json_obj) -> "Ticket":
+        return cls(
+            json_obj["id"],
+            json_obj["player_name"],
+            int(json_obj["table_size"]),
+            json_obj["variant"],
+            int(json_obj["skill_band"]),
+            int(json_obj["created_at"]),
+        )
+
+    @classmethod
+    def from_record(cls, item: Dict) -> "Ticket":
+        """The ticket kept under ``TICKET#<ticket id>``, seated or not"""
+        json_obj = item["ticket"]
+        ticket = cls.from_json(json_obj)
+        if json_obj.get("game_id") is not None:
+            ticket.game_id = json_obj["game_id"]
+            ticket.player_id = json_obj["player_id"]
+            ticket.hand_id = json_obj["hand_id"]
+            ticket.seat = int(json_obj["seat"])
+
+        return ticket
+
+
+class MatchQueue:
+    @staticmethod
+    def partition(table_size: int, variant: str, skill_band: int) -> str:
+        return f"{QUEUE_PK_PREFIX}{table_size}#{variant}#{skill_band}"
+
+    @staticmethod
+    def sort_key(ticket: Ticket) -> str:
+        return f"{TICKET_SK_PREFIX}{ticket.created_at:013d}#{ticket.id}"
+
+    @staticmethod
+    def record_key(ticket_id: str) -> Dict[str, str]:
+        return dict(game_id=f"{TICKET_PK_PREFIX}{ticket_id}", sk=TICKET_RECORD_SK)
+
+    @classmethod
+    def record_item(cls, ticket: Ticket, expires_at: int) -> Dict:
+        # the ticket is a map of its own, its game_id is not the partition's
+        return dict(
+            **cls.record_key(ticket.id),
+            ticket={k: v for k, v in ticket.to_json().items() if v is not None},
+            expires_at=expires_at,
+        )
+
+    def __init__(
+        self,
+        dynamodb,
+        clock: Callable[[], float] = time.time,
+        rng: Optional[random.Random] = None,
+    ):
+        self.dynamodb = dynamodb
+        self.table = dynamodb.Table(SNAPSHOT_TABLE)
+        self.clock = clock
+        self.rng = rng
+
+    def _key(self, ticket: Ticket) -> Dict[str, str]:
+        return dict(game_id=ticket.queue, sk=self.sort_key(ticket))
+
+    def _item(self, ticket: Ticket) -> Dict:
+        return dict(
+            **self._key(ticket),
+            **{k: v for k, v in ticket.to_json().items() if v is not None},
+            expires_at=ticket.created_at // 1000 + TICKET_TTL,
+        )
+
+    def enqueue(
+        self,
+        player_name: str,
+        table_size: int,
+        variant: str = MATCH_VARIANTS[0],
+        skill_band: int = 0,
+        ticket_id: Optional[str] = None,
+    ) -> Ticket:
+        """
+        Queues a ticket under ``ticket_id``, a fresh one if not given. An
+        enqueue retried with the same id gets the ticket back instead of a
+        second place in the queue.
+        """
+        from botocore.exceptions import ClientError
+
+        if not MATCH_MIN_PLAYERS <= table_size <= MATCH_MAX_PLAYERS:
+            raise ValueError(
+                f"Tables seat {MATCH_MIN_PLAYERS} to {MATCH_MAX_PLAYERS} players"
+            )
+        if variant not in MATCH_VARIANTS:
+            raise ValueError(f"Unknown variant {variant}")
+
+        ticket = Ticket(
+            ticket_id or str(uuid.uuid4()),
+            player_name,
+            table_size,
+            variant,
+            skill_band,
+            int(self.clock() * 1000),
+        )
+        item = self._item(ticket)
+        try:
+            data = self.dynamodb.meta.client.transact_write_items(
+                TransactItems=[
+                    {
+                        "Put": dict(
+                            TableName=SNAPSHOT_TABLE,
+                            Item=self.record_item(ticket, item["expires_at"]),
+                            ConditionExpression="attribute_not_exists(sk)",
+                        )
+                    },
+                    {"Put": dict(TableName=SNAPSHOT_TABLE, Item=item)},
+                ],
+                ReturnConsumedCapacity="TOTAL",
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "TransactionCanceledException":
+                raise
+            existing = self.get(ticket.id)
+            if existing is None:
+                raise
+            if (existing.player_name, existing.queue) != (
+                ticket.player_name,
+                ticket.queue,
+            ):
+                raise ValueError(f"Ticket {ticket.id} was enqueued by another player")
+            return existing
+
+        add_capacity("write", data.get("ConsumedCapacity"))
+        return ticket
+
+    def get(self, ticket_id: str) -> Optional[Ticket]:
+        """The ticket with its seat once it has one, None once it expired"""
+        data = self.table.get_item(
+            Key=self.record_key(ticket_id),
+            ConsistentRead=True,
+            ReturnConsumedCapacity="TOTAL",
+        )
+        add_capacity("read", data.get("ConsumedCapacity"))
+
+        item = data.get("Item")
+        return Ticket.from_record(item) if item else None
+
+    def waiting(self, queue: str, limit: int) -> List[Ticket]:
+        """The oldest ``limit`` tickets of ``queue`` that have not expired"""
+        from boto3.dynamodb.conditions import Key
+
+        # the TTL deletes expired tickets lazily, the sort key range skips them
+        oldest = int((self.clock() - TICKET_TTL) * 1000)
+        data = self.table.query(
+            KeyConditionExpression=Key("game_id").eq(queue)
+            & Key("sk").between(
+                f"{TICKET_SK_PREFIX}{oldest:013d}", TICKET_SK_PREFIX + "~"
+            ),
+            ConsistentRead=True,
+            Limit=limit,
+            ReturnConsumedCapacity="TOTAL",
+        )
+        add_capacity("read", data.get("ConsumedCapacity"))
+
+        return [Ticket.from_json(item) for item in data["Items"]]
+
+    def claim(self, tickets: Sequence[Ticket]) -> bool:
+        """Removes every ticket from the queue, or none if one was taken already"""
+        from botocore.exceptions import ClientError
+
+        try:
+            data = self.dynamodb.meta.client.transact_write_items(
+                TransactItems=[
+                    {
+                        "Delete": dict(
+                            TableName=SNAPSHOT_TABLE,
+                            Key=self._key(ticket),
+                            ConditionExpression="attribute_exists(sk)",
+                        )
+                    }
+                    for ticket in tickets
+                ],
+                ReturnConsumedCapacity="TOTAL",
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "TransactionCanceledException":
+                raise
+            count("match_claim_conflicts")
+            return False
+
+        add_capacity("write", data.get("ConsumedCapacity"))
+        return True
+
+    def requeue(self, tickets: Sequence[Ticket]):
+        """Puts claimed tickets back in their place, e.g. after a failed write"""
+        batch_write(
+            [
+                (SNAPSHOT_TABLE, {"PutRequest": {"Item": self._item(ticket)}})
+                for ticket in tickets
+            ],
+            self.dynamodb,
+        )
+
+    def match(
+        self, queue: str, table_size: int, max_attempts: int = 3
+    ) -> List[List[Ticket]]:
+        """
+        Seats full tables from the oldest tickets of ``queue`` until fewer than a
+        table are waiting, returns the seated tickets of every new table
+        """
+        tables = []
+        attempts = 0
+        while attempts < max_attempts:
+            tickets = self.waiting(queue, table_size)
+            if len(tickets) < table_size:
+                break
+
+            if not self.claim(tickets):
+                # another matcher seated some of them, look again
+                attempts += 1
+                continue
+
+            try:
+                seat_table(tickets, self.dynamodb, self.rng)
+            except BaseException:
+                self.requeue(tickets)
+                raise
+            tables.append(tickets)
+
+        return tables
+
+
+def seat_table(
+    tickets: Sequence[Ticket], dynamodb, rng: Optional[random.Random] = None
+) -> GameSnapshot:
+    """
+    Creates a started game for ``tickets`` in their queue order and fills in
+    their seats. Only the game code is claimed on its own, every other item
+    goes out in one batch write.
+    """
+    n_players = len(tickets)
+    state_id = str(uuid.uuid4())
+    player_ids = [str(uuid.uuid4()) for _ in tickets]
+    hand_ids = [str(uuid.uuid4()) for _ in tickets]
+
+    dealt = deal_hands(n_players, n_jokers=0, rng=rng)
+    starting_player_idx = get_starting_hand(dealt)
+
+    game_id = allocate_game_id(
+        dynamodb, lambda code: Game(code, state_id, False, player_ids).to_item()
+    )
+
+    players = [
+        Player(player_id, ticket.player_name, game_id, hand_id, False, -1)
+        for ticket, player_id, hand_id in zip(tickets, player_ids, hand_ids)
+    ]
+    hands = [Hand(hand_id, cards) for hand_id, cards in zip(hand_ids, dealt)]
+    state = GameState(
+        state_id,
+        game_id,
+        starting_player_idx,
+        player_ids[starting_player_idx],
+        -1,
+        [],
+        0,
+        Pattern.NONE,
+        False,
+        UP,
+    )
+    snapshot = GameSnapshot(
+        Game(game_id, state_id, False, player_ids), players, hands, state
+    )
+
+    # the tickets are only updated once the table is written, a failed one is
+    # put back in the queue as it was
+    seated = [
+        replace(
+            ticket,
+            game_id=game_id,
+            player_id=player.id,
+            hand_id=player.hand_id,
+            seat=seat,
+        )
+        for seat, (ticket, player) in enumerate(zip(tickets, players))
+    ]
+    expires_at = int(time.time()) + TICKET_TTL
+    items = [
+        *snapshot_items(game_id, [snapshot.game, *players, *hands, state]),
+        # the deal is checkpoint 0 of the move log, like start_game_handler's
+        MoveLog.checkpoint_item(game_id, snapshot),
+        *[MatchQueue.record_item(ticket, expires_at) for ticket in seated],
+    ]
+    requests = [(SNAPSHOT_TABLE, {"PutRequest": {"Item": item}}) for item in items]
+    # the entity tables keep the JSON card strings the AppSync resolvers write
+    requests += [
+        *[(PLAYER_TABLE, {"PutRequest": {"Item": p.to_item()}}) for p in players],
+        *[
+            (HAND_TABLE, {"PutRequest": {"Item": h.to_item(card_format="json")}})
+            for h in hands
+        ],
+        (STATE_TABLE, {"PutRequest": {"Item": state.to_item(card_format="json")}}),
+    ]
+    batch_write(requests, dynamodb)
+
+    for ticket, seated_ticket in zip(tickets, seated):
+        ticket.game_id = seated_ticket.game_id
+        ticket.player_id = seated_ticket.player_id
+        ticket.hand_id = seated_ticket.hand_id
+        ticket.seat = seated_ticket.seat
+
+    return snapshot
+
+
+def notify_members(tables: Sequence[Sequence[Ticket]], http_client):
+    """
+    Publishes every seated ticket to its ``matched`` subscribers. The games
+    exist already, a failed notification is logged rather than raised.
+    """
+    requests = [
+        MutationRequest(PUBLISH_MATCH_MUTATION, ticket.to_json())
+        for tickets in tables
+        for ticket in tickets
+    ]
+    if not requests:
+        return
+
+    for result in post_mutations(requests, http_client):
+        if result.error is not None:
+            count("match_notify_errors")
+            logger.warning(f"{result.name} failed: {result.error}")
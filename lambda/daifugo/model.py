@@ -1,11 +1,16 @@
 import itertools
 import json
 import random
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Dict, List, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
 
-from .constants import RANKS, SUITS
+from .cards import (CARD_RANKS, CARD_SUIT_BITS, CARD_SUITS, JOKER_IDS, N_CARDS,
+                    RANK_MASKS, RANK_NAMES, card_id, ids_of, lowest_rank,
+                    mask_of, pack_ids, rank_counts, rank_suit_mask, unpack_ids)
+from .constants import (CARD_FORMAT, CHECKPOINT_SK_PREFIX, GAME_SK,
+                        HAND_SK_PREFIX, LOG_PK_SUFFIX, MOVE_SK_PREFIX,
+                        PLAYER_SK_PREFIX, RANKS, STATE_SK, SUITS)
 
 
 class CARD_SPECIALS(Enum):
@@ -31,8 +36,13 @@ class DiscardType(Enum):
     FORWARD = 1
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Card:
+    """
+    Immutable, parsing goes through ``CARDS`` so every card read from JSON or an
+    int is one of the shared canonical instances
+    """
+
     rank: Optional[str] = None
     suit: Optional[str] = None
     is_joker: bool = False
@@ -54,12 +64,42 @@ class Card:
     # return f"{self.rank} of {self.suit}s"
     # return self.to_json()
 
+    def __eq__(self, other) -> bool:
+        # canonical cards compare by identity, the fields only for ad hoc ones
+        if self is other:
+            return True
+        if other.__class__ is not Card:
+            return NotImplemented
+
+        return (
+            self.rank == other.rank
+            and self.suit == other.suit
+            and self.is_joker == other.is_joker
+        )
+
+    def __hash__(self) -> int:
+        return hash((self.rank, self.suit, self.is_joker))
+
     def to_json(self) -> str:
-        return json.dumps(self.__dict__)
+        return json.dumps(dict(rank=self.rank, suit=self.suit, is_joker=self.is_joker))
 
     @classmethod
     def from_json(cls, json_str: str) -> "Card":
-        return cls(**json.loads(json_str))
+        card = CARDS_BY_JSON.get(json_str)
+        if card is None:
+            card = cls(**json.loads(json_str)).intern()
+
+        return card
+
+    def to_int(self) -> int:
+        return card_id(self.rank, self.suit, self.is_joker)
+
+    @classmethod
+    def from_int(cls, card: int) -> "Card":
+        return CARDS[card]
+
+    def intern(self) -> "Card":
+        return CARDS[self.to_int()]
 
     @property
     def is_starting_card(self) -> bool:
@@ -80,8 +120,8 @@ class Deck:
     def __len__(self):
         return len(self._cards)
 
-    def shuffle(self):
-        random.shuffle(self._cards)
+    def shuffle(self, rng: Optional[random.Random] = None):
+        (rng or random).shuffle(self._cards)
 
     def draw_one(self) -> Card:
         return self._cards.pop()
@@ -93,29 +133,152 @@ class Deck:
         return ret
 
 
-@dataclass
+# flyweight table indexed by card id, both joker ids share one instance
+_JOKER = Card(is_joker=True)
+CARDS: Tuple[Card, ...] = tuple(
+    _JOKER
+    if card in JOKER_IDS
+    else Card(RANK_NAMES[CARD_RANKS[card]], SUITS[CARD_SUITS[card]])
+    for card in range(N_CARDS)
+)
+CARD_JSONS: Tuple[str, ...] = tuple(card.to_json() for card in CARDS)
+CARDS_BY_JSON: Dict[str, Card] = dict(zip(CARD_JSONS, CARDS))
+
+
+class InvalidPlayError(ValueError):
+    pass
+
+
+def encode_cards(cards: List[Card]) -> List[int]:
+    """Encodes cards to ints, giving repeated jokers distinct ids"""
+    ret = []
+    n_jokers = 0
+    for card in cards:
+        if card.is_joker:
+            ret.append(JOKER_IDS[n_jokers % len(JOKER_IDS)])
+            n_jokers += 1
+        else:
+            ret.append(card.to_int())
+
+    return ret
+
+
+def cards_mask(cards: List[Card]) -> int:
+    """Bitmask of ``cards``, a card given twice is an invalid play, not a no-op"""
+    ids = encode_cards(cards)
+    mask = mask_of(ids)
+    if mask.bit_count() != len(ids):
+        raise InvalidPlayError("Duplicate cards")
+
+    return mask
+
+
+def decode_cards(cards: List[int]) -> List[Card]:
+    return [Card.from_int(card) for card in cards]
+
+
+def pack_cards(cards: List[Card]) -> str:
+    return pack_ids(encode_cards(cards))
+
+
+def unpack_cards(packed: str) -> List[Card]:
+    return decode_cards(unpack_ids(packed))
+
+
+def card_ids_to_item(
+    name: str, cards: List[int], card_format: Optional[str] = None
+) -> Dict:
+    """Item attributes for a list of card ids in the configured card format"""
+    card_format = card_format or CARD_FORMAT
+
+    ret = {}
+    if card_format != "packed":
+        ret[name] = [CARD_JSONS[card] for card in cards]
+    if card_format != "json":
+        ret["packed_" + name] = pack_ids(cards)
+
+    return ret
+
+
+def card_ids_from_item(item: Dict, name: str) -> List[int]:
+    """Reads either format, preferring ``packed_<name>`` when both are present"""
+    packed = item.get("packed_" + name)
+    if packed is not None:
+        return unpack_ids(packed)
+
+    return encode_cards([Card.from_json(card_json) for card_json in item[name]])
+
+
+@dataclass(init=False, frozen=True, slots=True)
 class CardSet:
-    cards: List[Card]
+    """
+    A set of cards stored as a bitmask of card ids, ``cards`` is a view over it
+    """
+
+    mask: int
+    rank_value: int = field(repr=False, compare=False)
+    suit_mask: int = field(repr=False, compare=False)
+
+    def __init__(self, cards: Optional[List[Card]] = None, mask: int = 0):
+        if cards:
+            mask |= cards_mask(cards)
+
+        # computed once so the engine never touches the strings
+        rank_value = lowest_rank(mask)
+        object.__setattr__(self, "mask", mask)
+        object.__setattr__(self, "rank_value", rank_value)
+        object.__setattr__(self, "suit_mask", rank_suit_mask(mask, rank_value))
+
+    @classmethod
+    def from_ids(cls, ids: List[int]) -> "CardSet":
+        return cls(mask=mask_of(ids))
+
+    @property
+    def ids(self) -> Tuple[int, ...]:
+        return ids_of(self.mask)
+
+    @property
+    def cards(self) -> List[Card]:
+        return decode_cards(self.ids)
 
     def __len__(self) -> int:
-        return len(self.cards)
+        return self.mask.bit_count()
+
+    def __contains__(self, card: Card) -> bool:
+        return bool(self.mask >> card.to_int() & 1)
+
+    @property
+    def is_single_rank(self) -> bool:
+        return not self.mask & ~RANK_MASKS[self.rank_value]
 
     @property
     def suits(self) -> Set[str]:
-        return {card.suit for card in self.cards}
+        return {SUITS[CARD_SUITS[card]] for card in self.ids if CARD_SUIT_BITS[card]}
 
     @property
-    def rank(self) -> str:
-        return next(iter({card.rank for card in self.cards}))
+    def rank(self) -> Optional[str]:
+        if self.rank_value < 0:
+            return None
+        if self.rank_value >= len(RANK_NAMES):
+            return "Joker"
 
+        return RANK_NAMES[self.rank_value]
 
-@dataclass
+
+@dataclass(slots=True)
+class Move:
+    cards: CardSet
+    discards: List[Card]
+
+
+@dataclass(slots=True)
 class Discards:
-    to_pot: List[Card]
-    to_forward: List[Card]
+    to_pot: int
+    to_forward: int
 
 
-@dataclass
+# players and hands are updated in place by the engine, slotted but not frozen
+@dataclass(slots=True)
 class Player:
     id: str
     name: str
@@ -128,6 +291,16 @@ class Player:
     def is_out(self) -> bool:
         return self.rank != -1
 
+    def to_item(self) -> Dict:
+        return dict(
+            id=self.id,
+            name=self.name,
+            game_id=self.game_id,
+            hand_id=self.hand_id,
+            has_passed=self.has_passed,
+            rank=self.rank,
+        )
+
     @classmethod
     def from_json(cls, json_obj) -> "Player":
         return cls(
@@ -150,6 +323,14 @@ class Game:
     def to_json(self) -> str:
         return json.dumps(self.__dict__)
 
+    def to_item(self) -> Dict:
+        return dict(
+            id=self.id,
+            state_id=self.state_id,
+            joinable=self.joinable,
+            players=list(self.players),
+        )
+
     @classmethod
     def from_json(cls, json_obj) -> "Game":
         return cls(
@@ -161,7 +342,7 @@ class Game:
 
 
 # TODO: add active player id to game state as well so subscribers can filter on that
-@dataclass
+@dataclass(frozen=True, slots=True)
 class GameState:
     id: str
     game_id: str
@@ -173,10 +354,19 @@ class GameState:
     active_pattern: Optional[Pattern]
     revolution: bool
     direction: bool
+    # bumped on every move, writes are conditional on the version they read
+    version: int = 0
+    _top_of_pile_set: Optional[CardSet] = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     @property
     def top_of_pile(self) -> CardSet:
-        return CardSet(self._top_of_pile)
+        # the state is immutable so the pile is encoded at most once
+        if self._top_of_pile_set is None:
+            object.__setattr__(self, "_top_of_pile_set", CardSet(self._top_of_pile))
+
+        return self._top_of_pile_set
 
     @property
     def new_trick(self) -> bool:
@@ -186,11 +376,26 @@ class GameState:
     def new_game(self) -> bool:
         return self.new_trick and not self.pot_size
 
+    def to_item(self, card_format: Optional[str] = None) -> Dict:
+        top_of_pile = encode_cards(self._top_of_pile)
+
+        return dict(
+            id=self.id,
+            game_id=self.game_id,
+            active_player_idx=self.active_player_idx,
+            active_player_id=self.active_player_id,
+            last_played_idx=self.last_played_idx,
+            **card_ids_to_item("top_of_pile", top_of_pile, card_format),
+            pot_size=self.pot_size,
+            active_pattern=self.active_pattern.value if self.active_pattern else None,
+            revolution=self.revolution,
+            direction=self.direction,
+            version=self.version,
+        )
+
     @classmethod
     def from_json(cls, json_obj) -> "GameState":
-        top_of_pile = [
-            Card.from_json(card_json) for card_json in json_obj["top_of_pile"]
-        ]
+        top_of_pile = decode_cards(card_ids_from_item(json_obj, "top_of_pile"))
 
         if json_obj["active_pattern"]:
             pattern = Pattern(json_obj["active_pattern"])
@@ -208,19 +413,197 @@ class GameState:
             pattern,
             json_obj["revolution"],
             json_obj["direction"],
+            int(json_obj.get("version") or 0),
         )
 
 
-@dataclass
+@dataclass(init=False, slots=True)
 class Hand:
+    """
+    A player's cards stored as a bitmask of card ids, ``cards`` is a view over it
+    """
+
     id: str
-    cards: List[Card]
+    mask: int
+
+    def __init__(self, id: str, cards: Optional[List[Card]] = None, mask: int = 0):
+        if cards:
+            mask |= mask_of(encode_cards(cards))
+
+        self.id = id
+        self.mask = mask
+
+    @property
+    def cards(self) -> List[Card]:
+        return decode_cards(ids_of(self.mask))
+
+    @cards.setter
+    def cards(self, cards: List[Card]):
+        self.mask = mask_of(encode_cards(cards))
 
     def __len__(self) -> int:
-        return len(self.cards)
+        return self.mask.bit_count()
+
+    def __contains__(self, card: Card) -> bool:
+        return bool(self.mask >> card.to_int() & 1)
+
+    def rank_counts(self) -> Tuple[int, ...]:
+        return rank_counts(self.mask)
+
+    def to_item(self, card_format: Optional[str] = None) -> Dict:
+        return dict(
+            id=self.id, **card_ids_to_item("cards", ids_of(self.mask), card_format)
+        )
 
     @classmethod
     def from_json(cls, json_obj) -> "Hand":
-        cards = [Card.from_json(card_json) for card_json in json_obj["cards"]]
+        return Hand(json_obj["id"], mask=mask_of(card_ids_from_item(json_obj, "cards")))
+
+
+class IncompleteSnapshot(ValueError):
+    pass
+
+
+@dataclass
+class GameSnapshot:
+    """
+    Everything needed to play a move, loaded from the single-table layout where
+    every item of a game shares the game_id partition key
+    """
+
+    game: Game
+    players: List[Player]
+    hands: List[Hand]
+    state: Optional[GameState]
+
+    @staticmethod
+    def sort_key(entity) -> str:
+        if isinstance(entity, Game):
+            return GAME_SK
+        if isinstance(entity, GameState):
+            return STATE_SK
+        if isinstance(entity, Player):
+            return PLAYER_SK_PREFIX + entity.id
+        if isinstance(entity, Hand):
+            return HAND_SK_PREFIX + entity.id
+
+        raise TypeError(f"{type(entity).__name__} is not stored in a snapshot")
+
+    @classmethod
+    def to_items(cls, game_id: str, entities: List) -> List[Dict]:
+        return [
+            {**entity.to_item(), "game_id": game_id, "sk": cls.sort_key(entity)}
+            for entity in entities
+        ]
+
+    @classmethod
+    def from_items(cls, items: List[Dict]) -> "GameSnapshot":
+        game = None
+        state = None
+        players: Dict[str, Player] = {}
+        hands: Dict[str, Hand] = {}
+
+        for item in items:
+            sk = item["sk"]
+            if sk == GAME_SK:
+                # a join on a game from before the snapshot table only appends
+                # to the players of an item that has nothing else
+                game = Game.from_json(item) if "id" in item else None
+            elif sk == STATE_SK:
+                state = GameState.from_json(item)
+            elif sk.startswith(PLAYER_SK_PREFIX):
+                player = Player.from_json(item)
+                players[player.id] = player
+            elif sk.startswith(HAND_SK_PREFIX):
+                hand = Hand.from_json(item)
+                hands[hand.id] = hand
+
+        if game is None:
+            raise IncompleteSnapshot("Snapshot has no game item")
+
+        # the game item keeps the seating order, hands follow their players
+        missing = [player_id for player_id in game.players if player_id not in players]
+        if missing:
+            raise IncompleteSnapshot(f"Snapshot has no player items for {missing}")
+        ordered_players = [players[player_id] for player_id in game.players]
+
+        missing = [p.hand_id for p in ordered_players if p.hand_id not in hands]
+        if missing:
+            raise IncompleteSnapshot(f"Snapshot has no hand items for {missing}")
+        ordered_hands = [hands[player.hand_id] for player in ordered_players]
+
+        return cls(game, ordered_players, ordered_hands, state)
+
+
+@dataclass
+class MoveEvent:
+    # version of the state this move produced
+    version: int
+    player_id: str
+    cards: List[Card]
+    discards: List[Card]
+
+    def to_item(self, card_format: Optional[str] = None) -> Dict:
+        return dict(
+            version=self.version,
+            player_id=self.player_id,
+            **card_ids_to_item("cards", encode_cards(self.cards), card_format),
+            **card_ids_to_item("discards", encode_cards(self.discards), card_format),
+        )
+
+    @classmethod
+    def from_json(cls, json_obj) -> "MoveEvent":
+        return cls(
+            int(json_obj["version"]),
+            json_obj["player_id"],
+            decode_cards(card_ids_from_item(json_obj, "cards")),
+            decode_cards(card_ids_from_item(json_obj, "discards")),
+        )
+
+
+class MoveLog:
+    """
+    Moves and checkpoints of a game live under their own ``<game_id>#LOG``
+    partition, sorted by the version they lead to
+    """
+
+    @staticmethod
+    def partition(game_id: str) -> str:
+        return game_id + LOG_PK_SUFFIX
+
+    @staticmethod
+    def move_sk(version: int) -> str:
+        return f"{MOVE_SK_PREFIX}{version:010d}"
+
+    @staticmethod
+    def checkpoint_sk(version: int) -> str:
+        return f"{CHECKPOINT_SK_PREFIX}{version:010d}"
 
-        return Hand(json_obj["id"], cards)
+    @classmethod
+    def move_item(cls, game_id: str, event: MoveEvent) -> Dict:
+        return {
+            **event.to_item(),
+            "game_id": cls.partition(game_id),
+            "sk": cls.move_sk(event.version),
+        }
+
+    @classmethod
+    def checkpoint_item(cls, game_id: str, snapshot: GameSnapshot) -> Dict:
+        return dict(
+            game_id=cls.partition(game_id),
+            sk=cls.checkpoint_sk(snapshot.state.version),
+            version=snapshot.state.version,
+            game=snapshot.game.to_item(),
+            players=[player.to_item() for player in snapshot.players],
+            hands=[hand.to_item() for hand in snapshot.hands],
+            state=snapshot.state.to_item(),
+        )
+
+    @staticmethod
+    def from_checkpoint_item(item: Dict) -> GameSnapshot:
+        return GameSnapshot(
+            Game.from_json(item["game"]),
+            [Player.from_json(player) for player in item["players"]],
+            [Hand.from_json(hand) for hand in item["hands"]],
+            GameState.from_json(item["state"]),
+        )
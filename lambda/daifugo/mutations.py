@@ -92,6 +92,7 @@ CREATE_STATE_MUTATION = Mutation(
             active_pattern
             revolution
             direction
+            version
         }
     }
 """,
@@ -110,7 +111,8 @@ UPDATE_STATE_MUTATION = Mutation(
         $pot_size: Int,
         $active_pattern: String,
         $revolution: Boolean,
-        $direction: Boolean
+        $direction: Boolean,
+        $expected_version: Int
     ){
         updateState(
             id: $id,
@@ -121,7 +123,8 @@ UPDATE_STATE_MUTATION = Mutation(
             pot_size: $pot_size,
             active_pattern: $active_pattern,
             revolution: $revolution,
-            direction: $direction
+            direction: $direction,
+            expected_version: $expected_version
         ) {
             id
             game_id
@@ -133,6 +136,7 @@ UPDATE_STATE_MUTATION = Mutation(
             active_pattern
             revolution
             direction
+            version
         }
     }
 """,
@@ -156,8 +160,8 @@ CREATE_GAME_MUTATION = Mutation(
 JOIN_GAME_MUTATION = Mutation(
     "joinGame",
     """
-    mutation JoinGame($game_id: ID!, $player_name: String!) {
-        joinGame(game_id: $game_id, player_name: $player_name) {
+    mutation JoinGame($game_id: ID!, $player_name: String!, $idempotency_key: String) {
+        joinGame(game_id: $game_id, player_name: $player_name, idempotency_key: $idempotency_key) {
             id
             name
             game_id
@@ -173,8 +177,8 @@ JOIN_GAME_MUTATION = Mutation(
 START_GAME_MUTATION = Mutation(
     "startGame",
     """
-    mutation StartGame($game_id: String!) {
-        startGame(game_id: $game_id) {
+    mutation StartGame($game_id: String!, $idempotency_key: String) {
+        startGame(game_id: $game_id, idempotency_key: $idempotency_key) {
             id
             game_id
             active_player_idx
@@ -185,6 +189,7 @@ START_GAME_MUTATION = Mutation(
             active_pattern
             revolution
             direction
+            version
         }
     }
     """,
@@ -194,8 +199,8 @@ START_GAME_MUTATION = Mutation(
 PLAY_CARDS_MUTATION = Mutation(
     "playCards",
     """
-    mutation PlayCards($game_id: String!, $player_id: String!, $cards: [String]!, $discards: [String]!){
-        playCards(game_id: $game_id, player_id: $player_id, cards: $cards, discards: $discards){
+    mutation PlayCards($game_id: String!, $player_id: String!, $cards: [String]!, $discards: [String]!, $expected_version: Int, $idempotency_key: String){
+        playCards(game_id: $game_id, player_id: $player_id, cards: $cards, discards: $discards, expected_version: $expected_version, idempotency_key: $idempotency_key){
             id
             game_id
             active_player_idx
@@ -206,6 +211,7 @@ PLAY_CARDS_MUTATION = Mutation(
             revolution
             direction
             active_pattern
+            version
         }
     }
     """,
@@ -236,6 +242,257 @@ STATE_SUBSCRIPTION = """
             active_pattern
             revolution
             direction
+            version
+        }
+    }
+
+"""
+
+
+PUBLISH_DELTA_MUTATION = Mutation(
+    "publishDelta",
+    """
+    mutation PublishDelta(
+        $game_id: ID!,
+        $seq: Int!,
+        $played: [Int]!,
+        $hand_sizes: [HandSizeInput]!,
+        $players: [PlayerDeltaInput]!,
+        $active_player_idx: Int,
+        $active_player_id: String,
+        $last_played_idx: Int,
+        $top_of_pile: [Int],
+        $pot_size: Int,
+        $active_pattern: String,
+        $revolution: Boolean,
+        $direction: Boolean
+    ){
+        publishDelta(
+            game_id: $game_id,
+            seq: $seq,
+            played: $played,
+            hand_sizes: $hand_sizes,
+            players: $players,
+            active_player_idx: $active_player_idx,
+            active_player_id: $active_player_id,
+            last_played_idx: $last_played_idx,
+            top_of_pile: $top_of_pile,
+            pot_size: $pot_size,
+            active_pattern: $active_pattern,
+            revolution: $revolution,
+            direction: $direction
+        ) {
+            game_id
+            seq
+        }
+    }
+""",
+)
+
+
+PUBLISH_HAND_DELTA_MUTATION = Mutation(
+    "publishHandDelta",
+    """
+    mutation PublishHandDelta(
+        $id: ID!,
+        $seq: Int!,
+        $removed: [Int]!,
+        $added: [Int]!
+    ){
+        publishHandDelta(id: $id, seq: $seq, removed: $removed, added: $added) {
+            id
+            seq
+        }
+    }
+""",
+)
+
+
+GAME_STATE_QUERY = Mutation(
+    "gameState",
+    """
+    query GameState($game_id: ID!) {
+        gameState(game_id: $game_id) {
+            id
+            game_id
+            active_player_idx
+            last_played_idx
+            active_player_id
+            top_of_pile
+            packed_top_of_pile
+            pot_size
+            active_pattern
+            revolution
+            direction
+            version
+        }
+    }
+""",
+)
+
+
+GAME_HAND_QUERY = Mutation(
+    "gameHand",
+    """
+    query GameHand($game_id: ID!, $id: ID!) {
+        gameHand(game_id: $game_id, id: $id) {
+            id
+            cards
+            packed_cards
+        }
+    }
+""",
+)
+
+
+SUGGEST_MOVE_QUERY = Mutation(
+    "suggestMove",
+    """
+    query SuggestMove($game_id: String!, $player_id: String!) {
+        suggestMove(game_id: $game_id, player_id: $player_id) {
+            cards
+            discards
+            visits
+            score
+            iterations
+        }
+    }
+""",
+)
+
+
+ENQUEUE_MUTATION = Mutation(
+    "enqueue",
+    """
+    mutation Enqueue($id: ID, $player_name: String!, $table_size: Int!, $variant: String, $skill_band: Int) {
+        enqueue(id: $id, player_name: $player_name, table_size: $table_size, variant: $variant, skill_band: $skill_band) {
+            id
+            player_name
+            table_size
+            variant
+            skill_band
+            created_at
+            game_id
+            player_id
+            hand_id
+            seat
+        }
+    }
+""",
+)
+
+
+TICKET_QUERY = Mutation(
+    "ticket",
+    """
+    query Ticket($id: ID!) {
+        ticket(id: $id) {
+            id
+            player_name
+            table_size
+            variant
+            skill_band
+            created_at
+            game_id
+            player_id
+            hand_id
+            seat
+        }
+    }
+""",
+)
+
+
+PUBLISH_MATCH_MUTATION = Mutation(
+    "publishMatch",
+    """
+    mutation PublishMatch(
+        $id: ID!,
+        $player_name: String!,
+        $table_size: Int!,
+        $variant: String!,
+        $skill_band: Int!,
+        $created_at: Float!,
+        $game_id: String!,
+        $player_id: String!,
+        $hand_id: String!,
+        $seat: Int!
+    ){
+        publishMatch(
+            id: $id,
+            player_name: $player_name,
+            table_size: $table_size,
+            variant: $variant,
+            skill_band: $skill_band,
+            created_at: $created_at,
+            game_id: $game_id,
+            player_id: $player_id,
+            hand_id: $hand_id,
+            seat: $seat
+        ) {
+            id
+            game_id
+        }
+    }
+""",
+)
+
+
+MATCH_SUBSCRIPTION = """
+    subscription Matched($id: ID!) {
+        matched(id: $id) {
+            id
+            player_name
+            table_size
+            variant
+            skill_band
+            created_at
+            game_id
+            player_id
+            hand_id
+            seat
+        }
+    }
+
+"""
+
+
+GAME_SUBSCRIPTION = """
+    subscription UpdatedGame($game_id: ID!) {
+        updatedGame(game_id: $game_id) {
+            game_id
+            seq
+            played
+            hand_sizes {
+                id
+                size
+            }
+            players {
+                id
+                rank
+                has_passed
+            }
+            active_player_idx
+            active_player_id
+            last_played_idx
+            top_of_pile
+            pot_size
+            active_pattern
+            revolution
+            direction
+        }
+    }
+
+"""
+
+
+HAND_DELTA_SUBSCRIPTION = """
+    subscription UpdatedHandDelta($id: ID!) {
+        updatedHandDelta(id: $id) {
+            id
+            seq
+            removed
+            added
         }
     }
 
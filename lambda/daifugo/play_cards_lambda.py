@@ -2,31 +2,27 @@ import logging
 import os
 from typing import List
 
-import boto3
-import urllib3
-
-from .common import (get_game, get_game_state, get_hands, get_players,
-                     update_hand, update_player, update_state)
+from .common import (ConflictError, commit_move, delta_publish, get_dynamodb,
+                     get_http_client, hand_delta_publish, hand_update,
+                     load_game_snapshot, player_update, post_mutations,
+                     state_update)
+from .constants import CHECKPOINT_INTERVAL, SUBSCRIPTION_MODE
 from .daifugo import play_cards
-from .model import Card, CardSet, Game, Hand, Player
+from .delta import diff_move
+from .idempotency import complete, idempotent
+from .model import Card, CardSet, GameSnapshot, MoveEvent, MoveLog
+from .tracing import annotate, count, handler_trace, span
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def enforce_player_order(game: Game, players: List[Player]) -> List[Player]:
-    return sorted(players, key=lambda player: game.players.index(player.id))
-
-
-def enforce_hand_order(hand_ids: List[str], hands: List[Hand]) -> List[Hand]:
-    return sorted(hands, key=lambda hand: hand_ids.index(hand.id))
-
-
+@handler_trace("play_cards")
+@idempotent("playCards")
 def play_cards_handler(event, context):
     # TODO:
     # add skip handling
     # add logic about removing players with empty hands
-    # fix sorting of players and hands bc dynamo db not enforcing a return order
 
     logger.info(event)
 
@@ -38,31 +34,78 @@ def play_cards_handler(event, context):
     discards = [
         Card.from_json(card_json) for card_json in event["arguments"]["discards"]
     ]
-
-    http_client = urllib3.PoolManager()
-    dynamodb = boto3.resource("dynamodb")
-
-    game = get_game(game_id, dynamodb)
-    players = get_players(game.players, dynamodb)
-    hands = get_hands([player.hand_id for player in players], dynamodb)
-    prev_game_state = get_game_state(game.state_id, dynamodb)
-
-    players = enforce_player_order(game, players)
-    hands = enforce_hand_order([player.hand_id for player in players], hands)
+    expected_version = event["arguments"].get("expected_version")
+
+    http_client = get_http_client()
+    dynamodb = get_dynamodb()
+
+    snapshot = load_game_snapshot(game_id, dynamodb)
+    players = snapshot.players
+    hands = snapshot.hands
+    prev_game_state = snapshot.state
+    if prev_game_state is None:
+        raise ValueError("Game has not started")
+    annotate(game_id=game_id, players=len(players), version=prev_game_state.version)
+
+    # a retried or stale move is rejected instead of being applied twice
+    if expected_version is not None and expected_version != prev_game_state.version:
+        raise ConflictError(
+            f"Game {game_id} is at version {prev_game_state.version}, "
+            f"not {expected_version}"
+        )
 
     assert (
         players[prev_game_state.active_player_idx].id == player_id
     ), "Incorrect player"
 
-    next_game_state, new_hands, new_players = play_cards(
-        prev_game_state, cards, discards, players, hands
+    prev_masks = {hand.id: hand.mask for hand in hands}
+    with span("play_cards"):
+        next_game_state, new_hands, new_players = play_cards(
+            prev_game_state, cards, discards, players, hands
+        )
+
+    log_items = [
+        MoveLog.move_item(
+            game_id,
+            MoveEvent(next_game_state.version, player_id, cards.cards, discards),
+        )
+    ]
+    if next_game_state.version % CHECKPOINT_INTERVAL == 0:
+        # play_cards has already applied the move to players and hands
+        checkpoint = GameSnapshot(snapshot.game, players, hands, next_game_state)
+        log_items.append(MoveLog.checkpoint_item(game_id, checkpoint))
+
+    commit_move(
+        game_id,
+        prev_game_state.version,
+        [*new_hands, *new_players, next_game_state],
+        dynamodb,
+        log_items,
     )
-    for hand in new_hands:
-        update_hand(hand.id, hand.cards, http_client)
-
-    for player in new_players:
-        update_player(player, http_client)
-
-    next_game_state_json = update_state(next_game_state, http_client)
-
-    return next_game_state_json
+    # the move is in, a retry gets this response even if the handler dies below
+    # the GraphQL GameState type still carries the JSON card strings
+    response = next_game_state.to_item(card_format="json")
+    complete(response)
+
+    requests = []
+    if SUBSCRIPTION_MODE != "full":
+        delta, hand_deltas = diff_move(
+            prev_game_state, next_game_state, prev_masks, new_hands, new_players
+        )
+        requests.append(delta_publish(delta))
+        requests += [hand_delta_publish(hand_delta) for hand_delta in hand_deltas]
+    if SUBSCRIPTION_MODE != "delta":
+        requests += [
+            *[hand_update(hand.id, hand.cards) for hand in new_hands],
+            *[player_update(player) for player in new_players],
+            state_update(next_game_state),
+        ]
+
+    # the snapshot table has the move, a failed mirror or publish is logged and
+    # subscribers catch up on the next one or through a resync
+    for result in post_mutations(requests, http_client):
+        if result.error is not None:
+            count("publish_errors")
+            logger.warning(f"{result.name} failed: {result.error}")
+
+    return response
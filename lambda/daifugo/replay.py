@@ -0,0 +1,62 @@
+"""
+Rebuilds any point of a game from the nearest checkpoint and the tail of the
+move log using the same pure ``play_cards`` transition as the handler
+"""
+import dataclasses
+from typing import Iterable, Optional
+
+from .common import get_checkpoint, get_move_events
+from .daifugo import play_cards
+from .model import CardSet, GameSnapshot, MoveEvent
+
+
+class ReplayError(ValueError):
+    pass
+
+
+def replay(snapshot: GameSnapshot, events: Iterable[MoveEvent]) -> GameSnapshot:
+    """
+    Applies ``events`` on top of ``snapshot``. The players and hands of
+    ``snapshot`` are updated in place, as ``play_cards`` does.
+    """
+    for event in events:
+        state = snapshot.state
+        if event.version != state.version + 1:
+            raise ReplayError(
+                f"Move log jumps from version {state.version} to {event.version}"
+            )
+
+        player = snapshot.players[state.active_player_idx]
+        if player.id != event.player_id:
+            raise ReplayError(
+                f"Move {event.version} was played by {event.player_id}, "
+                f"expected {player.id}"
+            )
+
+        next_state, _, _ = play_cards(
+            state,
+            CardSet(event.cards),
+            event.discards,
+            snapshot.players,
+            snapshot.hands,
+        )
+        snapshot = dataclasses.replace(snapshot, state=next_state)
+
+    return snapshot
+
+
+def load_game_at(game_id: str, dynamodb, version: Optional[int] = None) -> GameSnapshot:
+    """The game as it was right after ``version``, the latest move if not given"""
+    checkpoint = get_checkpoint(game_id, dynamodb, version)
+    if checkpoint is None:
+        raise ReplayError(f"Game {game_id} has no checkpoint before {version}")
+
+    events = get_move_events(game_id, dynamodb, checkpoint.state.version + 1, version)
+    snapshot = replay(checkpoint, events)
+
+    if version is not None and snapshot.state.version != version:
+        raise ReplayError(
+            f"Move log of {game_id} ends at version {snapshot.state.version}"
+        )
+
+    return snapshot
@@ -0,0 +1,704 @@
+"""
+Long-running game server. Every table is an asyncio actor that holds its game in
+memory and applies moves one at a time, persistence is write-behind through a
+pluggable store. Clients speak the GraphQL operations in ``daifugo.mutations``
+as JSON over HTTP POST, subscriptions are not served. Finished and idle tables
+are flushed and dropped, the next request loads them again from the store.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from dataclasses import replace
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from graphql import DocumentNode, GraphQLError, parse
+from graphql.pyutils import Undefined
+from graphql.utilities import value_from_ast_untyped
+
+from .bot import seen_mask, suggest_move
+from .common import (ConflictError, InvalidPlayError, deal_hands, get_dynamodb,
+                     get_move_events, get_snapshot, get_starting_hand,
+                     snapshot_items)
+from .constants import (CHECKPOINT_INTERVAL, MOVE_SK_PREFIX,
+                        SERVER_FLUSH_INTERVAL, SERVER_IDLE_TIMEOUT,
+                        SNAPSHOT_TABLE, UP)
+from .daifugo import play_cards
+from .idempotency import IdempotencyKeyReused, TTLCache, request_hash
+from .ids import GameIdAllocator, allocate_game_id, get_allocator
+from .model import (Card, CardSet, Game, GameSnapshot, GameState, Hand,
+                    MoveEvent, MoveLog, Pattern, Player)
+
+logger = logging.getLogger(__name__)
+
+
+class GameNotFound(ValueError):
+    pass
+
+
+class MemoryStore:
+    """Keeps the persisted items in process, for tests and local runs"""
+
+    def __init__(self):
+        # game_id -> sk -> item, laid out like the snapshot table
+        self.items: Dict[str, Dict[str, Dict]] = {}
+        self.log_items: Dict[str, Dict[str, Dict]] = {}
+        self.n_saves = 0
+        # codes are claimed like the Lambdas claim them, on a game table in
+        # process
+        from .local import LocalDynamoDB
+
+        self.games = LocalDynamoDB()
+        self.allocator = GameIdAllocator()
+
+    async def load(self, game_id: str) -> Optional[GameSnapshot]:
+        items = self.items.get(game_id)
+        if not items:
+            return None
+
+        return GameSnapshot.from_items(list(items.values()))
+
+    async def move_events(self, game_id: str, last: int) -> List[MoveEvent]:
+        log = self.log_items.get(game_id, {})
+        last_sk = MoveLog.move_sk(last)
+        return [
+            MoveEvent.from_json(log[sk])
+            for sk in sorted(log)
+            if sk.startswith(MOVE_SK_PREFIX) and sk <= last_sk
+        ]
+
+    async def allocate_game_id(self, game: Callable[[str], Game]) -> str:
+        return self.allocator.allocate(self.games, lambda code: game(code).to_item())
+
+    async def save(self, game_id: str, entities: List, log_items: List[Dict]):
+        items = self.items.setdefault(game_id, {})
+        for item in GameSnapshot.to_items(game_id, entities):
+            items[item["sk"]] = item
+
+        log = self.log_items.setdefault(game_id, {})
+        for item in log_items:
+            log[item["sk"]] = item
+
+        self.n_saves += 1
+
+
+class DynamoDBStore:
+    """The snapshot table and move log, boto3 calls run in worker threads"""
+
+    def __init__(self, dynamodb=None):
+        self.dynamodb = dynamodb
+        # a server without ID_SCRAMBLE_KEY fails here, not at its first game
+        get_allocator()
+
+    def _dynamodb(self):
+        return self.dynamodb or get_dynamodb()
+
+    async def load(self, game_id: str) -> Optional[GameSnapshot]:
+        return await asyncio.to_thread(get_snapshot, game_id, self._dynamodb())
+
+    async def move_events(self, game_id: str, last: int) -> List[MoveEvent]:
+        return await asyncio.to_thread(
+            get_move_events, game_id, self._dynamodb(), 1, last
+        )
+
+    async def allocate_game_id(self, game: Callable[[str], Game]) -> str:
+        """Claims a code on the game table, shared with the Lambdas"""
+        return await asyncio.to_thread(
+            allocate_game_id, self._dynamodb(), lambda code: game(code).to_item()
+        )
+
+    async def save(self, game_id: str, entities: List, log_items: List[Dict]):
+        # serialized here so the actor can keep playing while the write runs
+        items = [*snapshot_items(game_id, entities), *log_items]
+        await asyncio.to_thread(self._put_items, items)
+
+    def _put_items(self, items: List[Dict]):
+        with self._dynamodb().Table(SNAPSHOT_TABLE).batch_writer() as batch:
+            for item in items:
+                batch.put_item(Item=item)
+
+
+class TableActor:
+    """
+    Owns one game, requests go through ``inbox`` and are applied serially by
+    ``run``. Changed entities are collected in ``dirty`` and written by
+    ``flush``, several moves to the same hand cost a single write.
+    """
+
+    def __init__(self, snapshot: GameSnapshot, store, seen: int = 0):
+        self.snapshot = snapshot
+        self.store = store
+        # the cards sent to the pot so far, the search does not deal them
+        self.seen = seen
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.dirty: Dict[str, Any] = {}
+        self.log_items: List[Dict] = []
+        self.task: Optional[asyncio.Task] = None
+        # one save at a time, a failed one puts its entities back before the
+        # next takes the buffer
+        self.flush_lock = asyncio.Lock()
+        self.last_used = 0.0
+
+    @property
+    def game_id(self) -> str:
+        return self.snapshot.game.id
+
+    @property
+    def finished(self) -> bool:
+        """Started with at most one player still in"""
+        players = self.snapshot.players
+        return (
+            self.snapshot.state is not None
+            and len(players) > 1
+            and sum(not player.is_out for player in players) <= 1
+        )
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        await self.inbox.put(None)
+        await self.task
+
+    async def run(self):
+        while 1:
+            message = await self.inbox.get()
+            if message is None:
+                break
+
+            method, args, future = message
+            if future.cancelled():
+                continue
+            try:
+                future.set_result(method(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+    async def call(self, method: Callable, *args):
+        future = asyncio.get_running_loop().create_future()
+        await self.inbox.put((method, args, future))
+        return await future
+
+    def mark_dirty(self, *entities):
+        for entity in entities:
+            self.dirty[GameSnapshot.sort_key(entity)] = entity
+
+    async def flush(self):
+        async with self.flush_lock:
+            if not self.dirty and not self.log_items:
+                return
+
+            entities, self.dirty = list(self.dirty.values()), {}
+            log_items, self.log_items = self.log_items, []
+            try:
+                await self.store.save(self.game_id, entities, log_items)
+            except Exception:
+                # keep anything changed since, the next flush retries the rest
+                for entity in entities:
+                    self.dirty.setdefault(GameSnapshot.sort_key(entity), entity)
+                self.log_items[:0] = log_items
+                raise
+
+    def join(self, player_name: str) -> Player:
+        game = self.snapshot.game
+        if not game.joinable:
+            raise ValueError("Game has already begun, cannot join")
+
+        hand = Hand(str(uuid.uuid4()))
+        player = Player(str(uuid.uuid4()), player_name, game.id, hand.id, False, -1)
+
+        game = Game(game.id, game.state_id, game.joinable, [*game.players, player.id])
+        self.snapshot.game = game
+        self.snapshot.players.append(player)
+        self.snapshot.hands.append(hand)
+        self.mark_dirty(game, player, hand)
+
+        return player
+
+    def start_game(self) -> GameState:
+        game = self.snapshot.game
+        if not game.joinable:
+            raise ValueError("Game has already begun")
+        if len(game.players) < 2:
+            raise ValueError("Game needs at least 2 players")
+
+        dealt = deal_hands(len(game.players), n_jokers=0)
+        for hand, cards in zip(self.snapshot.hands, dealt):
+            hand.cards = cards
+
+        # same defaults as create_state.vtl
+        starting_player_idx = get_starting_hand(dealt)
+        state = GameState(
+            id=str(uuid.uuid4()),
+            game_id=game.id,
+            active_player_idx=starting_player_idx,
+            active_player_id=game.players[starting_player_idx],
+            last_played_idx=-1,
+            _top_of_pile=[],
+            pot_size=0,
+            active_pattern=Pattern.NONE,
+            revolution=False,
+            direction=UP,
+        )
+        game = Game(game.id, state.id, False, game.players)
+
+        self.snapshot.game = game
+        self.snapshot.state = state
+        self.mark_dirty(game, state, *self.snapshot.hands)
+        self.log_items.append(MoveLog.checkpoint_item(game.id, self.snapshot))
+
+        return state
+
+    def play(
+        self,
+        player_id: str,
+        cards: List[Card],
+        discards: List[Card],
+        expected_version: Optional[int] = None,
+    ) -> GameState:
+        state = self.snapshot.state
+        if state is None:
+            raise ValueError("Game has not started")
+        if expected_version is not None and expected_version != state.version:
+            raise ConflictError(
+                f"Game {self.game_id} is at version {state.version}, "
+                f"not {expected_version}"
+            )
+        if self.snapshot.players[state.active_player_idx].id != player_id:
+            raise InvalidPlayError("Incorrect player")
+
+        next_state, new_hands, new_players = play_cards(
+            state, CardSet(cards), discards, self.snapshot.players, self.snapshot.hands
+        )
+
+        event = MoveEvent(next_state.version, player_id, cards, discards)
+        self.snapshot.state = next_state
+        self.seen |= seen_mask([event])
+        self.mark_dirty(next_state, *new_hands, *new_players)
+        self.log_items.append(MoveLog.move_item(self.game_id, event))
+        if next_state.version % CHECKPOINT_INTERVAL == 0:
+            self.log_items.append(MoveLog.checkpoint_item(self.game_id, self.snapshot))
+
+        return next_state
+
+
+@lru_cache(maxsize=256)
+def parse_query(query: str) -> DocumentNode:
+    # clients send the same few documents over and over
+    return parse(query)
+
+
+def field_arguments(selection, variables: Dict) -> Dict[str, Any]:
+    """Arguments of a field, one bound to a variable that was not sent is left out"""
+    ret = {}
+    for argument in selection.arguments or ():
+        value = value_from_ast_untyped(argument.value, variables)
+        if value is not Undefined:
+            ret[argument.name.value] = value
+
+    return ret
+
+
+def project(value: Any, selection_set) -> Any:
+    """Keeps the fields a query selected, like a GraphQL executor would"""
+    if selection_set is None or value is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, selection_set) for item in value]
+
+    ret = {}
+    for selection in selection_set.selections:
+        name = selection.name.value
+        key = selection.alias.value if selection.alias else name
+        ret[key] = project(value.get(name), selection.selection_set)
+
+    return ret
+
+
+class GameServer:
+    def __init__(
+        self,
+        store=None,
+        flush_interval: float = SERVER_FLUSH_INTERVAL,
+        idle_timeout: float = SERVER_IDLE_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.store = store if store is not None else MemoryStore()
+        self.flush_interval = flush_interval
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.tables: Dict[str, TableActor] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._evicting: Dict[str, asyncio.Future] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        # (game_id, field, idempotency key) -> (request hash, result future),
+        # kept in memory only, a restarted server runs a retried request again
+        self.replays = TTLCache()
+
+        self.resolvers: Dict[str, Callable[..., Awaitable[Any]]] = {
+            "createGame": self.create_game,
+            "joinGame": self.join_game,
+            "startGame": self.start_game,
+            "playCards": self.play_cards,
+            "getGame": self.get_game,
+            "gameState": self.game_state,
+            "gameHand": self.game_hand,
+            "suggestMove": self.suggest_move,
+        }
+
+    def _add_table(self, snapshot: GameSnapshot, seen: int = 0) -> TableActor:
+        actor = TableActor(snapshot, self.store, seen)
+        actor.start()
+        actor.last_used = self.clock()
+        self.tables[snapshot.game.id] = actor
+        return actor
+
+    async def table(self, game_id: str) -> TableActor:
+        game_id = game_id.upper()
+        # a table on its way out is reloaded once its last writes are stored
+        if game_id in self._evicting:
+            await asyncio.shield(self._evicting[game_id])
+        if game_id in self.tables:
+            actor = self.tables[game_id]
+            actor.last_used = self.clock()
+            return actor
+
+        # concurrent first requests for a table share one load
+        if game_id not in self._loading:
+            self._loading[game_id] = asyncio.ensure_future(self._load(game_id))
+        try:
+            loaded = await self._loading[game_id]
+        finally:
+            self._loading.pop(game_id, None)
+
+        if game_id in self.tables:
+            return self.tables[game_id]
+        if loaded is None:
+            raise GameNotFound(f"Game {game_id} does not exist")
+
+        return self._add_table(*loaded)
+
+    async def _load(self, game_id: str) -> Optional[Tuple[GameSnapshot, int]]:
+        snapshot = await self.store.load(game_id)
+        if snapshot is None:
+            return None
+
+        # later moves are added by TableActor.play
+        seen = 0
+        if snapshot.state is not None and snapshot.state.version:
+            seen = seen_mask(
+                await self.store.move_events(game_id, snapshot.state.version)
+            )
+
+        return snapshot, seen
+
+    async def create_game(self) -> Dict:
+        game_id = await self.store.allocate_game_id(
+            lambda code: Game(code, "", True, [])
+        )
+
+        game = Game(game_id, "", True, [])
+        actor = self._add_table(GameSnapshot(game, [], [], None))
+        actor.mark_dirty(game)
+
+        return game.to_item()
+
+    async def idempotent(
+        self,
+        field: str,
+        arguments: Dict,
+        key: Optional[str],
+        call: Callable[[], Awaitable[Dict]],
+    ) -> Dict:
+        """
+        Runs ``call`` once per idempotency key, a retry gets the result of the
+        first request, or waits for it if that request is still running
+        """
+        if not key:
+            return await call()
+
+        cache_key = (arguments["game_id"].upper(), field, key)
+        hashed = request_hash(arguments)
+        entry = self.replays.get(cache_key)
+        if entry is not None:
+            if entry[0] != hashed:
+                raise IdempotencyKeyReused(
+                    "Idempotency key was already used with different arguments"
+                )
+            return await asyncio.shield(entry[1])
+
+        future = asyncio.get_running_loop().create_future()
+        self.replays.put(cache_key, (hashed, future))
+        try:
+            result = await call()
+        except BaseException as e:
+            # a failed request is not replayed, a retry runs it again
+            self.replays.pop(cache_key)
+            future.set_exception(e)
+            future.exception()
+            raise
+
+        future.set_result(result)
+        return result
+
+    async def join_game(
+        self, game_id: str, player_name: str, idempotency_key: Optional[str] = None
+    ) -> Dict:
+        async def join():
+            actor = await self.table(game_id)
+            player = await actor.call(actor.join, player_name)
+            return player.to_item()
+
+        arguments = dict(game_id=game_id, player_name=player_name)
+        return await self.idempotent("joinGame", arguments, idempotency_key, join)
+
+    async def start_game(
+        self, game_id: str, idempotency_key: Optional[str] = None
+    ) -> Dict:
+        async def start():
+            actor = await self.table(game_id)
+            state = await actor.call(actor.start_game)
+            return state.to_item(card_format="json")
+
+        arguments = dict(game_id=game_id)
+        return await self.idempotent("startGame", arguments, idempotency_key, start)
+
+    async def play_cards(
+        self,
+        game_id: str,
+        player_id: str,
+        cards: List[str],
+        discards: List[str],
+        expected_version: Optional[int] = None,
+        idempotency_key: Optional[str] = None,
+    ) -> Dict:
+        async def play():
+            actor = await self.table(game_id)
+            state = await actor.call(
+                actor.play,
+                player_id,
+                [Card.from_json(card_json) for card_json in cards],
+                [Card.from_json(card_json) for card_json in discards],
+                expected_version,
+            )
+            return state.to_item(card_format="json")
+
+        arguments = dict(
+            game_id=game_id,
+            player_id=player_id,
+            cards=cards,
+            discards=discards,
+            expected_version=expected_version,
+        )
+        return await self.idempotent("playCards", arguments, idempotency_key, play)
+
+    async def get_game(self, id: str) -> Dict:
+        actor = await self.table(id)
+        return actor.snapshot.game.to_item()
+
+    async def game_state(self, game_id: str) -> Optional[Dict]:
+        actor = await self.table(game_id)
+        state = actor.snapshot.state
+        return state.to_item() if state else None
+
+    async def game_hand(self, game_id: str, id: str) -> Optional[Dict]:
+        actor = await self.table(game_id)
+        for hand in actor.snapshot.hands:
+            if hand.id == id:
+                return hand.to_item()
+
+        return None
+
+    async def suggest_move(self, game_id: str, player_id: str) -> Dict:
+        actor = await self.table(game_id)
+        snapshot = actor.snapshot
+        state = snapshot.state
+        if state is None:
+            raise ValueError("Game has not started")
+        if state.active_player_id != player_id:
+            raise ValueError("Not this player's turn")
+
+        # the search runs in a thread on a copy, the actor keeps taking moves
+        suggestion = await asyncio.to_thread(
+            suggest_move,
+            state,
+            [replace(player) for player in snapshot.players],
+            snapshot.hands[state.active_player_idx].mask,
+            [len(hand) for hand in snapshot.hands],
+            actor.seen,
+        )
+        return suggestion.to_json()
+
+    async def execute(self, request: Dict) -> Dict:
+        """Runs one GraphQL request body and returns the response body"""
+        try:
+            document = parse_query(request["query"])
+        except (GraphQLError, KeyError, TypeError) as e:
+            return {"errors": [{"message": str(e), "errorType": "BadRequest"}]}
+
+        variables = request.get("variables") or {}
+
+        data = {}
+        for definition in document.definitions:
+            for selection in definition.selection_set.selections:
+                name = selection.name.value
+                key = selection.alias.value if selection.alias else name
+
+                resolver = self.resolvers.get(name)
+                if resolver is None:
+                    message = f"{name} is not served by the game server"
+                    return {"errors": [{"message": message, "errorType": "BadRequest"}]}
+
+                try:
+                    result = await resolver(**field_arguments(selection, variables))
+                except (ValueError, TypeError) as e:
+                    error = {"message": str(e), "errorType": type(e).__name__}
+                    return {"data": {key: None}, "errors": [error]}
+
+                data[key] = project(result, selection.selection_set)
+
+        return {"data": data}
+
+    async def flush(self):
+        results = await asyncio.gather(
+            *[actor.flush() for actor in list(self.tables.values())],
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Write-behind flush failed: {result!r}")
+
+    async def evict(self, game_id: str) -> bool:
+        """
+        Stops the actor of a table after the requests already in its inbox,
+        flushes it and drops it. A table whose flush fails is started again
+        and kept, nothing is dropped before it is stored.
+        """
+        actor = self.tables.pop(game_id, None)
+        if actor is None:
+            return False
+
+        async def retire():
+            await actor.stop()
+            try:
+                await actor.flush()
+            except Exception:
+                actor.start()
+                self.tables[game_id] = actor
+                raise
+
+        self._evicting[game_id] = asyncio.ensure_future(retire())
+        try:
+            # closing the server cancels the flush loop, not a table half stored
+            await asyncio.shield(self._evicting[game_id])
+        finally:
+            self._evicting.pop(game_id)
+
+        return True
+
+    async def evict_idle(self) -> int:
+        """Evicts finished tables and those idle for ``idle_timeout``"""
+        cutoff = self.clock() - self.idle_timeout
+        game_ids = [
+            game_id
+            for game_id, actor in self.tables.items()
+            if actor.finished or actor.last_used < cutoff
+        ]
+        results = await asyncio.gather(
+            *[self.evict(game_id) for game_id in game_ids], return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Evicting a table failed: {result!r}")
+
+        return sum(result is True for result in results)
+
+    async def _flush_loop(self):
+        while 1:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            await self.evict_idle()
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            while 1:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                headers = {}
+                while 1:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, response = await self._respond(request_line, body)
+                payload = json.dumps(response).encode()
+                writer.write(
+                    b"HTTP/1.1 %s\r\n"
+                    b"Content-Type: application/json\r\n"
+                    b"Content-Length: %d\r\n\r\n" % (status, len(payload)) + payload
+                )
+                await writer.drain()
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, request_line: bytes, body: bytes) -> Tuple[bytes, Dict]:
+        if not request_line.startswith(b"POST "):
+            return b"405 Method Not Allowed", {"errors": [{"message": "POST only"}]}
+
+        try:
+            request = json.loads(body)
+        except ValueError as e:
+            return b"400 Bad Request", {"errors": [{"message": str(e)}]}
+
+        return b"200 OK", await self.execute(request)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080):
+        self._flusher = asyncio.create_task(self._flush_loop())
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+
+        return self._server.sockets[0].getsockname()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._flusher is not None:
+            self._flusher.cancel()
+        await asyncio.gather(*self._evicting.values(), return_exceptions=True)
+
+        for actor in list(self.tables.values()):
+            await actor.stop()
+        await self.flush()
+
+
+async def serve(
+    host: str,
+    port: int,
+    store=None,
+    flush_interval=SERVER_FLUSH_INTERVAL,
+    idle_timeout=SERVER_IDLE_TIMEOUT,
+):
+    server = GameServer(store, flush_interval, idle_timeout)
+    address = await server.start(host, port)
+    logger.info(f"Serving on http://{address[0]}:{address[1]}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
@@ -0,0 +1,260 @@
+"""
+Headless self-play, runs complete games in-process with no DynamoDB or AppSync
+"""
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .cards import CARD_RANKS, ids_of
+from .common import deal_hands, get_starting_hand
+from .constants import UP
+from .daifugo import legal_move_masks, play_cards
+from .model import CardSet, GameState, Hand, Pattern, Player, decode_cards
+
+MoveMasks = Tuple[int, int]
+Policy = Callable[
+    [List[MoveMasks], int, GameState, random.Random], Optional[MoveMasks]
+]
+
+
+def random_policy(
+    moves: List[MoveMasks], hand_mask: int, game_state: GameState, rng: random.Random
+) -> Optional[MoveMasks]:
+    if not moves:
+        return None
+
+    return rng.choice(moves)
+
+
+def _move_strength(move: MoveMasks, game_state: GameState) -> int:
+    rank = CARD_RANKS[ids_of(move[0])[0]]
+    return rank if game_state.direction == UP else -rank
+
+
+def greedy_lowest_policy(
+    moves: List[MoveMasks], hand_mask: int, game_state: GameState, rng: random.Random
+) -> Optional[MoveMasks]:
+    """Sheds the weakest rank first, as many cards and discards as possible"""
+    if not moves:
+        return None
+
+    return min(
+        moves,
+        key=lambda move: (
+            _move_strength(move, game_state),
+            -(move[0] | move[1]).bit_count(),
+        ),
+    )
+
+
+def greedy_highest_policy(
+    moves: List[MoveMasks], hand_mask: int, game_state: GameState, rng: random.Random
+) -> Optional[MoveMasks]:
+    if not moves:
+        return None
+
+    return max(
+        moves,
+        key=lambda move: (
+            _move_strength(move, game_state),
+            (move[0] | move[1]).bit_count(),
+        ),
+    )
+
+
+POLICIES: Dict[str, Policy] = {
+    "random": random_policy,
+    "greedy-lowest": greedy_lowest_policy,
+    "greedy-highest": greedy_highest_policy,
+}
+
+
+@dataclass
+class GameResult:
+    seed: int
+    n_moves: int
+    n_revolutions: int
+    # finishing rank of each seat, 0 is the daifugo
+    ranks: List[int]
+    truncated: bool
+
+
+def new_game(
+    n_players: int, rng: random.Random
+) -> Tuple[GameState, List[Player], List[Hand]]:
+    dealt = deal_hands(n_players, n_jokers=0, rng=rng)
+    starting_player_idx = get_starting_hand(dealt)
+
+    players = [
+        Player(f"p{i}", f"player{i}", "SIM", f"h{i}", False, -1)
+        for i in range(n_players)
+    ]
+    hands = [Hand(f"h{i}", cards) for i, cards in enumerate(dealt)]
+    game_state = GameState(
+        id="state",
+        game_id="SIM",
+        active_player_idx=starting_player_idx,
+        active_player_id=players[starting_player_idx].id,
+        last_played_idx=-1,
+        _top_of_pile=[],
+        pot_size=0,
+        active_pattern=Pattern.NONE,
+        revolution=False,
+        direction=UP,
+    )
+
+    return game_state, players, hands
+
+
+def run_game(
+    seed: int,
+    n_players: int = 4,
+    policies: Sequence[str] = ("random",),
+    max_moves: int = 2000,
+) -> GameResult:
+    rng = random.Random(seed)
+    game_state, players, hands = new_game(n_players, rng)
+    seat_policies = [POLICIES[policies[i % len(policies)]] for i in range(n_players)]
+
+    n_moves = 0
+    n_revolutions = 0
+    while sum(not player.is_out for player in players) > 1 and n_moves < max_moves:
+        idx = game_state.active_player_idx
+        hand = hands[idx]
+
+        moves = [] if players[idx].is_out else legal_move_masks(hand.mask, game_state)
+        move = seat_policies[idx](moves, hand.mask, game_state, rng)
+
+        if move is None:
+            cards, discards = CardSet(), []
+        else:
+            cards, discards = CardSet(mask=move[0]), decode_cards(ids_of(move[1]))
+
+        revolution = game_state.revolution
+        game_state, _, _ = play_cards(game_state, cards, discards, players, hands)
+
+        n_moves += 1
+        n_revolutions += game_state.revolution != revolution
+
+    truncated = n_moves >= max_moves
+    last_rank = max(player.rank for player in players) + 1
+    ranks = [player.rank if player.is_out else last_rank for player in players]
+
+    return GameResult(seed, n_moves, n_revolutions, ranks, truncated)
+
+
+def run_games(
+    seeds: Sequence[int],
+    n_players: int,
+    policies: Sequence[str],
+    max_moves: int,
+) -> List[GameResult]:
+    return [run_game(seed, n_players, policies, max_moves) for seed in seeds]
+
+
+@dataclass
+class SimulationStats:
+    n_players: int
+    n_games: int = 0
+    n_moves: int = 0
+    min_moves: Optional[int] = None
+    max_moves: Optional[int] = None
+    n_revolutions: int = 0
+    games_with_revolution: int = 0
+    n_truncated: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    elapsed: float = 0.0
+    # seat_ranks[seat][rank] counts how often a seat finished at a rank
+    seat_ranks: List[List[int]] = field(default_factory=list)
+
+    def __post_init__(self):
+        if not self.seat_ranks:
+            self.seat_ranks = [[0] * self.n_players for _ in range(self.n_players)]
+
+    def update(self, result: GameResult):
+        self.n_games += 1
+        self.n_moves += result.n_moves
+        self.min_moves = min(self.min_moves or result.n_moves, result.n_moves)
+        self.max_moves = max(self.max_moves or 0, result.n_moves)
+        self.n_revolutions += result.n_revolutions
+        self.games_with_revolution += result.n_revolutions > 0
+        self.n_truncated += result.truncated
+
+        for seat, rank in enumerate(result.ranks):
+            self.seat_ranks[seat][rank] += 1
+
+        self.elapsed = time.perf_counter() - self.started
+
+    @property
+    def mean_moves(self) -> float:
+        return self.n_moves / self.n_games if self.n_games else 0.0
+
+    @property
+    def revolution_rate(self) -> float:
+        return self.games_with_revolution / self.n_games if self.n_games else 0.0
+
+    @property
+    def games_per_sec(self) -> float:
+        return self.n_games / self.elapsed if self.elapsed else 0.0
+
+    def win_rates(self) -> List[float]:
+        if not self.n_games:
+            return [0.0] * self.n_players
+
+        return [ranks[0] / self.n_games for ranks in self.seat_ranks]
+
+    def summary(self) -> Dict[str, object]:
+        return dict(
+            games=self.n_games,
+            mean_moves=round(self.mean_moves, 2),
+            min_moves=self.min_moves,
+            max_moves=self.max_moves,
+            revolution_rate=round(self.revolution_rate, 4),
+            truncated=self.n_truncated,
+            win_rates=[round(rate, 4) for rate in self.win_rates()],
+            games_per_sec=round(self.games_per_sec, 1),
+        )
+
+
+def simulate(
+    n_games: int,
+    n_players: int = 4,
+    policies: Sequence[str] = ("random",),
+    seed: int = 0,
+    workers: int = 1,
+    chunk_size: int = 100,
+    max_moves: int = 2000,
+) -> Iterator[SimulationStats]:
+    """
+    Plays ``n_games`` and yields the running stats after every finished chunk.
+    Game ``i`` is always seeded with ``seed + i`` so results do not depend on
+    the number of workers.
+    """
+    for policy in policies:
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy}")
+
+    stats = SimulationStats(n_players)
+    chunks = [
+        range(seed + start, seed + min(start + chunk_size, n_games))
+        for start in range(0, n_games, chunk_size)
+    ]
+
+    if workers <= 1:
+        for chunk in chunks:
+            for result in run_games(chunk, n_players, policies, max_moves):
+                stats.update(result)
+            yield stats
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(run_games, chunk, n_players, policies, max_moves)
+            for chunk in chunks
+        ]
+        for future in as_completed(futures):
+            for result in future.result():
+                stats.update(result)
+            yield stats
@@ -1,51 +1,66 @@
 import logging
 
-import boto3
-import urllib3
-
-from .common import (deal_hands, get_game, get_players, get_starting_hand,
-                     post_mutation, update_hand)
-from .mutations import CREATE_STATE_MUTATION, UPDATE_GAME_MUTATION
+from .common import (deal_hands, get_dynamodb, get_http_client,
+                     get_starting_hand, hand_update, load_game_snapshot,
+                     post_mutation, post_mutations, put_checkpoint,
+                     put_snapshot, raise_for_errors, state_create)
+from .idempotency import checkpoint, idempotent, progress
+from .model import Card, Game, GameSnapshot, GameState, Hand
+from .mutations import UPDATE_GAME_MUTATION
+from .tracing import annotate, handler_trace
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+@handler_trace("start_game")
+@idempotent("startGame")
 def start_game_handler(event, context):
     # TODO: add logic so only the creator of the game can start it
 
     logger.info(event)
 
-    dynamodb = boto3.resource("dynamodb")
-    http_client = urllib3.PoolManager()
+    dynamodb = get_dynamodb()
+    http_client = get_http_client()
 
     game_id = event["arguments"]["game_id"].upper()
-    game = get_game(game_id, dynamodb)
+    snapshot = load_game_snapshot(game_id, dynamodb)
+    game = snapshot.game
 
-    player_ids = game.players
-    n_players = len(player_ids)
-    players = get_players(player_ids, dynamodb)
+    n_players = len(game.players)
+    annotate(game_id=game_id, players=n_players)
+    players = snapshot.players
 
     hand_ids = [player.hand_id for player in players]
-    hands = deal_hands(n_players, n_jokers=0)
 
-    for cards, hand_id in zip(hands, hand_ids):
-        hand = update_hand(hand_id, cards, http_client)
-        logger.info(hand.cards)
+    # a retried start keeps the deal of the attempt that failed after it
+    done = progress()
+    if "state" in done:
+        hands = [[Card.from_json(card) for card in cards] for cards in done["hands"]]
+        state_json = done["state"]
+    else:
+        hands = deal_hands(n_players, n_jokers=0)
 
-    # TODO: create initial game state
-    starting_player_idx = get_starting_hand(hands)
-    starting_player_id = game.players[starting_player_idx]
+        starting_player_idx = get_starting_hand(hands)
+        starting_player_id = game.players[starting_player_idx]
 
-    state_json = post_mutation(
-        CREATE_STATE_MUTATION,
-        http_client,
-        variables=dict(
-            game_id=game_id,
-            active_player_id=starting_player_id,
-            active_player_idx=starting_player_idx,
-        ),
-    )
+        # the deal and the initial state do not depend on each other
+        results = post_mutations(
+            [
+                *[
+                    hand_update(hand_id, cards)
+                    for cards, hand_id in zip(hands, hand_ids)
+                ],
+                state_create(game_id, starting_player_id, starting_player_idx),
+            ],
+            http_client,
+        )
+        *hands_json, state_json = raise_for_errors(results)
+        logger.info(hands_json)
+        checkpoint(
+            hands=[[card.to_json() for card in cards] for cards in hands],
+            state=state_json,
+        )
 
     update_game_json = post_mutation(
         UPDATE_GAME_MUTATION,
@@ -53,4 +68,18 @@ def start_game_handler(event, context):
         variables=dict(id=game_id, joinable=False, state_id=state_json["id"]),
     )
 
+    # the deal is checkpoint 0 of the move log, every later move replays from it
+    snapshot = GameSnapshot(
+        Game(game_id, state_json["id"], False, game.players),
+        players,
+        [Hand(hand_id, cards) for cards, hand_id in zip(hands, hand_ids)],
+        GameState.from_json(state_json),
+    )
+    put_snapshot(
+        game_id,
+        [snapshot.game, *snapshot.players, *snapshot.hands, snapshot.state],
+        dynamodb,
+    )
+    put_checkpoint(game_id, snapshot, dynamodb)
+
     return state_json
@@ -0,0 +1,54 @@
+import logging
+
+from .bot import seen_mask, suggest_move
+from .common import get_dynamodb, get_move_events, load_game_snapshot
+from .constants import BOT_TIME_LIMIT, BOT_TIME_MARGIN
+from .tracing import annotate, handler_trace, span
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@handler_trace("suggest_move")
+def suggest_move_handler(event, context):
+    """
+    Suggests a move for the active player from their own hand and the public
+    state, the other hands only contribute their sizes. The cards played so
+    far, from the move log, are not dealt to anyone by the search.
+    """
+    logger.info(event)
+
+    game_id = event["arguments"]["game_id"].upper()
+    player_id = event["arguments"]["player_id"]
+
+    dynamodb = get_dynamodb()
+    snapshot = load_game_snapshot(game_id, dynamodb)
+    state = snapshot.state
+    annotate(game_id=game_id, players=len(snapshot.players))
+    if state is None:
+        raise ValueError("Game has not started")
+    if state.active_player_id != player_id:
+        raise ValueError("Not this player's turn")
+
+    seen = 0
+    if state.version:
+        with span("suggest_move.seen"):
+            seen = seen_mask(get_move_events(game_id, dynamodb, 1, state.version))
+
+    time_limit = BOT_TIME_LIMIT
+    remaining_ms = getattr(context, "get_remaining_time_in_millis", None)
+    if remaining_ms is not None:
+        time_limit = min(time_limit, remaining_ms() / 1000 - BOT_TIME_MARGIN)
+
+    with span("suggest_move.search"):
+        suggestion = suggest_move(
+            state,
+            snapshot.players,
+            snapshot.hands[state.active_player_idx].mask,
+            [len(hand) for hand in snapshot.hands],
+            seen,
+            time_limit=max(time_limit, 0.0),
+        )
+    annotate(iterations=suggestion.iterations)
+
+    return suggestion.to_json()
@@ -0,0 +1,34 @@
+import logging
+import time
+
+from .common import get_dynamodb
+from .constants import SWEEP_TIME_MARGIN
+from .sweeper import Sweeper, get_archive
+from .tracing import annotate, handler_trace
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@handler_trace("sweep")
+def sweep_handler(event, context):
+    """
+    Scheduled sweep of finished and idle games, it carries on from where the
+    last run stopped and stops itself before the Lambda timeout
+    """
+    logger.info(event)
+
+    deadline = None
+    remaining_ms = getattr(context, "get_remaining_time_in_millis", None)
+    if remaining_ms is not None:
+        deadline = time.monotonic() + remaining_ms() / 1000 - SWEEP_TIME_MARGIN
+
+    # without a durable archive configured the sweep refuses to delete
+    sweeper = Sweeper(get_dynamodb(), get_archive())
+    result = sweeper.run(sweeper.load_cursor(), deadline=deadline)
+    sweeper.save_cursor(result.cursor)
+
+    annotate(games=result.games, deleted_items=result.deleted_items, **result.swept)
+    logger.info(result)
+
+    return result.to_json()
@@ -0,0 +1,566 @@
+"""
+Sweeper of finished and abandoned games. Every write to a game stamps
+``last_active`` on the snapshot items it writes, the sweeper scans the snapshot
+table for game and state items and loads every game whose newest stamp is older
+than ``SWEEP_FINISHED_AFTER``. A finished game of that age, or any game older
+than ``SWEEP_IDLE_AFTER``, is appended to a gzipped archive on disk and its
+items are deleted with batch_write_item: the snapshot partition, the move log,
+the idempotency records and the entity tables. A game is only deleted once it
+is archived somewhere that outlives the sweep, S3 or a directory that is not
+the ephemeral storage of a Lambda.
+
+Reads and writes are paced to a share of the provisioned capacity so a sweep
+over millions of items runs next to live games on the 1 unit tables. A
+scheduled run stops short of the Lambda timeout and saves the scan position,
+the next run carries on from there.
+"""
+import glob
+import gzip
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from decimal import Decimal
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from .common import batch_write, get_items
+from .constants import (ARCHIVE_BUCKET, ARCHIVE_DIR, ARCHIVE_PREFIX,
+                        BATCH_WRITE_SIZE, GAME_SK, GAME_TABLE, HAND_TABLE,
+                        LAST_ACTIVE, PLAYER_SK_PREFIX, PLAYER_TABLE,
+                        SNAPSHOT_TABLE, STATE_SK, STATE_TABLE, SWEEP_CURSOR_PK,
+                        SWEEP_FINISHED_AFTER, SWEEP_IDLE_AFTER,
+                        SWEEP_READ_UNITS, SWEEP_SCAN_PAGE, SWEEP_WRITE_UNITS)
+from .idempotency import IdempotencyStore
+from .model import MoveLog
+from .tracing import count
+
+logger = logging.getLogger(__name__)
+
+FINISHED = "finished"
+IDLE = "idle"
+
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def item_units(item: Dict, unit_bytes: int) -> int:
+    """Rough capacity units of an item, 1KB per write unit and 4KB per read"""
+    return -(-len(json.dumps(item, default=json_default)) // unit_bytes)
+
+
+class RateLimiter:
+    """
+    Paces calls to ``rate`` units per second. A call may take more than a
+    second's worth, the next call then waits until it is paid off.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self.next_at = 0.0
+
+    def acquire(self, units: float):
+        now = self.clock()
+        if self.next_at > now:
+            self.sleep(self.next_at - now)
+            now = self.next_at
+
+        self.next_at = now + units / self.rate
+
+
+class ArchiveRequired(RuntimeError):
+    pass
+
+
+class ArchiveStore:
+    """
+    Gzipped JSON lines under ``root``, one segment file per sweep. Every game is
+    appended as a gzip member of its own and synced to disk before its items
+    are deleted, a reader sees the members as one stream.
+    """
+
+    def __init__(self, root: str = ARCHIVE_DIR, segment: Optional[str] = None):
+        self.root = root
+        self.segment = segment or (
+            time.strftime("sweep-%Y%m%dT%H%M%S-") + uuid.uuid4().hex[:8] + ".jsonl.gz"
+        )
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.root, self.segment)
+
+    @property
+    def durable(self) -> bool:
+        """False for the /tmp of a Lambda, it goes with the execution environment"""
+        if not os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+            return True
+
+        root = os.path.realpath(self.root)
+        return not (root == "/tmp" or root.startswith("/tmp/"))
+
+    def append(self, record: Dict):
+        os.makedirs(self.root, exist_ok=True)
+        line = json.dumps(record, default=json_default) + "\n"
+        with open(self.path, "ab") as f:
+            f.write(gzip.compress(line.encode()))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def records(self) -> Iterator[Dict]:
+        for path in sorted(glob.glob(os.path.join(self.root, "*.jsonl.gz"))):
+            with gzip.open(path, "rt") as f:
+                for line in f:
+                    yield json.loads(line)
+
+    def find(self, game_id: str) -> Optional[Dict]:
+        """The latest archive of ``game_id``"""
+        ret = None
+        for record in self.records():
+            if record["game_id"] == game_id:
+                ret = record
+
+        return ret
+
+
+class S3ArchiveStore:
+    """
+    A gzipped JSON object per game under ``<prefix><game_id>/``. A put returns
+    once the object is stored durably, so the game's items can go right after.
+    """
+
+    durable = True
+
+    def __init__(self, bucket: str, prefix: str = ARCHIVE_PREFIX, s3=None):
+        if s3 is None:
+            import boto3
+
+            s3 = boto3.client("s3")
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.s3 = s3
+
+    def key(self, record: Dict) -> str:
+        return f"{self.prefix}{record['game_id']}/{record['archived_at']}.json.gz"
+
+    def append(self, record: Dict):
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=self.key(record),
+            Body=gzip.compress(json.dumps(record, default=json_default).encode()),
+            ContentType="application/json",
+            ContentEncoding="gzip",
+        )
+
+    def _keys(self, prefix: str) -> List[str]:
+        keys = []
+        kwargs = dict(Bucket=self.bucket, Prefix=prefix)
+        while 1:
+            data = self.s3.list_objects_v2(**kwargs)
+            keys += [obj["Key"] for obj in data.get("Contents", [])]
+
+            if not data.get("IsTruncated"):
+                break
+            kwargs["ContinuationToken"] = data["NextContinuationToken"]
+
+        return keys
+
+    def _get(self, key: str) -> Dict:
+        body = self.s3.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        return json.loads(gzip.decompress(body))
+
+    def records(self) -> Iterator[Dict]:
+        for key in self._keys(self.prefix):
+            yield self._get(key)
+
+    def find(self, game_id: str) -> Optional[Dict]:
+        """The latest archive of ``game_id``"""
+        keys = self._keys(f"{self.prefix}{game_id}/")
+        if not keys:
+            return None
+
+        return self._get(max(keys, key=lambda key: int(key.rsplit("/", 1)[1][:-8])))
+
+
+def get_archive() -> Optional[Union[ArchiveStore, S3ArchiveStore]]:
+    """The archive the environment configures, S3 if ``ARCHIVE_BUCKET`` is set"""
+    if ARCHIVE_BUCKET:
+        return S3ArchiveStore(ARCHIVE_BUCKET)
+    if os.environ.get("ARCHIVE_DIR"):
+        return ArchiveStore(ARCHIVE_DIR)
+
+    return None
+
+
+@dataclass
+class GameItems:
+    game_id: str
+    # table name -> every item of the game in it
+    tables: Dict[str, List[Dict]]
+
+    @property
+    def snapshot_items(self) -> List[Dict]:
+        return [
+            item
+            for item in self.tables.get(SNAPSHOT_TABLE, [])
+            if item["game_id"] == self.game_id
+        ]
+
+    @property
+    def last_active(self) -> Optional[int]:
+        stamps = [
+            int(item[LAST_ACTIVE])
+            for item in self.snapshot_items
+            if item.get(LAST_ACTIVE) is not None
+        ]
+        return max(stamps) if stamps else None
+
+    @property
+    def finished(self) -> bool:
+        """Started with at most one player still in"""
+        items = self.snapshot_items
+        ranks = [
+            int(item["rank"])
+            for item in items
+            if item["sk"].startswith(PLAYER_SK_PREFIX)
+        ]
+        started = any(item["sk"] == STATE_SK for item in items)
+        return started and len(ranks) > 1 and ranks.count(-1) <= 1
+
+
+@dataclass
+class SweepResult:
+    games: int = 0
+    swept: Dict[str, int] = field(default_factory=dict)
+    deleted_items: int = 0
+    # where the next run carries on, None once the whole table was scanned
+    cursor: Optional[Dict] = None
+
+    def to_json(self) -> Dict:
+        return asdict(self)
+
+
+class Sweeper:
+    def __init__(
+        self,
+        dynamodb,
+        archive: Optional[ArchiveStore] = None,
+        finished_after: int = SWEEP_FINISHED_AFTER,
+        idle_after: int = SWEEP_IDLE_AFTER,
+        read_limiter: Optional[RateLimiter] = None,
+        write_limiter: Optional[RateLimiter] = None,
+        clock: Callable[[], float] = time.time,
+        dry_run: bool = False,
+    ):
+        self.dynamodb = dynamodb
+        self.table = dynamodb.Table(SNAPSHOT_TABLE)
+        self.archive = archive
+        self.finished_after = finished_after
+        self.idle_after = idle_after
+        self.read_limiter = read_limiter or RateLimiter(SWEEP_READ_UNITS)
+        self.write_limiter = write_limiter or RateLimiter(SWEEP_WRITE_UNITS)
+        self.clock = clock
+        self.dry_run = dry_run
+
+    def _read(self, data: Dict) -> Dict:
+        consumed = data.get("ConsumedCapacity") or {}
+        self.read_limiter.acquire(float(consumed.get("CapacityUnits") or 1))
+        return data
+
+    def scan_pages(
+        self, cursor: Optional[Dict] = None
+    ) -> Iterator[Tuple[List[Dict], Optional[Dict]]]:
+        """Pages of game and state items with the scan position after each page"""
+        scan = dict(
+            FilterExpression="sk = :game OR sk = :state",
+            ProjectionExpression="game_id, sk, #last_active",
+            ExpressionAttributeNames={"#last_active": LAST_ACTIVE},
+            ExpressionAttributeValues={":game": GAME_SK, ":state": STATE_SK},
+            Limit=SWEEP_SCAN_PAGE,
+            ReturnConsumedCapacity="TOTAL",
+        )
+        if cursor:
+            scan["ExclusiveStartKey"] = cursor
+
+        while 1:
+            data = self._read(self.table.scan(**scan))
+            cursor = data.get("LastEvaluatedKey")
+            yield data["Items"], cursor
+
+            if cursor is None:
+                break
+            scan["ExclusiveStartKey"] = cursor
+
+    def _query(self, partition: str) -> List[Dict]:
+        from boto3.dynamodb.conditions import Key
+
+        query = dict(
+            KeyConditionExpression=Key("game_id").eq(partition),
+            ConsistentRead=True,
+            ReturnConsumedCapacity="TOTAL",
+        )
+
+        items = []
+        while 1:
+            data = self._read(self.table.query(**query))
+            items += data["Items"]
+
+            if "LastEvaluatedKey" not in data:
+                break
+            query["ExclusiveStartKey"] = data["LastEvaluatedKey"]
+
+        return items
+
+    def _get(self, ids: List[str], table_name: str) -> List[Dict]:
+        ids = [_id for _id in ids if _id]
+        if not ids:
+            return []
+
+        # batch reads report one total, paced at a unit per item
+        self.read_limiter.acquire(len(ids))
+        return get_items(ids, self.dynamodb, table_name)
+
+    def load(self, game_id: str) -> GameItems:
+        """Every item of the game, snapshot or not, across all the tables"""
+        snapshot = self._query(game_id)
+        tables = {
+            SNAPSHOT_TABLE: [
+                *snapshot,
+                *self._query(MoveLog.partition(game_id)),
+                *self._query(IdempotencyStore.partition(game_id)),
+            ],
+            GAME_TABLE: self._get([game_id], GAME_TABLE),
+        }
+
+        games = [item for item in snapshot if item["sk"] == GAME_SK]
+        games = games or tables[GAME_TABLE]
+        player_ids = [_id for game in games for _id in game.get("players") or []]
+        tables[PLAYER_TABLE] = self._get(player_ids, PLAYER_TABLE)
+
+        hand_ids = [
+            item["hand_id"]
+            for item in [*snapshot, *tables[PLAYER_TABLE]]
+            if item.get("hand_id")
+        ]
+        tables[HAND_TABLE] = self._get(sorted(set(hand_ids)), HAND_TABLE)
+        tables[STATE_TABLE] = self._get(
+            [game.get("state_id") for game in games[:1]], STATE_TABLE
+        )
+
+        return GameItems(game_id, tables)
+
+    def reason(self, game: GameItems) -> Optional[str]:
+        """Why the game should go, None to keep it"""
+        now = self.clock()
+        last_active = game.last_active
+        if last_active is None:
+            # games from before the stamp get a full idle period from now
+            if not self.dry_run and any(
+                item["sk"] == GAME_SK for item in game.snapshot_items
+            ):
+                self.touch(game.game_id, int(now))
+            return None
+
+        if game.finished and last_active < now - self.finished_after:
+            return FINISHED
+        if last_active < now - self.idle_after:
+            return IDLE
+
+        return None
+
+    def touch(self, game_id: str, now: int):
+        self.write_limiter.acquire(1)
+        self.table.update_item(
+            Key={"game_id": game_id, "sk": GAME_SK},
+            UpdateExpression="SET #last_active = :now",
+            ExpressionAttributeNames={"#last_active": LAST_ACTIVE},
+            ExpressionAttributeValues={":now": now},
+        )
+
+    @staticmethod
+    def fence_item(game: GameItems) -> Optional[Dict]:
+        items = {item["sk"]: item for item in game.snapshot_items}
+        return items.get(STATE_SK) or items.get(GAME_SK)
+
+    def fence(self, game: GameItems) -> bool:
+        """
+        Deletes the state item, or the game item before the game started, on
+        the condition that no write touched it since the game was loaded. A
+        game that became active again is kept.
+        """
+        from botocore.exceptions import ClientError
+
+        item = self.fence_item(game)
+        if item is None:
+            return True
+
+        if item.get(LAST_ACTIVE) is None:
+            condition = dict(ConditionExpression="attribute_not_exists(#last_active)")
+        else:
+            condition = dict(
+                ConditionExpression="#last_active = :seen",
+                ExpressionAttributeValues={":seen": item[LAST_ACTIVE]},
+            )
+
+        self.write_limiter.acquire(item_units(item, 1024))
+        try:
+            self.table.delete_item(
+                Key={"game_id": item["game_id"], "sk": item["sk"]},
+                ExpressionAttributeNames={"#last_active": LAST_ACTIVE},
+                **condition,
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            count("sweep_fence_conflicts")
+            return False
+
+        return True
+
+    def _delete_page(self, page: List[Tuple[str, Dict, Dict]]):
+        # a delete costs what writing the item would
+        self.write_limiter.acquire(sum(item_units(item, 1024) for _, item, _ in page))
+        batch_write(
+            [
+                (table_name, {"DeleteRequest": {"Key": key}})
+                for table_name, _, key in page
+            ],
+            self.dynamodb,
+        )
+
+    def delete(self, game: GameItems, fence: bool = True) -> int:
+        """
+        Deletes the game's items in paced pages and returns how many went. The
+        snapshot game item goes last, on its own, so the next sweep still finds
+        a game whose delete was interrupted.
+        """
+        fenced = self.fence_item(game) if fence else None
+        if fence and not self.fence(game):
+            return 0
+
+        requests, last = [], []
+        for table_name, items in game.tables.items():
+            for item in items:
+                if item is fenced:
+                    continue
+                if table_name != SNAPSHOT_TABLE:
+                    requests.append((table_name, item, {"id": item["id"]}))
+                    continue
+
+                key = {"game_id": item["game_id"], "sk": item["sk"]}
+                if item["game_id"] == game.game_id and item["sk"] == GAME_SK:
+                    last.append((table_name, item, key))
+                else:
+                    requests.append((table_name, item, key))
+
+        for start in range(0, len(requests), BATCH_WRITE_SIZE):
+            self._delete_page(requests[start : start + BATCH_WRITE_SIZE])
+        if last:
+            self._delete_page(last)
+
+        return len(requests) + len(last) + (fenced is not None)
+
+    def sweep_game(self, game_id: str, result: SweepResult):
+        game = self.load(game_id)
+        reason = self.reason(game)
+        if reason is None:
+            return
+
+        if not self.dry_run:
+            # deleting is permanent, without a copy that outlives the sweep the
+            # game is left as it is
+            if self.archive is None or not self.archive.durable:
+                raise ArchiveRequired(
+                    "Sweeping deletes games, set ARCHIVE_BUCKET or an ARCHIVE_DIR "
+                    "that is not the Lambda's /tmp"
+                )
+            self.archive.append(
+                dict(
+                    game_id=game_id,
+                    reason=reason,
+                    last_active=game.last_active,
+                    archived_at=int(self.clock()),
+                    tables=game.tables,
+                )
+            )
+
+            deleted = self.delete(game)
+            if not deleted:
+                return
+            result.deleted_items += deleted
+
+        result.swept[reason] = result.swept.get(reason, 0) + 1
+        count(f"swept_{reason}")
+
+    def run(
+        self,
+        cursor: Optional[Dict] = None,
+        deadline: Optional[float] = None,
+        max_games: Optional[int] = None,
+    ) -> SweepResult:
+        """
+        Sweeps from ``cursor`` until the scan ends, ``deadline`` (a
+        ``time.monotonic`` value) passes or ``max_games`` were looked at. A run
+        that stops early leaves the cursor on the last item of the last game it
+        looked at.
+        """
+        result = SweepResult(cursor=cursor)
+        cutoff = self.clock() - self.finished_after
+
+        def consider(game_id: str, last_active: int) -> bool:
+            result.games += 1
+            # the scan only sees game and state items, load rechecks them all
+            if last_active < cutoff:
+                self.sweep_game(game_id, result)
+
+            return (deadline is not None and time.monotonic() >= deadline) or (
+                max_games is not None and result.games >= max_games
+            )
+
+        # items of a partition come back together, a game is looked at once
+        # the scan has moved past it
+        current, last_active, last_key = None, 0, None
+        for items, next_cursor in self.scan_pages(cursor):
+            for item in items:
+                if item["game_id"] != current:
+                    if current is not None and consider(current, last_active):
+                        result.cursor = last_key
+                        return result
+                    current, last_active = item["game_id"], 0
+                last_active = max(last_active, int(item.get(LAST_ACTIVE) or 0))
+                last_key = {"game_id": item["game_id"], "sk": item["sk"]}
+
+            result.cursor = next_cursor
+            if next_cursor is None:
+                break
+
+        if current is not None:
+            consider(current, last_active)
+
+        return result
+
+    def load_cursor(self) -> Optional[Dict]:
+        item = self.table.get_item(
+            Key={"game_id": SWEEP_CURSOR_PK, "sk": "CURSOR"}, ConsistentRead=True
+        ).get("Item")
+        return json.loads(item["cursor"]) if item else None
+
+    def save_cursor(self, cursor: Optional[Dict]):
+        key = {"game_id": SWEEP_CURSOR_PK, "sk": "CURSOR"}
+        if cursor is None:
+            self.table.delete_item(Key=key)
+        else:
+            self.table.put_item(
+                Item=dict(**key, cursor=json.dumps(cursor, default=json_default))
+            )
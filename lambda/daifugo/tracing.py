@@ -0,0 +1,164 @@
+"""
+Per-invocation timings and consumed capacity, written as one CloudWatch
+embedded metric format (EMF) line per handler call. Spans only record while a
+handler trace is active, outside one ``span`` is a shared no-op.
+"""
+import contextvars
+import functools
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .constants import METRICS_NAMESPACE
+
+_NO_SPAN = nullcontext()
+
+_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar(
+    "trace", default=None
+)
+
+
+class Trace:
+    def __init__(self, handler: str):
+        self.handler = handler
+        # span name -> [total seconds, calls]
+        self.spans: Dict[str, list] = defaultdict(lambda: [0.0, 0])
+        self.capacity: Dict[str, float] = defaultdict(float)
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.properties: Dict[str, Any] = {}
+        # post_mutations records from its worker threads
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                stats = self.spans[name]
+                stats[0] += elapsed
+                stats[1] += 1
+
+    def add_capacity(self, kind: str, consumed) -> None:
+        if not consumed:
+            return
+
+        # batch and transact calls report a list, single table calls one entry
+        entries = consumed if isinstance(consumed, list) else [consumed]
+        with self._lock:
+            for entry in entries:
+                self.capacity[kind] += float(entry.get("CapacityUnits") or 0)
+
+    def to_emf(self) -> Dict[str, Any]:
+        dimensions = {"handler": self.handler}
+        if "players" in self.properties:
+            dimensions["players"] = str(self.properties["players"])
+
+        values: Dict[str, float] = {}
+        metrics = []
+        for name, (total, calls) in sorted(self.spans.items()):
+            values[f"{name}_ms"] = round(total * 1000, 3)
+            values[f"{name}_calls"] = calls
+            metrics += [
+                dict(Name=f"{name}_ms", Unit="Milliseconds"),
+                dict(Name=f"{name}_calls", Unit="Count"),
+            ]
+        for name, n in sorted(self.counts.items()):
+            values[name] = n
+            metrics.append(dict(Name=name, Unit="Count"))
+        for kind, units in sorted(self.capacity.items()):
+            values[f"consumed_{kind}_capacity"] = units
+            metrics.append(dict(Name=f"consumed_{kind}_capacity", Unit="Count"))
+
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    dict(
+                        Namespace=METRICS_NAMESPACE,
+                        Dimensions=[list(dimensions)],
+                        Metrics=metrics,
+                    )
+                ],
+            },
+            # game_id stays a property, as a dimension every game would be a
+            # new custom metric
+            **self.properties,
+            **dimensions,
+            **values,
+        }
+
+
+def current() -> Optional[Trace]:
+    return _trace.get()
+
+
+def span(name: str):
+    trace = _trace.get()
+    if trace is None:
+        return _NO_SPAN
+
+    return trace.span(name)
+
+
+def traced(name: str) -> Callable:
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def annotate(**properties) -> None:
+    """Adds properties to the current trace, e.g. game_id and players"""
+    trace = _trace.get()
+    if trace is not None:
+        trace.properties.update(properties)
+
+
+def add_capacity(kind: str, consumed) -> None:
+    """Adds a ``ConsumedCapacity`` entry or list, ``kind`` is read or write"""
+    trace = _trace.get()
+    if trace is not None:
+        trace.add_capacity(kind, consumed)
+
+
+def count(name: str, n: int = 1) -> None:
+    trace = _trace.get()
+    if trace is not None:
+        with trace._lock:
+            trace.counts[name] += n
+
+
+def emit(trace: Trace) -> None:
+    # stdout, not the logger, EMF needs the line to be the JSON document alone
+    print(json.dumps(trace.to_emf(), default=str), flush=True)
+
+
+def handler_trace(name: str) -> Callable:
+    """Traces a handler as a whole and emits its metrics once it returns"""
+
+    def decorator(handler: Callable) -> Callable:
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            trace = Trace(name)
+            token = _trace.set(trace)
+            try:
+                with trace.span("handler"):
+                    return handler(event, context)
+            finally:
+                _trace.reset(token)
+                emit(trace)
+
+        return wrapper
+
+    return decorator
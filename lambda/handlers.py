@@ -1,2 +1,9 @@
-from daifugo import (create_game_handler, join_game_handler,
-                     play_cards_handler, start_game_handler)
+import daifugo
+
+__all__ = daifugo.__all__
+
+
+def __getattr__(name):
+    # the Lambda runtime looks the handler up with getattr, deferring the import
+    # keeps each function's cold start down to its own handler module
+    return getattr(daifugo, name)
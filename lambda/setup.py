@@ -5,6 +5,7 @@ setup(
     version="0.1",
     packages=["daifugo"],
     install_requires=["gql", "click"],
+    extras_require={"batch": ["numpy"]},
     entry_points="""
         [console_scripts]
         daifugo=daifugo.cli:cli
@@ -9,6 +9,9 @@ from daifugo.model import Game, GameState, Player
 from daifugo.mutations import (CREATE_GAME_MUTATION, JOIN_GAME_MUTATION,
                                START_GAME_MUTATION)
 
+# deployments get theirs from terraform, daifugo.ids has no default
+os.environ.setdefault("ID_SCRAMBLE_KEY", "0x2545F4914F6CDD1D")
+
 
 @pytest.fixture
 def setup_api_key_from_tf(mocker):
@@ -76,6 +79,15 @@ def initial_game_state(empty_game, players, http_client):
     return GameState.from_json(state_json)
 
 
+@pytest.fixture
+def local_appsync():
+    """In-memory DynamoDB and AppSync behind get_dynamodb and get_http_client"""
+    from daifugo.local import local_backend
+
+    with local_backend() as appsync:
+        yield appsync
+
+
 @pytest.fixture
 def dynamodb():
     return boto3.resource("dynamodb")
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from daifugo.batch import PATTERN_CODES, BatchEngine
+from daifugo.constants import UP
+from daifugo.daifugo import play_cards
+from daifugo.model import CardSet, GameState, Hand, Pattern, Player
+
+
+def engine_games(batch):
+    games = []
+    for k in range(batch.n_games):
+        players = [
+            Player(f"p{i}", f"player{i}", "SIM", f"h{i}", False, -1)
+            for i in range(batch.n_players)
+        ]
+        hands = [Hand(f"h{i}", mask=int(mask)) for i, mask in enumerate(batch.hands[k])]
+        active = int(batch.active[k])
+        state = GameState(
+            "state",
+            "SIM",
+            active,
+            players[active].id,
+            -1,
+            [],
+            0,
+            Pattern.NONE,
+            False,
+            UP,
+        )
+        games.append([state, players, hands])
+
+    return games
+
+
+def assert_same(batch, games):
+    for k, (state, players, hands) in enumerate(games):
+        assert [hand.mask for hand in hands] == [int(mask) for mask in batch.hands[k]]
+        assert [player.rank for player in players] == list(batch.ranks[k])
+        assert [player.has_passed for player in players] == list(batch.passed[k])
+        assert state.active_player_idx == batch.active[k]
+        assert state.top_of_pile.mask == batch.top[k]
+        assert state.direction == batch.direction[k]
+        assert state.revolution == batch.revolution[k]
+        assert PATTERN_CODES[state.active_pattern] == batch.pattern[k]
+
+
+@pytest.mark.parametrize("greedy", [False, True])
+def test_batch_engine_matches_play_cards(greedy):
+    rng = np.random.default_rng(5)
+    batch = BatchEngine.deal(25, 4, rng)
+    games = engine_games(batch)
+
+    for _ in range(300):
+        if batch.done.all():
+            break
+
+        moves = batch.sample_moves(rng, greedy)
+        live = ~batch.done
+        applied = batch.step(moves)
+        assert (applied == live).all()
+
+        for k in np.flatnonzero(live):
+            state, players, hands = games[k]
+            games[k][0], _, _ = play_cards(
+                state, CardSet(mask=int(moves[k])), [], players, hands
+            )
+
+        assert_same(batch, games)
+
+    assert batch.done.all()
+
+
+def test_batch_engine_rejects_invalid_moves():
+    batch = BatchEngine.deal(2, 3, np.random.default_rng(0))
+    hands = batch.hands.copy()
+
+    not_owned = ~batch.active_hands & (batch.active_hands + np.uint64(1))
+    applied = batch.step(not_owned)
+
+    assert not applied.any()
+    assert (batch.hands == hands).all()
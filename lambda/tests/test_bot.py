@@ -0,0 +1,204 @@
+import asyncio
+import random
+
+from daifugo.bot import ISMCTS, PASS, candidate_moves, suggest_move
+from daifugo.cards import card_id, mask_of
+from daifugo.common import (get_dynamodb, get_http_client, load_game_snapshot,
+                            post_mutation)
+from daifugo.constants import UP
+from daifugo.model import Card, CardSet, GameState, Pattern, Player
+from daifugo.mutations import (CREATE_GAME_MUTATION, JOIN_GAME_MUTATION,
+                               PLAY_CARDS_MUTATION, START_GAME_MUTATION,
+                               SUGGEST_MOVE_QUERY)
+from daifugo.server import GameServer, MemoryStore
+from daifugo.simulate import new_game
+
+
+def endgame(top_of_pile=()):
+    players = [
+        Player(f"p{i}", f"player{i}", "SIM", f"h{i}", False, -1) for i in range(2)
+    ]
+    state = GameState(
+        id="state",
+        game_id="SIM",
+        active_player_idx=0,
+        active_player_id="p0",
+        last_played_idx=1 if top_of_pile else -1,
+        _top_of_pile=list(top_of_pile),
+        pot_size=len(top_of_pile),
+        active_pattern=Pattern.NONE,
+        revolution=False,
+        direction=UP,
+    )
+    return state, players
+
+
+def test_suggestion_is_legal_and_seeded():
+    state, players, hands = new_game(4, random.Random(7))
+    hand_mask = hands[state.active_player_idx].mask
+    sizes = [len(hand) for hand in hands]
+
+    suggestion = suggest_move(
+        state, players, hand_mask, sizes, iterations=100, time_limit=10, seed=1
+    )
+    assert (suggestion.cards, suggestion.discards) in candidate_moves(hand_mask, state)
+    assert suggestion.iterations == 100
+    assert 0 <= suggestion.score <= 1
+
+    again = suggest_move(
+        state, players, hand_mask, sizes, iterations=100, time_limit=10, seed=1
+    )
+    assert (again.cards, again.discards, again.visits) == (
+        suggestion.cards,
+        suggestion.discards,
+        suggestion.visits,
+    )
+
+
+def test_determinization_keeps_hand_sizes_and_hidden_cards():
+    state, players, hands = new_game(4, random.Random(3))
+    seat = state.active_player_idx
+    search = ISMCTS(state, players, hands[seat].mask, [len(h) for h in hands], seed=0)
+
+    for _ in range(20):
+        search.determinize()
+        assert [len(hand) for hand in search.hands] == [len(hand) for hand in hands]
+        assert search.hands[seat].mask == hands[seat].mask
+        dealt = [hand.mask for hand in search.hands]
+        assert sum(dealt) == mask_of(range(52))
+
+
+def test_bot_goes_out_with_a_pair():
+    state, players = endgame()
+    kings = mask_of([card_id("King", "Spade"), card_id("King", "Heart")])
+
+    # a single king lets the opponent play its last card over it
+    for solve in (False, True):
+        suggestion = suggest_move(
+            state, players, kings, [2, 1], iterations=300, seed=0, endgame=solve
+        )
+        assert (suggestion.cards, suggestion.discards) == (kings, 0)
+
+
+def test_forced_pass_skips_the_search():
+    state, players = endgame([Card("2", "Spade")])
+    three = mask_of([card_id("3", "Heart")])
+
+    suggestion = suggest_move(state, players, three, [1, 3], seed=0)
+    assert (suggestion.cards, suggestion.discards) == PASS
+    assert suggestion.iterations == 0
+
+
+def test_suggest_move_handler(local_appsync, monkeypatch):
+    monkeypatch.setattr("daifugo.suggest_move_lambda.BOT_TIME_LIMIT", 0.1)
+    http_client = get_http_client()
+    game_id = post_mutation(CREATE_GAME_MUTATION, http_client)["id"]
+    for i in range(3):
+        post_mutation(
+            JOIN_GAME_MUTATION,
+            http_client,
+            variables=dict(game_id=game_id, player_name=f"player{i}"),
+        )
+    state = GameState.from_json(
+        post_mutation(START_GAME_MUTATION, http_client, variables=dict(game_id=game_id))
+    )
+
+    suggestion = post_mutation(
+        SUGGEST_MOVE_QUERY,
+        http_client,
+        variables=dict(game_id=game_id, player_id=state.active_player_id),
+    )
+    assert suggestion["iterations"] > 0
+
+    # the suggestion is accepted by the engine as it is
+    next_state = post_mutation(
+        PLAY_CARDS_MUTATION,
+        http_client,
+        variables=dict(
+            game_id=game_id,
+            player_id=state.active_player_id,
+            cards=suggestion["cards"],
+            discards=suggestion["discards"],
+            expected_version=state.version,
+        ),
+    )
+    assert next_state["version"] == 1
+    assert load_game_snapshot(game_id, get_dynamodb()).state.version == 1
+
+
+def test_suggest_move_handler_knows_the_played_cards(local_appsync, monkeypatch):
+    http_client = get_http_client()
+    game_id = post_mutation(CREATE_GAME_MUTATION, http_client)["id"]
+    for i in range(3):
+        post_mutation(
+            JOIN_GAME_MUTATION,
+            http_client,
+            variables=dict(game_id=game_id, player_name=f"player{i}"),
+        )
+    post_mutation(START_GAME_MUTATION, http_client, variables=dict(game_id=game_id))
+
+    # up to two singles, every other turn of the four passes
+    played = 0
+    for _ in range(4):
+        snapshot = load_game_snapshot(game_id, get_dynamodb())
+        state = snapshot.state
+        hand = snapshot.hands[state.active_player_idx]
+        moves = [
+            cards
+            for cards, discards in candidate_moves(hand.mask, state)
+            if cards.bit_count() == 1 and not discards
+        ]
+        cards = moves[0] if moves and played.bit_count() < 2 else 0
+        played |= cards
+        post_mutation(
+            PLAY_CARDS_MUTATION,
+            http_client,
+            variables=dict(
+                game_id=game_id,
+                player_id=state.active_player_id,
+                cards=[card.to_json() for card in CardSet(mask=cards).cards],
+                discards=[],
+                expected_version=state.version,
+            ),
+        )
+
+    seen = []
+
+    def capture(state, players, hand_mask, hand_sizes, seen_mask=0, **kwargs):
+        seen.append(seen_mask)
+        return suggest_move(
+            state, players, hand_mask, hand_sizes, seen_mask, iterations=10, **kwargs
+        )
+
+    monkeypatch.setattr("daifugo.suggest_move_lambda.suggest_move", capture)
+    state = load_game_snapshot(game_id, get_dynamodb()).state
+    post_mutation(
+        SUGGEST_MOVE_QUERY,
+        http_client,
+        variables=dict(game_id=game_id, player_id=state.active_player_id),
+    )
+    assert played.bit_count() >= 1
+    assert seen == [played]
+
+
+def test_server_suggests_moves():
+    async def run():
+        server = GameServer(MemoryStore(), flush_interval=60)
+        game = await server.create_game()
+        for i in range(3):
+            await server.join_game(game["id"], f"player{i}")
+        state = GameState.from_json(await server.start_game(game["id"]))
+
+        response = await server.execute(
+            dict(
+                query=SUGGEST_MOVE_QUERY.value,
+                variables=dict(game_id=game["id"], player_id=state.active_player_id),
+            )
+        )
+        suggestion = response["data"]["suggestMove"]
+        hand = (await server.table(game["id"])).snapshot.hands[state.active_player_idx]
+        played = CardSet([Card.from_json(card) for card in suggestion["cards"]])
+        assert played.mask & ~hand.mask == 0
+        await server.close()
+
+    asyncio.run(run())
@@ -0,0 +1,131 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from daifugo.common import (BadGraphQLRequest, ClientRegistry, ConflictError,
+                            MutationRequest, UnprocessedItemsError,
+                            batch_write, get_items, post_mutations,
+                            raise_for_errors)
+from daifugo.local import LocalDynamoDB
+from daifugo.mutations import UPDATE_HAND_MUTATION, UPDATE_PLAYER_MUTATION
+
+
+class FakeAppSync:
+    def request(self, method, url, body, headers):
+        request = json.loads(body)
+        variables = request["variables"]
+
+        if variables.get("id") == "bad":
+            data = {"errors": [{"message": "bad id"}]}
+        elif variables.get("id") == "stale":
+            data = {
+                "errors": [
+                    {
+                        "message": "The conditional request failed",
+                        "errorType": "DynamoDB:ConditionalCheckFailedException",
+                    }
+                ]
+            }
+        elif "updateHand" in request["query"]:
+            data = {"data": {"updateHand": variables}}
+        else:
+            data = {"data": {"updatePlayer": variables}}
+
+        return SimpleNamespace(data=json.dumps(data).encode())
+
+
+def test_post_mutations_keeps_order_and_errors():
+    http_client = FakeAppSync()
+    requests = [
+        MutationRequest(UPDATE_HAND_MUTATION, {"id": "h0", "cards": []}),
+        MutationRequest(UPDATE_PLAYER_MUTATION, {"id": "bad"}),
+        MutationRequest(UPDATE_HAND_MUTATION, {"id": "h1", "cards": []}),
+    ]
+
+    results = post_mutations(requests, http_client)
+
+    assert [result.name for result in results] == [
+        "updateHand",
+        "updatePlayer",
+        "updateHand",
+    ]
+    assert results[0].data["id"] == "h0"
+    assert results[2].data["id"] == "h1"
+    assert isinstance(results[1].error, BadGraphQLRequest)
+
+    with pytest.raises(BadGraphQLRequest):
+        raise_for_errors(results)
+
+
+def test_post_mutations_reports_version_conflicts():
+    requests = [MutationRequest(UPDATE_PLAYER_MUTATION, {"id": "stale"})]
+
+    results = post_mutations(requests, FakeAppSync())
+
+    assert isinstance(results[0].error, ConflictError)
+    with pytest.raises(ConflictError):
+        raise_for_errors(results)
+
+
+def test_client_registry_reuses_and_rebuilds_clients():
+    built = []
+    registry = ClientRegistry(
+        dynamodb_factory=lambda: built.append("dynamodb") or object(),
+        http_client_factory=lambda: built.append("http_client") or object(),
+    )
+
+    dynamodb = registry.dynamodb
+    assert registry.dynamodb is dynamodb
+    assert built == ["dynamodb"]
+
+    registry.discard(dynamodb)
+    assert registry.dynamodb is not dynamodb
+
+    stand_in = FakeAppSync()
+    with registry.override(http_client=stand_in):
+        assert registry.http_client is stand_in
+    assert registry.http_client is not stand_in
+    assert built == ["dynamodb", "dynamodb", "http_client"]
+
+
+def test_client_registry_expires_clients():
+    registry = ClientRegistry(dynamodb_factory=object, max_age=0)
+
+    assert registry.dynamodb is not registry.dynamodb
+
+
+def test_batch_write_retries_unprocessed_items(monkeypatch):
+    monkeypatch.setattr("daifugo.common.backoff", lambda attempt: 0)
+    dynamodb = LocalDynamoDB()
+    # every call processes 4 of the 25 requests of a page
+    dynamodb.batch_write_limit = 4
+
+    requests = [
+        ("table", {"PutRequest": {"Item": {"id": str(i), "value": i}}})
+        for i in range(30)
+    ]
+    table = dynamodb.Table("table")
+    batch_write(requests, dynamodb)
+    assert all(table.get({"id": str(i)}) for i in range(30))
+
+    deletes = [("table", {"DeleteRequest": {"Key": {"id": str(i)}}}) for i in range(30)]
+    with pytest.raises(UnprocessedItemsError):
+        batch_write(deletes, dynamodb, max_attempts=2)
+    assert sum(table.get({"id": str(i)}) is None for i in range(30)) == 8
+
+
+def test_get_items_keeps_request_order_across_pages(monkeypatch):
+    monkeypatch.setattr("daifugo.common.backoff", lambda attempt: 0)
+    dynamodb = LocalDynamoDB()
+    table = dynamodb.Table("table")
+    for i in range(250):
+        table.put_item(Item={"id": str(i), "value": i})
+
+    # 250 keys take three pages, every call reads 40 keys of its page
+    dynamodb.batch_get_limit = 40
+    ids = [str(i) for i in range(249, -1, -1)] + ["missing", "7"]
+    items = get_items(ids, dynamodb, "table")
+    assert [item["id"] for item in items] == [*ids[:-2], "7"]
+
+    with pytest.raises(UnprocessedItemsError):
+        get_items(ids, dynamodb, "table", max_attempts=2)
@@ -0,0 +1,224 @@
+import copy
+import itertools
+import random
+
+import pytest
+from daifugo.cards import CARD_RANKS, CARD_SUITS, JOKER_IDS, N_CARDS
+from daifugo.common import InvalidPlayError
+from daifugo.constants import DOWN, UP
+from daifugo.daifugo import PatternResolver, legal_moves, play_cards
+from daifugo.model import (Card, CardSet, Deck, GameState, Hand, Pattern,
+                           Player, decode_cards, encode_cards)
+
+
+def make_players(n_players=3):
+    return [
+        Player(f"p{i}", f"player{i}", "GAME", f"h{i}", False, -1)
+        for i in range(n_players)
+    ]
+
+
+def make_state(top_of_pile=(), direction=UP, active_pattern=Pattern.NONE):
+    return GameState(
+        id="state",
+        game_id="GAME",
+        active_player_idx=0,
+        active_player_id="p0",
+        last_played_idx=-1,
+        _top_of_pile=list(top_of_pile),
+        pot_size=len(top_of_pile),
+        active_pattern=active_pattern,
+        revolution=False,
+        direction=direction,
+    )
+
+
+def test_card_int_round_trip():
+    deck = Deck(n_jokers=2)
+    ids = encode_cards(deck._cards)
+
+    assert sorted(ids) == list(range(N_CARDS))
+    assert decode_cards(ids) == deck._cards
+    assert Card("3", "Heart").to_int() == 0
+    assert Card("2", "Club").to_int() == 51
+    assert CARD_RANKS[Card("Jack", "Spade").to_int()] == 8
+    assert CARD_SUITS[JOKER_IDS[0]] == -1
+
+
+def test_card_set_encoding():
+    cards = CardSet([Card("9", "Heart"), Card("9", "Spade")])
+
+    assert len(cards) == 2
+    assert cards.rank == "9"
+    assert cards.suits == {"Heart", "Spade"}
+    assert PatternResolver.resolve(cards, CardSet([])) is None
+
+
+def test_pattern_resolver():
+    top_of_pile = CardSet([Card("9", "Heart")])
+
+    assert (
+        PatternResolver.resolve(CardSet([Card("10", "Heart")]), top_of_pile)
+        == Pattern.SUITED_RUN
+    )
+    assert PatternResolver.resolve(CardSet([Card("10", "Club")]), top_of_pile) == (
+        Pattern.RUN
+    )
+    assert PatternResolver.resolve(CardSet([Card("Queen", "Heart")]), top_of_pile) == (
+        Pattern.SUITED
+    )
+
+
+def test_play_cards_removes_cards_and_advances():
+    players = make_players()
+    hands = [
+        Hand("h0", [Card("4", "Heart"), Card("4", "Club"), Card("King", "Spade")]),
+        Hand("h1", [Card("Ace", "Heart")]),
+        Hand("h2", [Card("Queen", "Heart")]),
+    ]
+    state = make_state([Card("3", "Spade"), Card("3", "Club")])
+
+    next_state, new_hands, new_players = play_cards(
+        state, CardSet([Card("4", "Heart"), Card("4", "Club")]), [], players, hands
+    )
+
+    assert next_state.active_player_idx == 1
+    assert next_state.pot_size == 4
+    assert next_state.version == state.version + 1
+    assert new_hands[0].cards == [Card("King", "Spade")]
+    assert not new_players
+
+
+@pytest.mark.parametrize(
+    "cards, top_of_pile, direction",
+    [
+        ([Card("4", "Heart")], [Card("5", "Heart")], UP),
+        ([Card("6", "Heart")], [Card("5", "Heart")], DOWN),
+        ([Card("6", "Heart"), Card("6", "Club")], [Card("5", "Heart")], UP),
+        ([Card("6", "Heart"), Card("7", "Club")], [], UP),
+    ],
+)
+def test_play_cards_rejects_invalid_plays(cards, top_of_pile, direction):
+    players = make_players()
+    hands = [Hand(f"h{i}", list(cards)) for i in range(3)]
+    state = make_state(top_of_pile, direction)
+
+    with pytest.raises(InvalidPlayError):
+        play_cards(state, CardSet(cards), [], players, hands)
+
+
+def test_play_cards_forwards_seven_discards():
+    players = make_players()
+    hands = [
+        Hand("h0", [Card("7", "Heart"), Card("King", "Spade"), Card("4", "Club")]),
+        Hand("h1", [Card("Ace", "Heart")]),
+        Hand("h2", [Card("Queen", "Heart")]),
+    ]
+    state = make_state([Card("6", "Club")])
+
+    _, new_hands, _ = play_cards(
+        state, CardSet([Card("7", "Heart")]), [Card("King", "Spade")], players, hands
+    )
+
+    assert [hand.id for hand in new_hands] == ["h0", "h1"]
+    assert new_hands[0].cards == [Card("4", "Club")]
+    assert Card("King", "Spade") in new_hands[1].cards
+
+
+def test_hand_bitmask_view():
+    hand = Hand("h0", [Card("King", "Spade"), Card("4", "Club"), Card("4", "Heart")])
+
+    assert len(hand) == 3
+    assert Card("4", "Club") in hand
+    assert Card("4", "Spade") not in hand
+    assert hand.rank_counts()[1] == 2
+    assert hand.cards == [Card("4", "Heart"), Card("4", "Club"), Card("King", "Spade")]
+
+    hand.cards += [Card("2", "Diamond")]
+    assert len(hand) == 4
+
+
+def test_play_cards_rejects_cards_not_in_hand():
+    players = make_players()
+    hands = [Hand(f"h{i}", [Card("Ace", "Heart")]) for i in range(3)]
+    state = make_state([Card("6", "Club")])
+
+    with pytest.raises(InvalidPlayError):
+        play_cards(state, CardSet([Card("Ace", "Spade")]), [], players, hands)
+
+
+def test_play_cards_rejects_duplicate_cards():
+    players = make_players()
+    hands = [
+        Hand(f"h{i}", [Card("7", "Heart"), Card("King", "Spade")]) for i in range(3)
+    ]
+    state = make_state([Card("6", "Club")])
+
+    # the set would keep one 7 of hearts, a valid single
+    with pytest.raises(InvalidPlayError):
+        play_cards(state, CardSet([Card("7", "Heart")] * 2), [], players, hands)
+    with pytest.raises(InvalidPlayError):
+        play_cards(
+            state,
+            CardSet([Card("7", "Heart")]),
+            [Card("King", "Spade")] * 2,
+            players,
+            hands,
+        )
+
+
+def brute_force_moves(hand, state, players, hands):
+    ret = set()
+    for n_cards in range(1, len(hand) + 1):
+        for cards in itertools.combinations(hand.cards, n_cards):
+            rest = [card for card in hand.cards if card not in cards]
+            for n_discards in range(0, len(rest) + 1):
+                for discards in itertools.combinations(rest, n_discards):
+                    try:
+                        play_cards(
+                            state,
+                            CardSet(list(cards)),
+                            list(discards),
+                            copy.deepcopy(players),
+                            copy.deepcopy(hands),
+                        )
+                    except InvalidPlayError:
+                        continue
+                    ret.add((CardSet(list(cards)).mask, CardSet(list(discards)).mask))
+
+    return ret
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize(
+    "active_pattern", [Pattern.NONE, Pattern.RUN, Pattern.SUITED, Pattern.SUITED_RUN]
+)
+def test_legal_moves_match_validator(seed, active_pattern):
+    rng = random.Random(seed)
+    deck = Deck(n_jokers=0)._cards
+    rng.shuffle(deck)
+
+    top_rank = rng.choice(["5", "6", "7", "8", "9", "10"])
+    top_suits = rng.sample(["Heart", "Diamond", "Spade", "Club"], rng.randint(1, 2))
+    top_of_pile = [Card(top_rank, suit) for suit in top_suits]
+    cards = [card for card in deck if card.rank != top_rank][:6]
+
+    players = make_players()
+    hands = [Hand("h0", cards), Hand("h1", []), Hand("h2", [])]
+    state = make_state(top_of_pile, rng.choice([UP, DOWN]), active_pattern)
+
+    moves = {
+        (move.cards.mask, CardSet(move.discards).mask)
+        for move in legal_moves(hands[0], state)
+    }
+
+    assert moves == brute_force_moves(hands[0], state, players, hands)
+
+
+def test_legal_moves_new_trick():
+    hand = Hand("h0", [Card("4", "Heart"), Card("4", "Club"), Card("King", "Spade")])
+
+    moves = legal_moves(hand, make_state())
+
+    assert len(moves) == 4
+    assert all(not move.discards for move in moves)
@@ -0,0 +1,120 @@
+import copy
+import json
+import random
+
+import pytest
+from daifugo.cards import ids_of
+from daifugo.daifugo import legal_move_masks, play_cards
+from daifugo.delta import (DeltaFollower, GameDelta, HandDelta, ResyncRequired,
+                           diff_move, state_fields)
+from daifugo.model import CardSet, decode_cards
+from daifugo.simulate import new_game
+
+
+def play_moves(seed, n_moves):
+    rng = random.Random(seed)
+    state, players, hands = new_game(4, rng)
+    start = copy.deepcopy((state, hands))
+
+    deltas = []
+    for _ in range(n_moves):
+        idx = state.active_player_idx
+        if players[idx].is_out or sum(not player.is_out for player in players) < 2:
+            break
+
+        moves = legal_move_masks(hands[idx].mask, state) + [(0, 0)]
+        cards, discards = rng.choice(moves)
+
+        prev_state = state
+        prev_masks = {hand.id: hand.mask for hand in hands}
+        state, new_hands, new_players = play_cards(
+            state,
+            CardSet(mask=cards),
+            decode_cards(ids_of(discards)),
+            players,
+            hands,
+        )
+        delta, hand_deltas = diff_move(
+            prev_state, state, prev_masks, new_hands, new_players
+        )
+        # through the wire format, as a subscriber would see it
+        deltas.append(
+            (
+                GameDelta.from_json(json.loads(json.dumps(delta.to_json()))),
+                [
+                    HandDelta.from_json(json.loads(json.dumps(hand.to_json())))
+                    for hand in hand_deltas
+                ],
+            )
+        )
+
+    return start, deltas, (state, players, hands)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_follower_tracks_the_game_from_deltas(seed):
+    (state, hands), deltas, (final_state, players, final_hands) = play_moves(seed, 60)
+    follower = DeltaFollower(state, hands)
+
+    for delta, hand_deltas in deltas:
+        assert follower.apply(delta)
+        for hand in hand_deltas:
+            assert follower.apply_hand(hand)
+
+    assert follower.seq == final_state.version
+    assert follower.state == state_fields(final_state)
+    assert follower.hands == {hand.id: hand.mask for hand in final_hands}
+    for hand in final_hands:
+        assert follower.hand_sizes.get(hand.id, len(hand)) == len(hand)
+    for player in players:
+        if player.id in follower.players:
+            assert follower.players[player.id]["rank"] == player.rank
+
+
+def test_delta_only_carries_changes():
+    _, deltas, _ = play_moves(0, 1)
+
+    delta, hand_deltas = deltas[0]
+    payload = delta.to_json()
+
+    assert payload["seq"] == 1
+    assert len(payload["hand_sizes"]) in (1, 2)
+    assert "revolution" not in payload
+    assert all(isinstance(card, int) for card in payload["played"])
+    assert all(isinstance(card, int) for card in hand_deltas[0].to_json()["removed"])
+
+
+def test_game_delta_keeps_forwarded_cards_private():
+    forwards = [
+        (delta, hand_deltas)
+        for seed in range(20)
+        for delta, hand_deltas in play_moves(seed, 60)[1]
+        if any(hand.added for hand in hand_deltas)
+    ]
+    assert forwards
+
+    for delta, hand_deltas in forwards:
+        forwarded = set(ids_of(hand_deltas[0].removed & hand_deltas[1].added))
+        forwarded |= set(ids_of(hand_deltas[1].removed & hand_deltas[0].added))
+        assert forwarded
+
+        payload = json.dumps(delta.to_json())
+        assert not forwarded & set(delta.to_json()["played"])
+        assert "removed" not in payload and "added" not in payload
+        # the receiver's hand size is public, its cards are not
+        receiver = next(hand for hand in hand_deltas if hand.added)
+        assert receiver.id in delta.hand_sizes
+
+
+def test_follower_ignores_duplicates_and_flags_gaps():
+    (state, hands), deltas, _ = play_moves(0, 3)
+    follower = DeltaFollower(state, hands)
+
+    assert follower.apply(deltas[0][0])
+    assert not follower.apply(deltas[0][0])
+    with pytest.raises(ResyncRequired):
+        follower.apply(deltas[2][0])
+
+    hand = deltas[0][1][0]
+    assert follower.apply_hand(hand)
+    assert not follower.apply_hand(hand)
@@ -0,0 +1,140 @@
+import random
+
+from daifugo.cards import card_id, ids_of, mask_of
+from daifugo.constants import UP
+from daifugo.daifugo import candidate_moves, legal_move_masks, play_cards
+from daifugo.endgame import EndgameSolver, is_endgame, solve_endgame
+from daifugo.model import (CardSet, GameState, Hand, Pattern, Player,
+                           decode_cards)
+from daifugo.simulate import new_game, random_policy
+
+
+def position(hands, ranks=None):
+    ranks = ranks or [-1] * len(hands)
+    players = [
+        Player(f"p{i}", f"player{i}", "SIM", f"h{i}", False, rank)
+        for i, rank in enumerate(ranks)
+    ]
+    state = GameState(
+        id="state",
+        game_id="SIM",
+        active_player_idx=0,
+        active_player_id="p0",
+        last_played_idx=-1,
+        _top_of_pile=[],
+        pot_size=0,
+        active_pattern=Pattern.NONE,
+        revolution=False,
+        direction=UP,
+    )
+    hands = [
+        Hand(f"h{i}", mask=mask_of(card_id(*card) for card in cards))
+        for i, cards in enumerate(hands)
+    ]
+    return state, players, hands
+
+
+KINGS = [("King", "Spade"), ("King", "Heart")]
+
+
+def test_forced_finish_order():
+    state, players, hands = position([KINGS, [("3", "Club")]])
+
+    result = solve_endgame(state, players, hands)
+    assert result.forced
+    assert result.finish_order == (0, 1)
+
+
+def test_open_finish_order_and_best_move():
+    # a single king lets the two go out first
+    state, players, hands = position([KINGS, [("2", "Club")]])
+
+    result = EndgameSolver().solve(state, players, hands)
+    assert not result.forced
+    assert result.finish_orders == {(0, 1), (1, 0)}
+    assert result.finish_order == (0, 1)
+    assert result.best_move == (hands[0].mask, 0)
+
+
+def test_finished_seats_come_first():
+    state, players, hands = position([KINGS, [("2", "Club")], []], ranks=[-1, -1, 0])
+
+    result = EndgameSolver().solve(state, players, hands)
+    assert all(order[0] == 2 for order in result.finish_orders)
+    assert result.finish_order == (2, 0, 1)
+
+
+def test_is_endgame():
+    _, players, hands = position([KINGS, [("2", "Club")], []], ranks=[-1, -1, 0])
+    assert is_endgame(players, [len(hand) for hand in hands])
+
+    state, players, hands = new_game(3, random.Random(0))
+    assert not is_endgame(players, [len(hand) for hand in hands])
+    assert solve_endgame(state, players, hands) is None
+
+
+def brute_force(state, players, hands, solver):
+    """Every reachable finish order, walking the tree without a table"""
+    if sum(not player.is_out for player in players) <= 1:
+        return {solver.solve(state, players, hands).finish_order}
+
+    orders = set()
+    for cards, discards in candidate_moves(hands[state.active_player_idx].mask, state):
+        next_players = [
+            Player(p.id, p.name, p.game_id, p.hand_id, p.has_passed, p.rank)
+            for p in players
+        ]
+        next_hands = [Hand(h.id, mask=h.mask) for h in hands]
+        next_state, _, _ = play_cards(
+            state,
+            CardSet(mask=cards),
+            decode_cards(ids_of(discards)),
+            next_players,
+            next_hands,
+        )
+        orders |= brute_force(next_state, next_players, next_hands, solver)
+
+    return orders
+
+
+def test_table_matches_brute_force_and_is_reused():
+    checked = 0
+    for seed in range(20):
+        rng = random.Random(seed)
+        state, players, hands = new_game(3, rng)
+        while sum(not player.is_out for player in players) > 1:
+            if sum(len(hand) for hand in hands) <= 5:
+                break
+            idx = state.active_player_idx
+            moves = (
+                [] if players[idx].is_out else legal_move_masks(hands[idx].mask, state)
+            )
+            cards, discards = random_policy(moves, hands[idx].mask, state, rng) or (
+                0,
+                0,
+            )
+            state, _, _ = play_cards(
+                state,
+                CardSet(mask=cards),
+                decode_cards(ids_of(discards)),
+                players,
+                hands,
+            )
+
+        if sum(not player.is_out for player in players) <= 1:
+            continue
+
+        solver = EndgameSolver(max_size=50)
+        result = solver.solve(state, players, hands)
+        assert result.finish_orders == brute_force(
+            state, players, hands, EndgameSolver()
+        )
+        assert result.finish_order in result.finish_orders
+        assert len(solver.table) <= 50
+
+        hits = solver.hits
+        assert solver.solve(state, players, hands) == result
+        assert solver.hits == hits + 1
+        checked += 1
+
+    assert checked > 5
@@ -0,0 +1,212 @@
+import asyncio
+
+import pytest
+from daifugo.common import (BadGraphQLRequest, get_dynamodb, get_http_client,
+                            load_game_snapshot, post_mutation)
+from daifugo.constants import HAND_TABLE
+from daifugo.idempotency import (IdempotencyKeyReused, IdempotencyStore,
+                                 RequestInProgress, TTLCache)
+from daifugo.model import GameState, Player
+from daifugo.mutations import (CREATE_GAME_MUTATION, JOIN_GAME_MUTATION,
+                               PLAY_CARDS_MUTATION, START_GAME_MUTATION)
+from daifugo.server import GameServer, MemoryStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_expires_and_evicts():
+    clock = Clock()
+    cache = TTLCache(ttl=10, max_size=2, clock=clock)
+
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    # "b" is now the least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+    clock.now += 10
+    assert cache.get("a") is None
+    assert len(cache) == 1
+
+
+def test_store_claims_replays_and_releases(local_appsync):
+    clock = Clock()
+    store = IdempotencyStore(get_dynamodb(), ttl=60, claim_ttl=5, clock=clock)
+
+    assert store.claim("ABCD", "playCards", "k1", "hash") is None
+    with pytest.raises(RequestInProgress):
+        store.claim("ABCD", "playCards", "k1", "hash")
+
+    store.complete("ABCD", "playCards", "k1", "hash", {"version": 3})
+    # a container without the response in memory reads the stored record
+    other = IdempotencyStore(get_dynamodb(), ttl=60, clock=clock)
+    assert other.claim("ABCD", "playCards", "k1", "hash")["response"] == {"version": 3}
+    with pytest.raises(IdempotencyKeyReused):
+        other.claim("ABCD", "playCards", "k1", "other hash")
+
+    # released and expired claims can be taken again
+    assert store.claim("ABCD", "startGame", "k2", "hash") is None
+    store.release("ABCD", "startGame", "k2")
+    assert store.claim("ABCD", "startGame", "k2", "hash") is None
+    clock.now += 6
+    assert store.claim("ABCD", "startGame", "k2", "hash") is None
+
+
+def test_retried_mutations_are_replayed(local_appsync):
+    http_client = get_http_client()
+    game_id = post_mutation(CREATE_GAME_MUTATION, http_client)["id"]
+
+    players = []
+    for i in range(3):
+        variables = dict(
+            game_id=game_id, player_name=f"player{i}", idempotency_key=f"join{i}"
+        )
+        player = post_mutation(JOIN_GAME_MUTATION, http_client, variables=variables)
+        assert post_mutation(JOIN_GAME_MUTATION, http_client, variables) == player
+        players.append(Player.from_json(player))
+
+    assert len(load_game_snapshot(game_id, get_dynamodb()).players) == 3
+
+    variables = dict(game_id=game_id, idempotency_key="start")
+    state = post_mutation(START_GAME_MUTATION, http_client, variables=variables)
+    assert post_mutation(START_GAME_MUTATION, http_client, variables) == state
+
+    state = GameState.from_json(state)
+    variables = dict(
+        game_id=game_id,
+        player_id=state.active_player_id,
+        cards=[],
+        discards=[],
+        idempotency_key="move1",
+    )
+    next_state = post_mutation(PLAY_CARDS_MUTATION, http_client, variables=variables)
+
+    # the replay touches neither the engine nor the tables
+    n_requests = local_appsync.n_requests
+    assert post_mutation(PLAY_CARDS_MUTATION, http_client, variables) == next_state
+    assert local_appsync.n_requests == n_requests + 1
+    assert load_game_snapshot(game_id, get_dynamodb()).state.version == 1
+
+
+def fail_once(local_appsync, field):
+    resolver = local_appsync.resolvers[field]
+    calls = []
+
+    def flaky(args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError(f"{field} is down")
+        return resolver(args)
+
+    local_appsync.resolvers[field] = flaky
+
+
+def test_retried_join_keeps_the_writes_before_a_failure(local_appsync):
+    http_client = get_http_client()
+    game_id = post_mutation(CREATE_GAME_MUTATION, http_client)["id"]
+
+    # the hand and the player are in when the game update fails
+    fail_once(local_appsync, "updateGame")
+    variables = dict(
+        game_id=game_id, player_name="player", idempotency_key="retried join"
+    )
+    with pytest.raises(BadGraphQLRequest):
+        post_mutation(JOIN_GAME_MUTATION, http_client, variables=variables)
+
+    player = post_mutation(JOIN_GAME_MUTATION, http_client, variables=variables)
+    assert post_mutation(JOIN_GAME_MUTATION, http_client, variables) == player
+
+    dynamodb = get_dynamodb()
+    snapshot = load_game_snapshot(game_id, dynamodb)
+    assert snapshot.game.players == [player["id"]]
+    assert [p.id for p in snapshot.players] == [player["id"]]
+    assert [h.id for h in snapshot.hands] == [player["hand_id"]]
+    hands = [
+        item
+        for item in dynamodb.Table(HAND_TABLE).scan()["Items"]
+        if item["id"] != player["hand_id"]
+    ]
+    assert hands == []
+
+
+def test_retried_start_keeps_the_deal(local_appsync):
+    http_client = get_http_client()
+    game_id = post_mutation(CREATE_GAME_MUTATION, http_client)["id"]
+    for i in range(3):
+        variables = dict(game_id=game_id, player_name=f"player{i}")
+        post_mutation(JOIN_GAME_MUTATION, http_client, variables=variables)
+
+    # the hands are dealt when the game update fails
+    fail_once(local_appsync, "updateGame")
+    variables = dict(game_id=game_id, idempotency_key="retried start")
+    with pytest.raises(BadGraphQLRequest):
+        post_mutation(START_GAME_MUTATION, http_client, variables=variables)
+    hand_table = get_dynamodb().Table(HAND_TABLE)
+    dealt = {item["id"]: set(item["cards"]) for item in hand_table.scan()["Items"]}
+
+    state = post_mutation(START_GAME_MUTATION, http_client, variables=variables)
+    snapshot = load_game_snapshot(game_id, get_dynamodb())
+    assert snapshot.game.state_id == state["id"]
+    assert {
+        hand.id: {card.to_json() for card in hand.cards} for hand in snapshot.hands
+    } == dealt
+
+
+def test_retried_move_is_applied_once(local_appsync, mocker):
+    http_client = get_http_client()
+    game_id = post_mutation(CREATE_GAME_MUTATION, http_client)["id"]
+    for i in range(3):
+        variables = dict(game_id=game_id, player_name=f"player{i}")
+        post_mutation(JOIN_GAME_MUTATION, http_client, variables=variables)
+    state = GameState.from_json(
+        post_mutation(START_GAME_MUTATION, http_client, variables=dict(game_id=game_id))
+    )
+
+    # the handler dies after the commit, a pass has no version
+    post_mutations = mocker.patch(
+        "daifugo.play_cards_lambda.post_mutations", side_effect=TimeoutError
+    )
+    variables = dict(
+        game_id=game_id,
+        player_id=state.active_player_id,
+        cards=[],
+        discards=[],
+        idempotency_key="retried pass",
+    )
+    with pytest.raises(BadGraphQLRequest):
+        post_mutation(PLAY_CARDS_MUTATION, http_client, variables=variables)
+
+    post_mutations.side_effect = None
+    next_state = post_mutation(PLAY_CARDS_MUTATION, http_client, variables=variables)
+    assert next_state["version"] == 1
+    assert load_game_snapshot(game_id, get_dynamodb()).state.version == 1
+
+
+def test_server_runs_a_key_once():
+    async def run():
+        server = GameServer(MemoryStore(), flush_interval=60)
+        game = await server.create_game()
+
+        # concurrent retries share the first request's result
+        players = await asyncio.gather(
+            *[
+                server.join_game(game["id"], "player", idempotency_key="join")
+                for _ in range(3)
+            ]
+        )
+        assert players[0] == players[1] == players[2]
+        assert len((await server.table(game["id"])).snapshot.players) == 1
+
+        with pytest.raises(IdempotencyKeyReused):
+            await server.join_game(game["id"], "other", idempotency_key="join")
+        await server.close()
+
+    asyncio.run(run())
@@ -0,0 +1,82 @@
+import pytest
+from daifugo.constants import GAME_TABLE
+from daifugo.ids import (GameIdAllocator, IdSpaceExhausted, MissingScrambleKey,
+                         game_code, id_space, scramble)
+from daifugo.local import LocalDynamoDB
+from daifugo.tracing import Trace, _trace
+
+
+@pytest.mark.parametrize("space", [1, 2, 26, 676, 1000])
+def test_scramble_is_a_permutation(space):
+    assert sorted(scramble(i, space) for i in range(space)) == list(range(space))
+
+
+def test_game_codes_are_distinct_and_spread():
+    codes = [game_code(i, length=2) for i in range(id_space(2))]
+
+    assert len(set(codes)) == len(codes) == 676
+    assert all(len(code) == 2 and code.isalpha() and code.isupper() for code in codes)
+    # consecutive games do not share a prefix most of the time
+    assert sum(a[0] == b[0] for a, b in zip(codes, codes[1:])) < 100
+
+
+def test_codes_need_the_scramble_key(monkeypatch):
+    codes = [game_code(i, length=2) for i in range(10)]
+    assert codes != [game_code(i, length=2, key=1) for i in range(10)]
+
+    monkeypatch.delenv("ID_SCRAMBLE_KEY")
+    with pytest.raises(MissingScrambleKey):
+        GameIdAllocator()
+    with pytest.raises(MissingScrambleKey):
+        game_code(0)
+
+
+def test_allocator_claims_fresh_codes():
+    dynamodb = LocalDynamoDB()
+    allocator = GameIdAllocator(length=2, block_size=4)
+
+    codes = [allocator.allocate(dynamodb, lambda code: {"id": code}) for _ in range(10)]
+
+    assert codes == [game_code(i, length=2) for i in range(10)]
+    # 10 codes from blocks of 4 took three counter updates
+    counter = dynamodb.Table(GAME_TABLE).get_item(Key={"id": "#GAME_ID_COUNTER"})
+    assert counter["Item"]["value"] == 12
+
+
+def test_allocator_skips_taken_codes_and_counts_retries():
+    dynamodb = LocalDynamoDB()
+    # a game from the old random codes already holds the first counter code
+    dynamodb.Table(GAME_TABLE).put_item(Item={"id": game_code(0, length=2)})
+    allocator = GameIdAllocator(length=2)
+
+    trace = Trace("test")
+    token = _trace.set(trace)
+    try:
+        code = allocator.allocate(dynamodb, lambda code: {"id": code})
+    finally:
+        _trace.reset(token)
+
+    assert code == game_code(1, length=2)
+    assert trace.counts["game_id_retries"] == 1
+
+
+def test_allocator_reports_an_exhausted_space():
+    dynamodb = LocalDynamoDB()
+    allocator = GameIdAllocator(length=1)
+
+    for _ in range(26):
+        allocator.allocate(dynamodb, lambda code: {"id": code})
+
+    with pytest.raises(IdSpaceExhausted):
+        allocator.allocate(dynamodb, lambda code: {"id": code})
+
+
+def test_allocator_reuses_swept_codes_after_wrapping():
+    dynamodb = LocalDynamoDB()
+    allocator = GameIdAllocator(length=1)
+    codes = [allocator.allocate(dynamodb, lambda code: {"id": code}) for _ in range(26)]
+
+    # the sweeper deleted the third game, the counter comes round to its code
+    dynamodb.Table(GAME_TABLE).delete_item(Key={"id": codes[2]})
+
+    assert allocator.allocate(dynamodb, lambda code: {"id": code}) == codes[2]
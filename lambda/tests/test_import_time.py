@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+LAMBDA_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", 150))
+HEAVY_MODULES = {"boto3", "botocore", "urllib3", "gql", "numpy", "click"}
+
+
+def import_times(statement):
+    """Runs ``statement`` under ``-X importtime`` and returns (module, cumulative us)"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=LAMBDA_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    ret = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line[len("import time:") :].split("|")
+        ret.append((name.rstrip(), int(cumulative)))
+
+    return ret
+
+
+@pytest.mark.parametrize(
+    "handler",
+    [
+        "create_game_handler",
+        "join_game_handler",
+        "play_cards_handler",
+        "start_game_handler",
+        "suggest_move_handler",
+        "enqueue_handler",
+        "sweep_handler",
+    ],
+)
+def test_handler_cold_import(handler):
+    times = import_times(f"import handlers; handlers.{handler}")
+
+    # interpreter startup is everything up to and including site
+    names = [name for name, _ in times]
+    start = names.index("site") + 1 if "site" in names else 0
+    ours = times[start:]
+
+    imported = {name.strip().split(".")[0] for name, _ in ours}
+    assert not imported & HEAVY_MODULES
+
+    total_ms = sum(us for name, us in ours if not name.startswith(" ")) / 1000
+    assert total_ms < IMPORT_BUDGET_MS
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+from daifugo.common import BadGraphQLRequest
+from daifugo.loadtest import (LoadTest, LoadTestStats, ServerTarget,
+                              percentile, run_loadtest)
+from daifugo.mutations import CREATE_GAME_MUTATION
+from daifugo.server import GameServer, MemoryStore
+
+
+@pytest.mark.parametrize("target", ["local", "server"])
+def test_loadtest_plays_games_to_completion(target):
+    stats = run_loadtest(3, target, concurrency=4, n_players=3, seed=1)
+    summary = stats.summary()
+
+    assert (summary["games"], summary["finished"]) == (3, 3)
+    assert summary["fields"]["createGame"]["requests"] == 3
+    assert summary["fields"]["joinGame"]["requests"] == 9
+    assert summary["fields"]["playCards"]["requests"] == stats.n_moves
+    assert all(field["error_rate"] == 0 for field in summary["fields"].values())
+
+
+def test_percentile():
+    ordered = [i / 1000 for i in range(1, 101)]
+
+    assert percentile(ordered, 50) == 0.05
+    assert percentile(ordered, 99) == 0.099
+    assert percentile([], 99) == 0.0
+
+
+class ThrottledOnce(ServerTarget):
+    def __init__(self):
+        super().__init__(GameServer(MemoryStore()))
+        self.throttled = False
+
+    async def request(self, mutation, variables):
+        if not self.throttled:
+            self.throttled = True
+            raise BadGraphQLRequest([{"errorType": "TooManyRequestsException"}])
+
+        return await super().request(mutation, variables)
+
+
+def test_throttled_requests_are_retried():
+    loadtest = LoadTest(ThrottledOnce())
+    loadtest.stats = LoadTestStats()
+    loadtest._in_flight = asyncio.Semaphore(1)
+
+    game = asyncio.run(loadtest.request(CREATE_GAME_MUTATION))
+
+    assert game["joinable"]
+    assert loadtest.stats.requests["createGame"] == 2
+    assert loadtest.stats.throttles["createGame"] == 1
+    assert loadtest.stats.errors["createGame"] == 0
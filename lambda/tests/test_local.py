@@ -0,0 +1,190 @@
+import pytest
+from daifugo.cards import ids_of
+from daifugo.common import (BadGraphQLRequest, ConflictError, get_dynamodb,
+                            get_game, get_http_client, load_game_snapshot,
+                            post_mutation, state_update)
+from daifugo.constants import SNAPSHOT_TABLE, STATE_TABLE
+from daifugo.daifugo import legal_move_masks
+from daifugo.local import Expression
+from daifugo.model import CardSet, GameState, Player, decode_cards
+from daifugo.mutations import (CREATE_GAME_MUTATION, CREATE_STATE_MUTATION,
+                               GAME_HAND_QUERY, JOIN_GAME_MUTATION,
+                               PLAY_CARDS_MUTATION, START_GAME_MUTATION)
+
+
+def new_game(http_client, n_players=3):
+    game = post_mutation(CREATE_GAME_MUTATION, http_client)
+    players = [
+        Player.from_json(
+            post_mutation(
+                JOIN_GAME_MUTATION,
+                http_client,
+                variables=dict(game_id=game["id"], player_name=f"player{i}"),
+            )
+        )
+        for i in range(n_players)
+    ]
+    return game["id"], players
+
+
+def play_move(http_client, game_id):
+    snapshot = load_game_snapshot(game_id, get_dynamodb())
+    idx = snapshot.state.active_player_idx
+
+    moves = legal_move_masks(snapshot.hands[idx].mask, snapshot.state)
+    cards, discards = moves[0] if moves else (0, 0)
+    state_json = post_mutation(
+        PLAY_CARDS_MUTATION,
+        http_client,
+        variables=dict(
+            game_id=game_id,
+            player_id=snapshot.players[idx].id,
+            cards=[card.to_json() for card in CardSet(mask=cards).cards],
+            discards=[card.to_json() for card in decode_cards(ids_of(discards))],
+            expected_version=snapshot.state.version,
+        ),
+    )
+    return GameState.from_json(state_json)
+
+
+def test_handlers_run_against_the_local_backend(local_appsync):
+    http_client = get_http_client()
+    game_id, players = new_game(http_client)
+
+    # joins go through list_append on both the game table and the snapshot
+    assert get_game(game_id, get_dynamodb()).players == [p.id for p in players]
+    assert all(player.rank == -1 and not player.has_passed for player in players)
+
+    state = GameState.from_json(
+        post_mutation(START_GAME_MUTATION, http_client, variables=dict(game_id=game_id))
+    )
+    assert (state.last_played_idx, state.pot_size, state.version) == (-1, 0, 0)
+
+    for version in range(1, 11):
+        state = play_move(http_client, game_id)
+        assert state.version == version
+
+    # the response comes from the state table, see the top_of_pile note below
+    snapshot = load_game_snapshot(game_id, get_dynamodb())
+    assert snapshot.state.version == state.version
+    assert snapshot.state.active_player_id == state.active_player_id
+    assert sum(len(hand) for hand in snapshot.hands) + state.pot_size == 52
+
+    hand_json = post_mutation(
+        GAME_HAND_QUERY,
+        http_client,
+        variables=dict(game_id=game_id, id=players[0].hand_id),
+    )
+    assert hand_json["id"] == players[0].hand_id
+
+
+def test_failed_mirrors_do_not_fail_a_committed_move(local_appsync, caplog):
+    http_client = get_http_client()
+    game_id, _ = new_game(http_client)
+    post_mutation(START_GAME_MUTATION, http_client, variables=dict(game_id=game_id))
+
+    def fail(args):
+        raise RuntimeError("updateState is down")
+
+    local_appsync.resolvers["updateState"] = fail
+    assert play_move(http_client, game_id).version == 1
+    assert load_game_snapshot(game_id, get_dynamodb()).state.version == 1
+    assert "updateState failed" in caplog.text
+
+
+def test_moves_need_a_started_game(local_appsync):
+    http_client = get_http_client()
+    game_id, players = new_game(http_client)
+
+    variables = dict(game_id=game_id, player_id=players[0].id, cards=[], discards=[])
+    with pytest.raises(BadGraphQLRequest, match="Game has not started"):
+        post_mutation(PLAY_CARDS_MUTATION, http_client, variables=variables)
+
+
+def drop_snapshot(dynamodb, game_id):
+    """Leaves the game in the entity tables only, like before the snapshot table"""
+    from boto3.dynamodb.conditions import Key
+
+    table = dynamodb.Table(SNAPSHOT_TABLE)
+    items = table.query(KeyConditionExpression=Key("game_id").eq(game_id))["Items"]
+    for item in items:
+        table.delete_item(Key=dict(game_id=game_id, sk=item["sk"]))
+
+
+@pytest.mark.parametrize("late_join", [False, True])
+def test_lobby_games_from_before_the_snapshot_table_start_and_play(
+    local_appsync, late_join
+):
+    http_client = get_http_client()
+    dynamodb = get_dynamodb()
+    game_id, players = new_game(http_client, n_players=3 - late_join)
+    drop_snapshot(dynamodb, game_id)
+
+    if late_join:
+        # the join backfills the players who joined before it
+        post_mutation(
+            JOIN_GAME_MUTATION,
+            http_client,
+            variables=dict(game_id=game_id, player_name="late"),
+        )
+    post_mutation(START_GAME_MUTATION, http_client, variables=dict(game_id=game_id))
+
+    for version in range(1, 4):
+        assert play_move(http_client, game_id).version == version
+    snapshot = load_game_snapshot(game_id, dynamodb)
+    assert [p.id for p in snapshot.players][: len(players)] == [p.id for p in players]
+    assert len(snapshot.players) == 3
+
+
+def test_started_games_from_before_the_snapshot_table_keep_playing(local_appsync):
+    http_client = get_http_client()
+    dynamodb = get_dynamodb()
+    game_id, players = new_game(http_client)
+    post_mutation(START_GAME_MUTATION, http_client, variables=dict(game_id=game_id))
+    drop_snapshot(dynamodb, game_id)
+
+    # the first move backfills the partition, later moves load from it alone
+    for version in range(1, 6):
+        assert play_move(http_client, game_id).version == version
+
+    snapshot = load_game_snapshot(game_id, dynamodb)
+    assert [p.id for p in snapshot.players] == [p.id for p in players]
+    assert sum(len(hand) for hand in snapshot.hands) + snapshot.state.pot_size == 52
+
+
+def test_update_state_is_conditional_on_the_version(local_appsync):
+    http_client = get_http_client()
+    state = GameState.from_json(
+        post_mutation(
+            CREATE_STATE_MUTATION,
+            http_client,
+            variables=dict(game_id="GAME", active_player_id="p0", active_player_idx=0),
+        )
+    )
+    assert state.active_pattern.value == "None" and state.direction
+
+    mutation, variables = state_update(state)
+    variables["expected_version"] = 0
+    assert post_mutation(mutation, http_client, variables)["version"] == 1
+
+    # a second write from version 0 lost the race
+    with pytest.raises(ConflictError):
+        post_mutation(mutation, http_client, variables)
+
+    # isNullOrEmpty in update_state.vtl leaves an empty top_of_pile unwritten
+    stored = local_appsync.dynamodb.Table(STATE_TABLE).get_item(Key={"id": state.id})
+    assert stored["Item"]["top_of_pile"] == []
+    assert stored["Item"]["version"] == 1
+
+
+def test_expressions():
+    expression = Expression({"#version": "version"}, {":expected": 3, ":empty": []})
+
+    assert expression.check(
+        "attribute_not_exists(#version) OR #version = :expected", {}
+    )
+    assert expression.check("#version = :expected", {"version": 3})
+    assert not expression.check("#version <= :expected", {"version": 4})
+    assert expression.update(
+        "SET players = list_append(if_not_exists(players, :empty), :empty)", {}
+    ) == {"players": []}
@@ -0,0 +1,144 @@
+import pytest
+from daifugo.common import (get_dynamodb, get_http_client, load_game_snapshot,
+                            post_mutation)
+from daifugo.constants import TICKET_TTL
+from daifugo.matchmaking import MatchQueue
+from daifugo.model import GameState, MoveLog
+from daifugo.mutations import (ENQUEUE_MUTATION, PLAY_CARDS_MUTATION,
+                               TICKET_QUERY)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        self.now += 0.001
+        return self.now
+
+
+def enqueue(http_client, name, table_size=3, **preferences):
+    return post_mutation(
+        ENQUEUE_MUTATION,
+        http_client,
+        variables=dict(player_name=name, table_size=table_size, **preferences),
+    )
+
+
+def lookup(http_client, ticket_id):
+    return post_mutation(TICKET_QUERY, http_client, variables=dict(id=ticket_id))
+
+
+def test_enqueue_seats_a_started_game(local_appsync):
+    http_client = get_http_client()
+
+    waiting = [enqueue(http_client, f"player{i}") for i in range(2)]
+    assert all(ticket["game_id"] is None for ticket in waiting)
+
+    n_requests = local_appsync.n_requests
+    ticket = enqueue(http_client, "player2")
+    # one publishMatch per member is the only mutation of the match
+    assert local_appsync.n_requests == n_requests + 1 + 3
+
+    dynamodb = get_dynamodb()
+    snapshot = load_game_snapshot(ticket["game_id"], dynamodb)
+    # tickets enqueued in the same millisecond may be seated either way round
+    assert sorted(p.name for p in snapshot.players) == ["player0", "player1", "player2"]
+    assert snapshot.players[ticket["seat"]].id == ticket["player_id"]
+    assert sum(len(hand) for hand in snapshot.hands) == 52
+    assert not snapshot.game.joinable
+    assert snapshot.state.version == 0
+    checkpoint = dynamodb.Table("daifugo_api_snapshot_table").get_item(
+        Key=dict(
+            game_id=MoveLog.partition(ticket["game_id"]), sk=MoveLog.checkpoint_sk(0)
+        )
+    )
+    assert "Item" in checkpoint
+
+    # the queue is empty and the game plays like a started one
+    queue = MatchQueue(dynamodb)
+    assert queue.waiting(MatchQueue.partition(3, "standard", 0), 3) == []
+    state = snapshot.state
+    next_state = post_mutation(
+        PLAY_CARDS_MUTATION,
+        http_client,
+        variables=dict(
+            game_id=ticket["game_id"],
+            player_id=state.active_player_id,
+            cards=[],
+            discards=[],
+            expected_version=0,
+        ),
+    )
+    assert GameState.from_json(next_state).version == 1
+
+
+def test_clients_pick_ticket_ids_and_can_look_their_seats_up(local_appsync):
+    http_client = get_http_client()
+    published = []
+    publish_match = local_appsync.resolvers["publishMatch"]
+
+    def publish(args):
+        published.append(args["id"])
+        return publish_match(args)
+
+    local_appsync.resolvers["publishMatch"] = publish
+
+    # every client subscribed to matched under its id before enqueueing
+    ids = [f"ticket{i}" for i in range(3)]
+    for i, ticket_id in enumerate(ids[:2]):
+        ticket = enqueue(http_client, f"player{i}", id=ticket_id)
+        assert ticket["id"] == ticket_id and ticket["game_id"] is None
+    assert lookup(http_client, "ticket0")["game_id"] is None
+    seated = enqueue(http_client, "player2", id=ids[2])
+    assert sorted(published) == ids
+
+    # a client that missed the notification finds its seat
+    ticket = lookup(http_client, "ticket0")
+    assert ticket["game_id"] == seated["game_id"]
+    snapshot = load_game_snapshot(ticket["game_id"], get_dynamodb())
+    assert snapshot.players[ticket["seat"]].id == ticket["player_id"]
+    assert lookup(http_client, "none") is None
+
+    # a retried enqueue gets the seated ticket, not a second place in the queue
+    assert enqueue(http_client, "player0", id="ticket0") == ticket
+    queue = MatchQueue(get_dynamodb())
+    assert queue.waiting(MatchQueue.partition(3, "standard", 0), 3) == []
+    with pytest.raises(ValueError):
+        enqueue(http_client, "player3", id="ticket0")
+
+
+def test_queues_are_split_by_preferences(local_appsync):
+    http_client = get_http_client()
+
+    assert enqueue(http_client, "a", table_size=2, skill_band=1)["game_id"] is None
+    assert enqueue(http_client, "b", table_size=2, skill_band=2)["game_id"] is None
+    assert enqueue(http_client, "c", table_size=3, skill_band=1)["game_id"] is None
+    with pytest.raises(ValueError):
+        enqueue(http_client, "d", table_size=2, variant="tournament")
+
+    ticket = enqueue(http_client, "e", table_size=2, skill_band=2)
+    players = load_game_snapshot(ticket["game_id"], get_dynamodb()).players
+    assert sorted(player.name for player in players) == ["b", "e"]
+
+
+def test_claimed_and_expired_tickets_are_not_seated_twice(local_appsync, monkeypatch):
+    clock = Clock()
+    queue = MatchQueue(get_dynamodb(), clock=clock)
+    tickets = [queue.enqueue(f"player{i}", 2) for i in range(2)]
+
+    assert queue.claim(tickets)
+    assert not queue.claim(tickets)
+
+    # a table that fails to be written goes back to the queue
+    def fail(*args):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr("daifugo.matchmaking.allocate_game_id", fail)
+    queue.requeue(tickets)
+    with pytest.raises(RuntimeError):
+        queue.match(tickets[0].queue, 2)
+    assert queue.waiting(tickets[0].queue, 2) == tickets
+
+    clock.now += TICKET_TTL + 1
+    assert queue.waiting(tickets[0].queue, 2) == []
@@ -0,0 +1,59 @@
+import gc
+import os
+import random
+import tracemalloc
+
+from daifugo.model import CARDS, Card, Hand
+from daifugo.simulate import new_game
+
+N_TABLES = 500
+TABLE_BUDGET_BYTES = int(os.environ.get("TABLE_BUDGET_BYTES", 3500))
+PARSED_HANDS_BUDGET_BYTES = int(os.environ.get("PARSED_HANDS_BUDGET_BYTES", 2500))
+
+
+def traced_bytes(build):
+    """Bytes still held by whatever ``build`` returns, run with ``-s`` to print"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        held = build()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    return held, after - before
+
+
+def test_memory_per_table():
+    rng = random.Random(0)
+
+    _, used = traced_bytes(lambda: [new_game(6, rng) for _ in range(N_TABLES)])
+
+    print(f"{used / N_TABLES:.0f} bytes per 6 player table")
+    assert used / N_TABLES < TABLE_BUDGET_BYTES
+
+
+def test_memory_per_parsed_table():
+    rng = random.Random(0)
+    items = [
+        [hand.to_item("json") for hand in new_game(6, rng)[2]] for _ in range(N_TABLES)
+    ]
+
+    def parse():
+        hands = [[Hand.from_json(item) for item in table] for table in items]
+        return [hand.cards for table in hands for hand in table]
+
+    cards, used = traced_bytes(parse)
+
+    print(f"{used / N_TABLES:.0f} bytes per parsed 6 player table")
+    assert used / N_TABLES < PARSED_HANDS_BUDGET_BYTES
+    assert all(card is CARDS[card.to_int()] for hand in cards for card in hand)
+
+
+def test_cards_are_interned():
+    card = Card("Queen", "Spade")
+
+    assert Card.from_json(card.to_json()) is Card.from_int(card.to_int())
+    assert Card.from_json('{"suit": "Spade", "rank": "Queen"}') is card.intern()
+    assert Card.from_int(52) is Card.from_int(53)
@@ -0,0 +1,76 @@
+import pytest
+from daifugo.cards import N_CARDS, PACKED_CARD_CHARS
+from daifugo.constants import UP
+from daifugo.model import (Card, Game, GameSnapshot, GameState, Hand,
+                           MoveEvent, MoveLog, Pattern, Player, pack_cards,
+                           unpack_cards)
+
+
+def test_snapshot_items_round_trip():
+    game = Game("ABCD", "state", False, ["p1", "p0"])
+    players = [
+        Player(f"p{i}", f"player{i}", "ABCD", f"h{i}", False, -1) for i in range(2)
+    ]
+    hands = [Hand("h0", [Card("3", "Diamond")]), Hand("h1", [Card("2", "Spade")])]
+    state = GameState(
+        "state", "ABCD", 1, "p0", 0, [Card("9", "Club")], 3, Pattern.RUN, False, UP
+    )
+
+    items = GameSnapshot.to_items("ABCD", [state, *hands, *players, game])
+    snapshot = GameSnapshot.from_items(items)
+
+    assert {item["game_id"] for item in items} == {"ABCD"}
+    assert snapshot.game == game
+    assert [player.id for player in snapshot.players] == ["p1", "p0"]
+    assert [hand.id for hand in snapshot.hands] == ["h1", "h0"]
+    assert snapshot.state == state
+
+
+def test_move_log_items_round_trip():
+    game = Game("ABCD", "state", False, ["p0", "p1"])
+    players = [
+        Player(f"p{i}", f"player{i}", "ABCD", f"h{i}", False, -1) for i in range(2)
+    ]
+    hands = [Hand("h0", [Card("3", "Diamond")]), Hand("h1", [Card("2", "Spade")])]
+    state = GameState(
+        "state", "ABCD", 1, "p1", 0, [Card("9", "Club")], 3, Pattern.RUN, False, UP, 12
+    )
+    event = MoveEvent(12, "p0", [Card("9", "Club")], [])
+
+    item = MoveLog.move_item("ABCD", event)
+    checkpoint = MoveLog.checkpoint_item(
+        "ABCD", GameSnapshot(game, players, hands, state)
+    )
+
+    assert item["game_id"] == checkpoint["game_id"] == "ABCD#LOG"
+    assert item["sk"] < MoveLog.move_sk(100)
+    assert MoveEvent.from_json(item) == event
+    assert MoveLog.from_checkpoint_item(checkpoint) == GameSnapshot(
+        game, players, hands, state
+    )
+
+
+@pytest.mark.parametrize("card_format", ["json", "packed", "both"])
+def test_card_formats_round_trip(card_format):
+    hand = Hand("h0", [Card("3", "Diamond"), Card("2", "Spade"), Card(is_joker=True)])
+    state = GameState(
+        "state", "ABCD", 1, "p0", 0, [Card("9", "Club")], 3, Pattern.RUN, False, UP
+    )
+    event = MoveEvent(4, "p0", [Card("7", "Heart")], [Card("King", "Club")])
+
+    hand_item = hand.to_item(card_format)
+    state_item = state.to_item(card_format)
+
+    assert ("cards" in hand_item) == (card_format != "packed")
+    assert ("packed_cards" in hand_item) == (card_format != "json")
+    assert Hand.from_json(hand_item) == hand
+    assert GameState.from_json(state_item) == state
+    assert MoveEvent.from_json(event.to_item(card_format)) == event
+
+
+def test_packed_cards():
+    cards = [Card("3", "Heart"), Card("2", "Club"), Card(is_joker=True)]
+
+    assert pack_cards(cards) == "0PQ"
+    assert unpack_cards(pack_cards(cards)) == cards
+    assert len(PACKED_CARD_CHARS) >= N_CARDS
@@ -0,0 +1,33 @@
+import os
+
+import pytest
+from daifugo import mutations
+from daifugo.mutations import Mutation
+from graphql import build_schema, parse, validate
+
+SCHEMA_PATH = os.path.join(
+    os.path.dirname(__file__), os.pardir, os.pardir, "schema.graphql"
+)
+
+# AppSync defines its directives on top of the schema file
+APPSYNC_DEFINITIONS = """
+directive @aws_subscribe(mutations: [String]) on FIELD_DEFINITION
+"""
+
+DOCUMENTS = {
+    name: value.value if isinstance(value, Mutation) else value
+    for name, value in vars(mutations).items()
+    if name.isupper() and isinstance(value, (Mutation, str))
+}
+
+
+@pytest.fixture(scope="module")
+def schema():
+    with open(SCHEMA_PATH) as f:
+        return build_schema(APPSYNC_DEFINITIONS + f.read())
+
+
+@pytest.mark.parametrize("name", sorted(DOCUMENTS))
+def test_documents_match_the_schema(schema, name):
+    errors = validate(schema, parse(DOCUMENTS[name]))
+    assert not errors, [error.message for error in errors]
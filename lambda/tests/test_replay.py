@@ -0,0 +1,56 @@
+import copy
+import random
+
+import pytest
+from daifugo.cards import ids_of
+from daifugo.daifugo import legal_move_masks, play_cards
+from daifugo.model import CardSet, Game, GameSnapshot, MoveEvent, decode_cards
+from daifugo.replay import ReplayError, replay
+from daifugo.simulate import new_game
+
+
+def play_random_game(seed, n_moves):
+    rng = random.Random(seed)
+    state, players, hands = new_game(4, rng)
+    snapshot = GameSnapshot(Game("SIM", "state", False, []), players, hands, state)
+    checkpoint = copy.deepcopy(snapshot)
+
+    events = []
+    for _ in range(n_moves):
+        idx = state.active_player_idx
+        if players[idx].is_out or sum(not player.is_out for player in players) < 2:
+            break
+
+        moves = legal_move_masks(hands[idx].mask, state) + [(0, 0)]
+        cards, discards = rng.choice(moves)
+        cards, discards = CardSet(mask=cards), decode_cards(ids_of(discards))
+
+        state, _, _ = play_cards(state, cards, discards, players, hands)
+        events.append(MoveEvent(state.version, players[idx].id, cards.cards, discards))
+
+    return checkpoint, events, GameSnapshot(snapshot.game, players, hands, state)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_replay_rebuilds_the_game(seed):
+    checkpoint, events, final = play_random_game(seed, 40)
+
+    assert replay(checkpoint, events) == final
+
+
+def test_replay_from_a_later_checkpoint():
+    checkpoint, events, final = play_random_game(0, 40)
+    middle = replay(copy.deepcopy(checkpoint), events[:20])
+
+    assert replay(middle, events[20:]) == final
+
+
+def test_replay_rejects_gaps_and_wrong_players():
+    checkpoint, events, _ = play_random_game(0, 10)
+
+    with pytest.raises(ReplayError):
+        replay(copy.deepcopy(checkpoint), events[1:])
+
+    events[0].player_id = "nobody"
+    with pytest.raises(ReplayError):
+        replay(copy.deepcopy(checkpoint), events)
@@ -0,0 +1,271 @@
+import asyncio
+import json
+from dataclasses import replace
+
+from daifugo.bot import seen_mask
+from daifugo.cards import ids_of
+from daifugo.common import get_dynamodb, get_http_client, post_mutation
+from daifugo.constants import GAME_TABLE
+from daifugo.daifugo import legal_move_masks
+from daifugo.model import CardSet, GameState, Hand, Player, decode_cards
+from daifugo.mutations import (CREATE_GAME_MUTATION, GAME_HAND_QUERY,
+                               GAME_STATE_QUERY, JOIN_GAME_MUTATION,
+                               PLAY_CARDS_MUTATION, START_GAME_MUTATION)
+from daifugo.server import DynamoDBStore, GameServer, MemoryStore
+
+
+async def request(server, mutation, **variables):
+    response = await server.execute(dict(query=mutation.value, variables=variables))
+    if "errors" in response:
+        return None, response["errors"][0]
+
+    return response["data"][mutation.name], None
+
+
+async def start_game(server, n_players=3):
+    game, _ = await request(server, CREATE_GAME_MUTATION)
+    players = []
+    for i in range(n_players):
+        player, _ = await request(
+            server, JOIN_GAME_MUTATION, game_id=game["id"], player_name=f"player{i}"
+        )
+        players.append(Player.from_json(player))
+
+    state, _ = await request(server, START_GAME_MUTATION, game_id=game["id"])
+    return game["id"], players, GameState.from_json(state)
+
+
+async def play_move(server, game_id, players, state):
+    player = players[state.active_player_idx]
+    hand, _ = await request(server, GAME_HAND_QUERY, game_id=game_id, id=player.hand_id)
+
+    moves = legal_move_masks(Hand.from_json(hand).mask, state)
+    cards, discards = moves[0] if moves else (0, 0)
+    state_json, error = await request(
+        server,
+        PLAY_CARDS_MUTATION,
+        game_id=game_id,
+        player_id=player.id,
+        cards=[card.to_json() for card in CardSet(mask=cards).cards],
+        discards=[card.to_json() for card in decode_cards(ids_of(discards))],
+        expected_version=state.version,
+    )
+    assert error is None
+
+    return GameState.from_json(state_json)
+
+
+def test_game_is_played_through_the_server():
+    async def run():
+        store = MemoryStore()
+        server = GameServer(store, flush_interval=60)
+        game_id, players, state = await start_game(server)
+
+        assert [player.game_id for player in players] == [game_id] * 3
+        for _ in range(10):
+            state = await play_move(server, game_id, players, state)
+        assert state.version == 10
+
+        # nothing is written until the flush, then one save covers every move
+        assert store.n_saves == 0
+        await server.close()
+        assert store.n_saves == 1
+
+        stored = await store.load(game_id)
+        assert stored.state == state
+        assert sorted(store.log_items[game_id])[-1] == "MOVE#0000000010"
+
+        # a new server picks the game up from the store
+        server = GameServer(store, flush_interval=60)
+        stored_state, _ = await request(server, GAME_STATE_QUERY, game_id=game_id)
+        assert GameState.from_json(stored_state) == state
+        await server.close()
+
+    asyncio.run(run())
+
+
+def test_stale_and_invalid_moves_are_rejected():
+    async def run():
+        server = GameServer(MemoryStore(), flush_interval=60)
+        game_id, players, state = await start_game(server)
+        next_state = await play_move(server, game_id, players, state)
+
+        _, error = await request(
+            server,
+            PLAY_CARDS_MUTATION,
+            game_id=game_id,
+            player_id=players[next_state.active_player_idx].id,
+            cards=[],
+            discards=[],
+            expected_version=state.version,
+        )
+        assert error["errorType"] == "ConflictError"
+
+        _, error = await request(
+            server,
+            PLAY_CARDS_MUTATION,
+            game_id=game_id,
+            player_id=players[state.active_player_idx].id,
+            cards=[],
+            discards=[],
+            expected_version=next_state.version,
+        )
+        assert error["errorType"] == "InvalidPlayError"
+
+        _, error = await request(server, START_GAME_MUTATION, game_id="NOPE")
+        assert error["errorType"] == "GameNotFound"
+        await server.close()
+
+    asyncio.run(run())
+
+
+def test_finished_and_idle_tables_are_flushed_and_dropped():
+    async def run():
+        now = [0.0]
+        store = MemoryStore()
+        server = GameServer(
+            store, flush_interval=60, idle_timeout=10, clock=lambda: now[0]
+        )
+        idle_id, players, state = await start_game(server)
+        state = await play_move(server, idle_id, players, state)
+        finished_id, _, _ = await start_game(server)
+        active_id, _, _ = await start_game(server)
+
+        # every player of one game but the last is out
+        actor = server.tables[finished_id]
+        actor.snapshot.players[:-1] = [
+            replace(player, rank=rank)
+            for rank, player in enumerate(actor.snapshot.players[:-1])
+        ]
+        now[0] = 5
+        await request(server, GAME_STATE_QUERY, game_id=active_id)
+        assert await server.evict_idle() == 1
+        assert set(server.tables) == {idle_id, active_id}
+        assert actor.task.done()
+
+        now[0] = 12
+        assert await server.evict_idle() == 1
+        assert set(server.tables) == {active_id}
+
+        # the move was stored before the table went, the next request loads it
+        assert (await store.load(idle_id)).state == state
+        stored_state, _ = await request(server, GAME_STATE_QUERY, game_id=idle_id)
+        assert GameState.from_json(stored_state) == state
+        assert idle_id in server.tables
+        await server.close()
+
+    asyncio.run(run())
+
+
+def test_suggestions_know_the_played_cards(mocker):
+    async def run():
+        store = MemoryStore()
+        server = GameServer(store, flush_interval=60)
+        game_id, players, state = await start_game(server)
+        for _ in range(6):
+            state = await play_move(server, game_id, players, state)
+
+        # the moves are not stored yet, the table keeps its own mask
+        search = mocker.patch("daifugo.server.suggest_move")
+        search.return_value.to_json.return_value = {}
+        player_id = players[state.active_player_idx].id
+        await server.suggest_move(game_id, player_id)
+
+        await server.tables[game_id].flush()
+        seen = seen_mask(await store.move_events(game_id, state.version))
+        assert seen
+        assert search.call_args.args[4] == seen
+
+        # a table loaded again reads the cards back from the move log
+        await server.evict(game_id)
+        await server.suggest_move(game_id, player_id)
+        assert search.call_args.args[4] == seen
+        await server.close()
+
+    asyncio.run(run())
+
+
+def test_concurrent_moves_on_a_table_are_serialized():
+    async def run():
+        server = GameServer(MemoryStore(), flush_interval=60)
+        game_id, players, state = await start_game(server)
+
+        # every seat tries to pass at the same version, exactly one can win
+        results = await asyncio.gather(
+            *[
+                request(
+                    server,
+                    PLAY_CARDS_MUTATION,
+                    game_id=game_id,
+                    player_id=player.id,
+                    cards=[],
+                    discards=[],
+                    expected_version=state.version,
+                )
+                for player in players
+            ]
+        )
+        assert sum(error is None for _, error in results) == 1
+        await server.close()
+
+    asyncio.run(run())
+
+
+def test_http_round_trip():
+    async def run():
+        server = GameServer(MemoryStore(), flush_interval=60)
+        host, port = await server.start("127.0.0.1", 0)
+
+        reader, writer = await asyncio.open_connection(host, port)
+        # two requests on one keep-alive connection
+        for _ in range(2):
+            body = json.dumps(dict(query=CREATE_GAME_MUTATION.value)).encode()
+            writer.write(
+                b"POST /graphql HTTP/1.1\r\n"
+                b"Content-Type: application/json\r\n"
+                b"Content-Length: %d\r\n\r\n" % len(body) + body
+            )
+            await writer.drain()
+
+            assert (await reader.readline()).startswith(b"HTTP/1.1 200")
+            headers = {}
+            while (line := await reader.readline()) != b"\r\n":
+                key, _, value = line.decode().partition(":")
+                headers[key.lower()] = value.strip()
+
+            response = json.loads(
+                await reader.readexactly(int(headers["content-length"]))
+            )
+            assert response["data"]["createGame"]["joinable"]
+
+        writer.close()
+        await server.close()
+
+    asyncio.run(run())
+
+
+def test_servers_and_lambdas_share_the_game_code_counter(local_appsync):
+    async def run():
+        store = DynamoDBStore(get_dynamodb())
+        servers = [GameServer(store, flush_interval=60) for _ in range(2)]
+        games = await asyncio.gather(
+            *[server.create_game() for server in servers for _ in range(5)]
+        )
+        codes = [game["id"] for game in games]
+        codes.append(post_mutation(CREATE_GAME_MUTATION, get_http_client())["id"])
+
+        # a restarted server carries on from the counter
+        restarted = GameServer(store, flush_interval=60)
+        codes.append((await restarted.create_game())["id"])
+
+        for server in [*servers, restarted]:
+            await server.close()
+        return codes
+
+    codes = asyncio.run(run())
+    assert len(set(codes)) == len(codes) == 12
+
+    table = get_dynamodb().Table(GAME_TABLE)
+    assert all("Item" in table.get_item(Key={"id": code}) for code in codes)
+    counter = table.get_item(Key={"id": "#GAME_ID_COUNTER"})["Item"]
+    assert counter["value"] == 12
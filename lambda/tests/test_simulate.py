@@ -0,0 +1,24 @@
+import pytest
+from daifugo.simulate import POLICIES, run_game, simulate
+
+
+@pytest.mark.parametrize("policy", list(POLICIES))
+def test_run_game_finishes(policy):
+    result = run_game(seed=7, n_players=4, policies=[policy])
+
+    assert not result.truncated
+    assert sorted(result.ranks) == [0, 1, 2, 3]
+
+
+def test_simulate_is_independent_of_workers():
+    *_, serial = simulate(40, n_players=3, seed=3, workers=1, chunk_size=10)
+    *_, parallel = simulate(40, n_players=3, seed=3, workers=2, chunk_size=10)
+
+    assert serial.n_games == parallel.n_games == 40
+    assert serial.n_moves == parallel.n_moves
+    assert serial.seat_ranks == parallel.seat_ranks
+
+
+def test_simulate_rejects_unknown_policy():
+    with pytest.raises(ValueError):
+        next(simulate(1, policies=["nope"]))
@@ -0,0 +1,224 @@
+import io
+import time
+
+import pytest
+from boto3.dynamodb.conditions import Key
+from daifugo.common import get_dynamodb, get_http_client, post_mutation
+from daifugo.constants import (GAME_SK, GAME_TABLE, LAST_ACTIVE,
+                               PLAYER_SK_PREFIX, SNAPSHOT_TABLE, STATE_SK)
+from daifugo.model import GameState
+from daifugo.mutations import (CREATE_GAME_MUTATION, JOIN_GAME_MUTATION,
+                               PLAY_CARDS_MUTATION, START_GAME_MUTATION)
+from daifugo.sweeper import (ArchiveRequired, ArchiveStore, RateLimiter,
+                             S3ArchiveStore, Sweeper)
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+def start_game(http_client, n_players=3) -> GameState:
+    game_id = post_mutation(CREATE_GAME_MUTATION, http_client)["id"]
+    for i in range(n_players):
+        post_mutation(
+            JOIN_GAME_MUTATION,
+            http_client,
+            variables=dict(game_id=game_id, player_name=f"player{i}"),
+        )
+    return GameState.from_json(
+        post_mutation(START_GAME_MUTATION, http_client, variables=dict(game_id=game_id))
+    )
+
+
+def finish(dynamodb, game_id):
+    """Ranks every player but the last, like play_cards leaves a finished game"""
+    table = dynamodb.Table(SNAPSHOT_TABLE)
+    items = table.query(KeyConditionExpression=Key("game_id").eq(game_id))["Items"]
+    players = [item for item in items if item["sk"].startswith(PLAYER_SK_PREFIX)]
+    for rank, item in enumerate(players[:-1]):
+        table.put_item(Item=dict(item, rank=rank))
+
+
+def sweeper(dynamodb, tmp_path, offset=0.0, **kwargs):
+    kwargs.setdefault("archive", ArchiveStore(str(tmp_path)))
+    return Sweeper(
+        dynamodb,
+        finished_after=HOUR,
+        idle_after=7 * DAY,
+        read_limiter=RateLimiter(1e9),
+        write_limiter=RateLimiter(1e9),
+        clock=lambda: time.time() + offset,
+        **kwargs,
+    )
+
+
+def test_finished_games_are_archived_and_deleted(local_appsync, tmp_path):
+    http_client = get_http_client()
+    dynamodb = get_dynamodb()
+    finished = start_game(http_client)
+    playing = start_game(http_client)
+    finish(dynamodb, finished.game_id)
+
+    # a finished game is kept for an hour
+    result = sweeper(dynamodb, tmp_path, offset=HOUR / 2).run()
+    assert result.games == 2 and result.swept == {}
+
+    result = sweeper(dynamodb, tmp_path, offset=2 * HOUR).run()
+    assert result.swept == {"finished": 1}
+    assert result.cursor is None
+
+    gone = sweeper(dynamodb, tmp_path).load(finished.game_id)
+    assert all(items == [] for items in gone.tables.values())
+    kept = sweeper(dynamodb, tmp_path).load(playing.game_id)
+    assert len(kept.snapshot_items) == 8
+
+    record = ArchiveStore(str(tmp_path)).find(finished.game_id)
+    assert record["reason"] == "finished"
+    assert result.deleted_items == sum(len(v) for v in record["tables"].values())
+    assert {item["sk"] for item in record["tables"][SNAPSHOT_TABLE]} >= {
+        GAME_SK,
+        STATE_SK,
+    }
+
+
+def test_idle_games_are_swept_and_active_ones_kept(local_appsync, tmp_path):
+    http_client = get_http_client()
+    dynamodb = get_dynamodb()
+    idle = start_game(http_client)
+    active = start_game(http_client)
+
+    # a week without moves, the stamps of every snapshot item are old
+    table = dynamodb.Table(SNAPSHOT_TABLE)
+    items = table.query(KeyConditionExpression=Key("game_id").eq(idle.game_id))
+    for item in items["Items"]:
+        table.put_item(Item=dict(item, **{LAST_ACTIVE: int(time.time()) - 8 * DAY}))
+    # the other game is played a move, it stays active
+    post_mutation(
+        PLAY_CARDS_MUTATION,
+        http_client,
+        variables=dict(
+            game_id=active.game_id,
+            player_id=active.active_player_id,
+            cards=[],
+            discards=[],
+            expected_version=0,
+        ),
+    )
+
+    result = sweeper(dynamodb, tmp_path).run()
+    assert result.swept == {"idle": 1}
+    assert ArchiveStore(str(tmp_path)).find(idle.game_id)["reason"] == "idle"
+    assert ArchiveStore(str(tmp_path)).find(active.game_id) is None
+
+
+def test_unstamped_games_get_a_full_idle_period(local_appsync, tmp_path):
+    dynamodb = get_dynamodb()
+    table = dynamodb.Table(SNAPSHOT_TABLE)
+    table.put_item(Item=dict(game_id="OLD", sk=GAME_SK, players=[], joinable=True))
+
+    result = sweeper(dynamodb, tmp_path, offset=30 * DAY).run()
+    assert result.swept == {}
+    item = table.get_item(Key=dict(game_id="OLD", sk=GAME_SK))["Item"]
+    assert item[LAST_ACTIVE] >= time.time() + 30 * DAY - 1
+
+
+def test_a_game_written_after_loading_is_kept(local_appsync, tmp_path):
+    dynamodb = get_dynamodb()
+    state = start_game(get_http_client())
+    finish(dynamodb, state.game_id)
+
+    sweep = sweeper(dynamodb, tmp_path, offset=2 * HOUR)
+    game = sweep.load(state.game_id)
+    table = dynamodb.Table(SNAPSHOT_TABLE)
+    item = table.get_item(Key=dict(game_id=state.game_id, sk=STATE_SK))["Item"]
+    table.put_item(Item=dict(item, **{LAST_ACTIVE: item[LAST_ACTIVE] + 1}))
+
+    assert sweep.delete(game) == 0
+    assert len(sweep.load(state.game_id).snapshot_items) == 8
+    assert dynamodb.Table(GAME_TABLE).get_item(Key={"id": state.game_id})["Item"]
+
+
+def test_sweeps_resume_from_the_saved_cursor(local_appsync, tmp_path, monkeypatch):
+    monkeypatch.setattr("daifugo.sweeper.SWEEP_SCAN_PAGE", 3)
+    dynamodb = get_dynamodb()
+    http_client = get_http_client()
+    game_ids = {start_game(http_client).game_id for _ in range(3)}
+    for game_id in game_ids:
+        finish(dynamodb, game_id)
+
+    sweep = sweeper(dynamodb, tmp_path, offset=2 * HOUR)
+    runs = 0
+    while 1:
+        result = sweep.run(sweep.load_cursor(), max_games=1)
+        sweep.save_cursor(result.cursor)
+        runs += 1
+        if result.cursor is None:
+            break
+        assert result.games == 1
+
+    assert runs >= 3
+    assert sweep.load_cursor() is None
+    assert all(ArchiveStore(str(tmp_path)).find(game_id) for game_id in game_ids)
+    assert all(not sweep.load(game_id).snapshot_items for game_id in game_ids)
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Bucket, Key] = Body
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.objects[Bucket, Key])}
+
+    def list_objects_v2(self, Bucket, Prefix, **kwargs):
+        keys = sorted(
+            k for b, k in self.objects if b == Bucket and k.startswith(Prefix)
+        )
+        return {"Contents": [{"Key": key} for key in keys], "IsTruncated": False}
+
+
+def test_games_are_only_deleted_with_a_durable_archive(
+    local_appsync, tmp_path, monkeypatch
+):
+    dynamodb = get_dynamodb()
+    state = start_game(get_http_client())
+    finish(dynamodb, state.game_id)
+
+    # the /tmp of a Lambda goes with its execution environment
+    monkeypatch.setenv("AWS_LAMBDA_FUNCTION_NAME", "sweep")
+    lambda_tmp = sweeper(dynamodb, tmp_path, offset=2 * HOUR)
+    assert not lambda_tmp.archive.durable
+    with pytest.raises(ArchiveRequired):
+        lambda_tmp.run()
+    with pytest.raises(ArchiveRequired):
+        sweeper(dynamodb, tmp_path, offset=2 * HOUR, archive=None).run()
+    assert len(lambda_tmp.load(state.game_id).snapshot_items) == 8
+
+    s3 = FakeS3()
+    archive = S3ArchiveStore("bucket", "sweep/", s3=s3)
+    sweep = sweeper(dynamodb, tmp_path, offset=2 * HOUR, archive=archive)
+    assert sweep.run().swept == {"finished": 1}
+    assert not sweep.load(state.game_id).snapshot_items
+
+    record = sweep.archive.find(state.game_id)
+    assert record["reason"] == "finished"
+    assert [r["game_id"] for r in sweep.archive.records()] == [state.game_id]
+    assert sweep.archive.find("NONE") is None
+
+
+def test_rate_limiter_paces_units():
+    now = [0.0]
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        now[0] += seconds
+
+    limiter = RateLimiter(0.5, clock=lambda: now[0], sleep=sleep)
+    limiter.acquire(1)
+    limiter.acquire(2)
+    limiter.acquire(1)
+
+    assert slept == [2.0, 4.0]
+    assert now[0] == 6.0
@@ -0,0 +1,69 @@
+import json
+
+from daifugo.common import get_http_client, post_mutation
+from daifugo.mutations import (CREATE_GAME_MUTATION, JOIN_GAME_MUTATION,
+                               PLAY_CARDS_MUTATION, START_GAME_MUTATION)
+from daifugo.tracing import Trace, span
+
+
+def emf_lines(output):
+    return [json.loads(line) for line in output.splitlines() if '"_aws"' in line]
+
+
+def test_span_is_a_no_op_without_a_trace():
+    with span("anything"):
+        pass
+
+    trace = Trace("test")
+    with trace.span("get_items"):
+        pass
+    trace.add_capacity("read", [{"CapacityUnits": 1.5}, {"CapacityUnits": 0.5}])
+
+    emf = trace.to_emf()
+    assert emf["get_items_calls"] == 1
+    assert emf["consumed_read_capacity"] == 2.0
+    assert emf["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [["handler"]]
+
+
+def test_handlers_emit_one_metrics_line_per_call(local_appsync, capsys):
+    http_client = get_http_client()
+    game = post_mutation(CREATE_GAME_MUTATION, http_client)
+    for name in ["Daryl", "Will"]:
+        post_mutation(
+            JOIN_GAME_MUTATION,
+            http_client,
+            variables=dict(game_id=game["id"], player_name=name),
+        )
+    state = post_mutation(START_GAME_MUTATION, http_client, dict(game_id=game["id"]))
+    post_mutation(
+        PLAY_CARDS_MUTATION,
+        http_client,
+        variables=dict(
+            game_id=game["id"],
+            player_id=state["active_player_id"],
+            cards=[],
+            discards=[],
+        ),
+    )
+
+    lines = emf_lines(capsys.readouterr().out)
+    assert [line["handler"] for line in lines] == [
+        "create_game",
+        "join_game",
+        "join_game",
+        "start_game",
+        "play_cards",
+    ]
+
+    play = lines[-1]
+    assert play["game_id"] == game["id"]
+    assert play["players"] == "2"
+    assert play["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [
+        ["handler", "players"]
+    ]
+    for name in ["handler", "get_snapshot", "play_cards", "commit_move"]:
+        assert play[f"{name}_calls"] >= 1
+    assert play["post_mutation_calls"] >= 1
+    assert play["play_cards.resolve_calls"] == 1
+    assert play["consumed_read_capacity"] > 0
+    assert play["consumed_write_capacity"] > 0
@@ -0,0 +1,22 @@
+# archives of the games the sweep lambda deletes, see lambda/daifugo/sweeper.py
+resource "aws_s3_bucket" "archive_bucket" {
+  bucket_prefix = "${replace(var.prefix, "_", "-")}-archive-"
+  lifecycle {
+    prevent_destroy = true
+  }
+}
+
+resource "aws_s3_bucket_versioning" "archive_bucket_versioning" {
+  bucket = aws_s3_bucket.archive_bucket.id
+  versioning_configuration {
+    status = "Enabled"
+  }
+}
+
+resource "aws_s3_bucket_public_access_block" "archive_bucket_public_access" {
+  bucket                  = aws_s3_bucket.archive_bucket.id
+  block_public_acls       = true
+  block_public_policy     = true
+  ignore_public_acls      = true
+  restrict_public_buckets = true
+}